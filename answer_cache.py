@@ -0,0 +1,204 @@
+"""
+语义回答缓存 - 相同或相近的问题直接返回缓存的回答，跳过检索和LLM生成
+先按规范化后的问题精确匹配，再按问题向量做最近邻匹配（只匹配字数/长度要求相同的问题）
+重新入库(ingest.py)后通过语料版本戳自动失效
+"""
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+
+CORPUS_VERSION_FILE = "corpus_version"
+
+_PUNCT_RE = re.compile(r"[\s，。！？、；：,.!?;:\"'“”‘’（）()]+")
+
+# 问题里的字数/长度要求，如"200字"、"三百字以内"、"简短回答"
+_LENGTH_RE = re.compile(r"([0-9零一二两三四五六七八九十百千万]+)\s*(?:个)?(?:字|词)")
+_LENGTH_WORDS = ("一句话", "简短", "简要", "简单", "详细", "具体")
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题：去掉空白和标点，统一小写"""
+    return _PUNCT_RE.sub("", question).lower()
+
+
+def extract_length_constraint(question: str) -> str:
+    """提取问题中的字数/长度要求；语义相近但长度要求不同的问题不能共用回答"""
+    parts = [m.group(1) + "字" for m in _LENGTH_RE.finditer(question)]
+    parts += [word for word in _LENGTH_WORDS if word in question]
+    return "|".join(parts)
+
+
+def write_corpus_version(store_dir: str) -> str:
+    """写入新的语料版本戳（每次入库后调用）"""
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    Path(store_dir, CORPUS_VERSION_FILE).write_text(version, encoding="utf-8")
+    return version
+
+
+def read_corpus_version(store_dir: str) -> str:
+    """读取语料版本戳，不存在时返回空字符串"""
+    try:
+        return Path(store_dir, CORPUS_VERSION_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return ""
+
+
+class CorpusVersionWatcher:
+    """跟踪语料版本戳：只在版本文件修改时间变化时才重新读取，版本变化后 changed() 返回一次True"""
+
+    def __init__(self, store_dir: Optional[str]):
+        self.store_dir = store_dir
+        self.version = read_corpus_version(store_dir) if store_dir else ""
+        self._mtime = self._stamp_mtime()
+        self._lock = threading.Lock()
+
+    def _stamp_mtime(self) -> float:
+        if not self.store_dir:
+            return 0.0
+        try:
+            return os.stat(os.path.join(self.store_dir, CORPUS_VERSION_FILE)).st_mtime
+        except OSError:
+            return 0.0
+
+    def changed(self) -> bool:
+        mtime = self._stamp_mtime()
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            version = read_corpus_version(self.store_dir)
+            if version == self.version:
+                return False
+            self.version = version
+            return True
+
+
+class _CacheEntry:
+    __slots__ = ("result", "vector", "length", "created_at")
+
+    def __init__(self, result: Dict, vector: Optional[np.ndarray], length: str = ""):
+        self.result = result
+        self.vector = vector
+        self.length = length
+        self.created_at = time.time()
+
+
+class AnswerCache:
+    """带LRU/TTL淘汰的语义回答缓存"""
+
+    def __init__(
+        self,
+        embeddings=None,
+        store_dir: Optional[str] = None,
+        max_size: int = 256,
+        ttl: float = 3600,
+        similarity_threshold: float = 0.92,
+    ):
+        self.embeddings = embeddings
+        self.store_dir = store_dir
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._watcher = CorpusVersionWatcher(store_dir)
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _check_version(self) -> None:
+        """语料版本变化时清空缓存"""
+        old_version = self._watcher.version
+        if self._watcher.changed():
+            logging.info("Corpus version changed (%s -> %s), clearing answer cache", old_version, self._watcher.version)
+            self._entries.clear()
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        if self.embeddings is None:
+            return None
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _expired(self, entry: _CacheEntry, now: float) -> bool:
+        return self.ttl is not None and self.ttl > 0 and now - entry.created_at > self.ttl
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if self._expired(entry, now)]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, question: str) -> Optional[Dict]:
+        """查询缓存，命中时返回回答字典（含 answer / sources），否则返回 None"""
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self._evict_expired(now)
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.result
+
+            length = extract_length_constraint(question)
+            candidates = [(k, e) for k, e in self._entries.items() if e.vector is not None and e.length == length]
+
+        if candidates and self.embeddings is not None:
+            vector = self._embed(question)
+            matrix = np.stack([e.vector for _, e in candidates])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                best_key = candidates[best][0]
+                with self._lock:
+                    entry = self._entries.get(best_key)
+                    if entry is not None:
+                        self._entries.move_to_end(best_key)
+                        self.semantic_hits += 1
+                        return entry.result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, question: str, result: Dict) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        key = normalize_question(question)
+        vector = self._embed(question)
+        with self._lock:
+            self._check_version()
+            self._entries[key] = _CacheEntry(result, vector, extract_length_constraint(question))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "corpus_version": self._watcher.version,
+            }
@@ -0,0 +1,137 @@
+"""
+PCM音频缓冲区 - 录音、STT分块发送、TTS累积和播放共用的音频容器
+底层是预分配、按倍数增长的 bytearray，追加是摊还O(1)的原地拷贝；
+也可以直接包装已有数据（第一次追加时才复制）；读取返回 memoryview 切片，在各环节之间传递时不再复制数据
+"""
+import io
+import wave
+from typing import Iterator, Optional, Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class AudioFormat:
+    """PCM采样格式：采样率、每个样本的字节数、声道数"""
+
+    def __init__(self, sample_rate: int = 16000, sample_width: int = 2, channels: int = 1):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+
+    @property
+    def bytes_per_second(self) -> int:
+        return self.sample_rate * self.sample_width * self.channels
+
+    def frame_bytes(self, frame_ms: int) -> int:
+        """指定时长的一帧字节数，对齐到整样本"""
+        block = self.sample_width * self.channels
+        return self.sample_rate * frame_ms // 1000 * block
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, AudioFormat) and (self.sample_rate, self.sample_width, self.channels) == (other.sample_rate, other.sample_width, other.channels)
+
+    def __hash__(self) -> int:
+        return hash((self.sample_rate, self.sample_width, self.channels))
+
+    def __repr__(self) -> str:
+        return f"AudioFormat({self.sample_rate} Hz, {self.sample_width * 8} bit, {self.channels} ch)"
+
+
+# 识别/合成服务最常用的格式：16kHz 16bit 单声道
+PCM16_MONO_16K = AudioFormat(16000, 2, 1)
+
+
+class PCMBuffer:
+    """带采样格式信息的可增长PCM缓冲区"""
+
+    def __init__(self, sample_rate: int = 16000, sample_width: int = 2, channels: int = 1, capacity: int = 0):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self._data = bytearray(capacity)
+        self._size = 0
+        self._owned = True  # False 时 _data 是包装的外部数据，只读不写
+
+    @classmethod
+    def of_format(cls, audio_format: AudioFormat, capacity: int = 0) -> "PCMBuffer":
+        return cls(audio_format.sample_rate, audio_format.sample_width, audio_format.channels, capacity)
+
+    @property
+    def format(self) -> AudioFormat:
+        return AudioFormat(self.sample_rate, self.sample_width, self.channels)
+
+    @classmethod
+    def for_duration(cls, seconds: float, sample_rate: int = 16000, sample_width: int = 2, channels: int = 1) -> "PCMBuffer":
+        """按预计时长预分配"""
+        return cls(sample_rate, sample_width, channels, capacity=int(seconds * sample_rate) * sample_width * channels)
+
+    @classmethod
+    def wrap(cls, data: BytesLike, sample_rate: int = 16000, sample_width: int = 2, channels: int = 1) -> "PCMBuffer":
+        """零拷贝包装已有的PCM数据；之后追加时才复制到自己的存储"""
+        buffer = cls(sample_rate, sample_width, channels)
+        view = memoryview(data)
+        buffer._data = view if view.format == "B" and view.ndim == 1 else view.cast("B")
+        buffer._size = len(buffer._data)
+        buffer._owned = False
+        return buffer
+
+    @property
+    def bytes_per_second(self) -> int:
+        return self.sample_rate * self.sample_width * self.channels
+
+    @property
+    def duration(self) -> float:
+        return self._size / self.bytes_per_second
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def append(self, data: BytesLike) -> None:
+        n = len(data)
+        if not n:
+            return
+        end = self._size + n
+        if end > len(self._data) or not self._owned:
+            # 换一块更大的存储而不是原地扩容：已导出的 memoryview 仍然有效，包装的外部数据也不会被改写
+            grown = bytearray(max(end, len(self._data) * 2, 4096))
+            grown[:self._size] = memoryview(self._data)[:self._size]
+            self._data = grown
+            self._owned = True
+        self._data[self._size:end] = data
+        self._size = end
+
+    extend = append
+
+    def view(self, start: int = 0, end: Optional[int] = None) -> memoryview:
+        """零拷贝切片（字节偏移）"""
+        end = self._size if end is None else min(end, self._size)
+        return memoryview(self._data)[start:end]
+
+    def chunks(self, chunk_bytes: int) -> Iterator[memoryview]:
+        """按固定字节数分块"""
+        for start in range(0, self._size, chunk_bytes):
+            yield self.view(start, start + chunk_bytes)
+
+    def frames(self, frame_ms: int) -> Iterator[memoryview]:
+        """按时长分帧，帧长由实际采样格式计算并对齐到整样本"""
+        return self.chunks(self.format.frame_bytes(frame_ms))
+
+    def clear(self) -> None:
+        """清空以便复用存储；之前导出的切片会被后续写入覆盖"""
+        self._size = 0
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.view())
+
+    def to_wav(self) -> bytes:
+        """编码为WAV文件内容"""
+        wav_buffer = io.BytesIO()
+        with wave.open(wav_buffer, "wb") as wf:
+            wf.setnchannels(self.channels)
+            wf.setsampwidth(self.sample_width)
+            wf.setframerate(self.sample_rate)
+            wf.writeframes(self.view())
+        return wav_buffer.getvalue()
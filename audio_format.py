@@ -0,0 +1,232 @@
+"""
+音频格式层 - WAV/PCM容器解析、声道/位宽/采样率转换
+STT/TTS后端通过 input_format / output_format 声明需要的格式，
+格式不一致时在交接处用NumPy向量化地转换一次
+"""
+import struct
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from audio_buffer import AudioFormat, PCMBuffer, PCM16_MONO_16K, BytesLike
+
+
+def parse_wav_header(data: BytesLike) -> Optional[Tuple[AudioFormat, int, int]]:
+    """解析WAV头，返回 (格式, PCM数据起始偏移, 数据长度)；数据不足以解析完整个头时返回 None"""
+    view = memoryview(data)
+    if len(view) < 12:
+        return None
+    if bytes(view[:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise ValueError("Not a WAV container")
+
+    audio_format = None
+    pos = 12
+    while pos + 8 <= len(view):
+        chunk_id, size = struct.unpack_from("<4sI", view, pos)
+        if chunk_id == b"data":
+            if audio_format is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            return audio_format, pos + 8, size
+        if pos + 8 + size > len(view):
+            return None
+        if chunk_id == b"fmt ":
+            codec, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", view, pos + 8)
+            if codec not in (1, 0xFFFE):
+                raise ValueError(f"Unsupported WAV codec: {codec}")
+            audio_format = AudioFormat(rate, bits // 8, channels)
+        pos += 8 + size + (size & 1)
+    return None
+
+
+def decode_audio(data, default_format: AudioFormat = PCM16_MONO_16K) -> PCMBuffer:
+    """把WAV文件内容或裸PCM统一成 PCMBuffer；已经是 PCMBuffer 时原样返回"""
+    if isinstance(data, PCMBuffer):
+        return data
+    view = memoryview(data)
+    if bytes(view[:4]) != b"RIFF":
+        return PCMBuffer.wrap(view, default_format.sample_rate, default_format.sample_width, default_format.channels)
+
+    header = parse_wav_header(view)
+    if header is None:
+        raise ValueError("Truncated WAV header")
+    audio_format, offset, size = header
+    # 流式生成的WAV数据长度字段常为0或0xFFFFFFFF，此时取到末尾
+    end = offset + size if 0 < size < 0xFFFFFFFF else len(view)
+    return PCMBuffer.wrap(view[offset:end], audio_format.sample_rate, audio_format.sample_width, audio_format.channels)
+
+
+class WavStreamDecoder:
+    """流式音频片段解码：片段以WAV头开头时解析并去掉头（头可以跨片段），其余按裸PCM透传；
+    指定 target 时输出转换为 target 格式（转换状态跨片段保留，遇到新的WAV头时重建）"""
+
+    def __init__(self, default_format: AudioFormat = PCM16_MONO_16K, target: Optional[AudioFormat] = None):
+        self.format = default_format
+        self.target = target
+        self._header: Optional[bytearray] = None
+        self._converter: Optional[Callable[[BytesLike], BytesLike]] = None
+        self._converter_format: Optional[AudioFormat] = None
+
+    def feed(self, chunk: BytesLike) -> BytesLike:
+        pcm = self._decode(chunk)
+        if self.target is None:
+            return pcm
+        if self._converter is None or self._converter_format != self.format:
+            self._converter = frame_converter(self.format, self.target)
+            self._converter_format = self.format
+        return self._converter(pcm)
+
+    def _decode(self, chunk: BytesLike) -> memoryview:
+        view = memoryview(chunk)
+        if self._header is None and bytes(view[:4]) == b"RIFF":
+            self._header = bytearray()
+        if self._header is None:
+            return view
+
+        self._header += view
+        try:
+            header = parse_wav_header(self._header)
+        except ValueError:
+            header, self._header = None, None
+            return view
+        if header is None:
+            if len(self._header) > 4096:
+                data, self._header = self._header, None
+                return memoryview(data)
+            return memoryview(b"")
+        self.format, offset, _ = header
+        data, self._header = self._header, None
+        return memoryview(data)[offset:]
+
+
+_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def _to_float(data: BytesLike, audio_format: AudioFormat) -> np.ndarray:
+    """PCM -> float32 数组，形状 (样本数, 声道数)，范围 [-1, 1]"""
+    samples = np.frombuffer(data, dtype=_DTYPES[audio_format.sample_width]).astype(np.float32)
+    if audio_format.sample_width == 1:
+        samples = (samples - 128.0) / 128.0
+    else:
+        samples /= float(2 ** (audio_format.sample_width * 8 - 1))
+    return samples.reshape(-1, audio_format.channels)
+
+
+def _from_float(samples: np.ndarray, sample_width: int) -> bytes:
+    samples = np.clip(samples, -1.0, 1.0)
+    if sample_width == 1:
+        return (samples * 127.0 + 128.0).astype(np.uint8).tobytes()
+    scale = float(2 ** (sample_width * 8 - 1) - 1)
+    return (samples * scale).astype(_DTYPES[sample_width]).tobytes()
+
+
+def _lowpass_kernel(cutoff: float, taps: int = 63) -> np.ndarray:
+    """加窗sinc低通滤波器系数，cutoff 为相对奈奎斯特频率的比例"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = cutoff * np.sinc(cutoff * n) * np.hamming(taps)
+    return kernel / kernel.sum()
+
+
+def _lowpass(samples: np.ndarray, cutoff: float, taps: int = 63) -> np.ndarray:
+    """整段低通滤波，降采样前抗混叠"""
+    kernel = _lowpass_kernel(cutoff, taps)
+    return np.stack([np.convolve(samples[:, c], kernel, mode="same") for c in range(samples.shape[1])], axis=1)
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """线性插值重采样（降采样时先低通），samples 形状 (样本数, 声道数)"""
+    if src_rate == dst_rate or not len(samples):
+        return samples
+    if dst_rate < src_rate:
+        samples = _lowpass(samples, dst_rate / src_rate)
+    n_out = int(round(len(samples) * dst_rate / src_rate))
+    positions = np.arange(n_out) * (src_rate / dst_rate)
+    index = np.arange(len(samples))
+    return np.stack([np.interp(positions, index, samples[:, c]) for c in range(samples.shape[1])], axis=1).astype(np.float32)
+
+
+def convert_pcm(data: BytesLike, src: AudioFormat, dst: AudioFormat) -> BytesLike:
+    """裸PCM格式转换；格式相同时原样返回，不复制"""
+    if src == dst:
+        return data
+    samples = _to_float(data, src)
+    if src.channels != dst.channels:
+        if dst.channels == 1:
+            samples = samples.mean(axis=1, keepdims=True)
+        elif src.channels == 1:
+            samples = np.repeat(samples, dst.channels, axis=1)
+        else:
+            raise ValueError(f"Cannot convert {src.channels} channels to {dst.channels}")
+    samples = resample(samples, src.sample_rate, dst.sample_rate)
+    return _from_float(samples, dst.sample_width)
+
+
+def convert(buffer: PCMBuffer, target: AudioFormat) -> PCMBuffer:
+    """把整段音频转换为目标格式；格式相同时返回原缓冲区"""
+    if buffer.format == target:
+        return buffer
+    return PCMBuffer.wrap(convert_pcm(buffer.view(), buffer.format, target), target.sample_rate, target.sample_width, target.channels)
+
+
+class StreamConverter:
+    """逐帧转换（流式场景）：滤波器历史和插值的小数读位置跨帧保留，
+    帧边界处没有咔嗒声，输出总长度与整段转换一致、不会漂移。
+    降采样的抗混叠滤波是因果的（只用已收到的样本），比整段转换的居中滤波滞后 (taps-1)/2 个输入样本，
+    开头和结尾的边缘样本也不同，因此与 convert() 的结果并不逐样本相等"""
+
+    def __init__(self, src: AudioFormat, dst: AudioFormat):
+        self.src = src
+        self.dst = dst
+        self.step = src.sample_rate / dst.sample_rate  # 每个输出样本前进的输入样本数
+        self.kernel = _lowpass_kernel(dst.sample_rate / src.sample_rate) if dst.sample_rate < src.sample_rate else None
+        channels = dst.channels if src.channels == 1 else src.channels
+        # 滤波器历史：上一帧末尾 taps-1 个样本（开头用0填充）
+        self._history = np.zeros((0 if self.kernel is None else len(self.kernel) - 1, channels), dtype=np.float32)
+        self._last: Optional[np.ndarray] = None  # 上一帧最后一个样本，作为本帧插值的起点
+        self._pos = 0.0  # 下一个输出样本相对本帧插值缓冲区开头的位置
+
+    def _mix(self, samples: np.ndarray) -> np.ndarray:
+        if self.src.channels == self.dst.channels:
+            return samples
+        if self.dst.channels == 1:
+            return samples.mean(axis=1, keepdims=True)
+        if self.src.channels == 1:
+            return np.repeat(samples, self.dst.channels, axis=1)
+        raise ValueError(f"Cannot convert {self.src.channels} channels to {self.dst.channels}")
+
+    def _filter(self, samples: np.ndarray) -> np.ndarray:
+        if self.kernel is None:
+            return samples
+        padded = np.concatenate([self._history, samples])
+        self._history = padded[len(padded) - len(self._history):]
+        return np.stack([np.convolve(padded[:, c], self.kernel, mode="valid") for c in range(samples.shape[1])], axis=1)
+
+    def _resample(self, samples: np.ndarray) -> np.ndarray:
+        if self.step == 1.0:
+            return samples
+        buf = samples if self._last is None else np.concatenate([self._last, samples])
+        last_index = len(buf) - 1
+        if last_index < self._pos:
+            self._pos -= last_index
+            self._last = buf[-1:]
+            return buf[:0]
+        count = int((last_index - self._pos) // self.step) + 1
+        positions = self._pos + np.arange(count) * self.step
+        index = np.arange(len(buf))
+        out = np.stack([np.interp(positions, index, buf[:, c]) for c in range(buf.shape[1])], axis=1)
+        # 下一帧的缓冲区以本帧最后一个样本开头
+        self._pos = self._pos + count * self.step - last_index
+        self._last = buf[-1:]
+        return out.astype(np.float32)
+
+    def __call__(self, frame: BytesLike) -> bytes:
+        if not len(frame):
+            return b""
+        samples = self._mix(_to_float(frame, self.src))
+        return _from_float(self._resample(self._filter(samples)), self.dst.sample_width)
+
+
+def frame_converter(src: AudioFormat, dst: AudioFormat) -> Callable[[BytesLike], BytesLike]:
+    """逐帧转换函数（流式场景，带跨帧状态，每个流单独创建）；格式相同时为恒等函数"""
+    if src == dst:
+        return lambda frame: frame
+    return StreamConverter(src, dst)
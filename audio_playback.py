@@ -0,0 +1,267 @@
+"""
+连续音频播放 - 一个长期打开的输出流（PyAudio，或从stdin读取裸PCM的aplay进程），
+由独立线程从环形缓冲区取数据写入；TTS接收线程只把数据放进队列，从不等待播放。
+TTS返回音频远快于实时播放，队列由送数线程搬进环形缓冲区：放不下时先扩容，到达上限后送数线程等待播放腾出空间（背压），
+只有输出设备持续没有进展超过写入超时时才丢弃最旧的数据，环形缓冲区的内存占用始终有上限
+"""
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+from typing import Callable, Optional
+
+# PyAudio导入
+try:
+    import pyaudio
+    PYAUDIO_AVAILABLE = True
+except ImportError:
+    PYAUDIO_AVAILABLE = False
+
+
+class PCMRingBuffer:
+    """字节环形缓冲区：放不下时按倍数扩容；设置了 max_capacity 且已达上限时，
+    写入方等待读取方腾出空间，读取方连续 timeout 秒没有进展才丢弃最旧的数据"""
+
+    def __init__(self, capacity: int, max_capacity: Optional[int] = None):
+        self.capacity = capacity if max_capacity is None else min(capacity, max_capacity)
+        self.max_capacity = max_capacity
+        self._data = bytearray(self.capacity)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self.dropped = 0
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, data, timeout: Optional[float] = None) -> int:
+        """写入数据，返回因缓冲区已满而丢弃的字节数；timeout 为到达容量上限时读取方没有进展的最长容忍时间"""
+        view = memoryview(data)
+        dropped = 0
+        with self._cond:
+            needed = self._size + len(view)
+            if needed > self.capacity and (self.max_capacity is None or self.capacity < self.max_capacity):
+                capacity = max(needed, self.capacity * 2)
+                self._grow(capacity if self.max_capacity is None else min(capacity, self.max_capacity))
+            if timeout:
+                # 背压：先写入放得下的部分，其余等读取方腾出空间；每次腾出空间都重新计时
+                deadline = time.monotonic() + timeout
+                while self._size + len(view) > self.capacity and not self._closed:
+                    free = self.capacity - self._size
+                    if free:
+                        self._put(view[:free])
+                        view = view[free:]
+                        deadline = time.monotonic() + timeout
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if len(view) > self.capacity:
+                dropped += len(view) - self.capacity
+                view = view[-self.capacity:]
+            overflow = self._size + len(view) - self.capacity
+            if overflow > 0:
+                dropped += overflow
+                self._start = (self._start + overflow) % self.capacity
+                self._size -= overflow
+            self._put(view)
+            self.dropped += dropped
+        return dropped
+
+    def _put(self, view: memoryview) -> None:
+        """把放得下的数据追加到末尾并唤醒读取方"""
+        end = (self._start + self._size) % self.capacity
+        first = min(len(view), self.capacity - end)
+        self._data[end:end + first] = view[:first]
+        self._data[:len(view) - first] = view[first:]
+        self._size += len(view)
+        self._cond.notify_all()
+
+    def _grow(self, capacity: int) -> None:
+        """换一块更大的存储，已有数据按顺序搬到开头"""
+        grown = bytearray(capacity)
+        first = min(self._size, self.capacity - self._start)
+        grown[:first] = memoryview(self._data)[self._start:self._start + first]
+        grown[first:self._size] = memoryview(self._data)[:self._size - first]
+        self._data, self.capacity, self._start = grown, capacity, 0
+
+    def read_into(self, out: bytearray, timeout: Optional[float] = None) -> Optional[int]:
+        """读取到调用方提供的缓冲区，返回字节数；缓冲区为空时等待，已关闭且读空时返回 None"""
+        with self._cond:
+            if not self._size and not self._closed:
+                self._cond.wait(timeout)
+            if not self._size:
+                return None if self._closed else 0
+            n = min(len(out), self._size)
+            first = min(n, self.capacity - self._start)
+            out[:first] = memoryview(self._data)[self._start:self._start + first]
+            out[first:n] = memoryview(self._data)[:n - first]
+            self._start = (self._start + n) % self.capacity
+            self._size -= n
+            self._cond.notify_all()
+            return n
+
+    def read(self, max_bytes: int, timeout: Optional[float] = None) -> Optional[bytes]:
+        out = bytearray(max_bytes)
+        n = self.read_into(out, timeout)
+        return None if n is None else bytes(out[:n])
+
+    def clear(self) -> int:
+        with self._cond:
+            cleared, self._start, self._size = self._size, 0, 0
+            self._cond.notify_all()
+            return cleared
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class AudioPlaybackSink:
+    """连续播放裸PCM（16bit小端）的播放器"""
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        channels: int = 1,
+        sample_width: int = 2,
+        backend: str = "auto",
+        buffer_seconds: float = 2,
+        max_buffer_seconds: Optional[float] = 10,
+        write_timeout: float = 5,
+        frame_ms: int = 20,
+        writer: Optional[Callable[[bytes], None]] = None,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.bytes_per_second = sample_rate * channels * sample_width
+        self.frame_bytes = self.bytes_per_second * frame_ms // 1000
+        # buffer_seconds 只是初始容量，长回答超出时扩容到 max_buffer_seconds；
+        # 之后送数线程等待播放腾出空间，输出设备连续 write_timeout 秒没有进展才丢弃最旧的数据
+        self.write_timeout = write_timeout
+        max_capacity = int(self.bytes_per_second * max_buffer_seconds) if max_buffer_seconds else None
+        self.buffer = PCMRingBuffer(int(self.bytes_per_second * buffer_seconds), max_capacity)
+
+        self._pa = None
+        self._stream = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._write = writer or self._open_backend(backend)
+        self._pending = 0  # 已写入但尚未交给输出设备的字节数
+        self._idle = threading.Condition()
+        # write() 只入队；背压只作用在送数线程上，TTS接收线程不受播放速度影响
+        self._queue: deque = deque()
+        self._queued = threading.Condition()
+        self._closing = False
+        self._feeder = threading.Thread(target=self._feed, daemon=True, name="audio-feed")
+        self._feeder.start()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="audio-playback")
+        self._thread.start()
+
+    def _open_backend(self, backend: str) -> Callable[[bytes], None]:
+        if backend in ("auto", "pyaudio") and PYAUDIO_AVAILABLE:
+            self._pa = pyaudio.PyAudio()
+            self._stream = self._pa.open(
+                format=self._pa.get_format_from_width(self.sample_width),
+                channels=self.channels,
+                rate=self.sample_rate,
+                output=True,
+                frames_per_buffer=self.frame_bytes // (self.sample_width * self.channels),
+            )
+            logging.info("Audio playback via PyAudio (%d Hz)", self.sample_rate)
+
+            def write(data) -> None:
+                # PyAudio的 write_stream 只接受只读bytes（"s#"），不接受 memoryview
+                self._stream.write(bytes(data))
+            return write
+
+        if backend in ("auto", "aplay") and shutil.which("aplay"):
+            self._proc = subprocess.Popen(
+                ["aplay", "-q", "-t", "raw", "-f", f"S{self.sample_width * 8}_LE",
+                 "-r", str(self.sample_rate), "-c", str(self.channels)],
+                stdin=subprocess.PIPE,
+            )
+            logging.info("Audio playback via aplay (%d Hz)", self.sample_rate)
+
+            def write(data: bytes) -> None:
+                self._proc.stdin.write(data)
+                self._proc.stdin.flush()
+            return write
+
+        raise RuntimeError(f"No audio playback backend available ({backend}); install pyaudio or alsa-utils")
+
+    def _feed(self) -> None:
+        while True:
+            with self._queued:
+                self._queued.wait_for(lambda: self._queue or self._closing)
+                if not self._queue:
+                    return
+                data = self._queue.popleft()
+            dropped = self.buffer.write(data, timeout=self.write_timeout)
+            if dropped:
+                logging.warning("Playback buffer overrun, dropped %d bytes", dropped)
+                self._consumed(dropped)
+
+    def _run(self) -> None:
+        # 复用同一块帧缓冲区，避免每帧分配
+        frame = bytearray(self.frame_bytes)
+        view = memoryview(frame)
+        while True:
+            n = self.buffer.read_into(frame, timeout=0.5)
+            if n is None:
+                return
+            if not n:
+                continue
+            try:
+                self._write(view[:n])
+            except Exception as e:
+                logging.error("Audio playback write failed: %s", e)
+            finally:
+                self._consumed(n)
+
+    def _consumed(self, n: int) -> None:
+        with self._idle:
+            self._pending = max(0, self._pending - n)
+            self._idle.notify_all()
+
+    def write(self, pcm) -> None:
+        """追加要播放的PCM数据（任意bytes-like，包括 memoryview），放进队列后立即返回"""
+        if not pcm:
+            return
+        data = bytes(pcm)
+        with self._idle:
+            self._pending += len(data)
+        with self._queued:
+            self._queue.append(data)
+            self._queued.notify()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """等待已写入的数据全部交给输出设备"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def stop(self) -> None:
+        """丢弃尚未播放的数据（例如被用户打断时）"""
+        with self._queued:
+            cleared = sum(len(data) for data in self._queue)
+            self._queue.clear()
+        self._consumed(cleared + self.buffer.clear())
+
+    def close(self) -> None:
+        with self._queued:
+            self._closing = True
+            self._queued.notify_all()
+        self._feeder.join(timeout=2)
+        self.buffer.close()
+        self._thread.join(timeout=2)
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._pa.terminate()
+        if self._proc is not None:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=5)
@@ -7,7 +7,9 @@ import os
 import time
 import sys
 from dotenv import load_dotenv
-from rag_chain import build_chain
+from langchain_core.prompts import ChatPromptTemplate
+from rag_chain import build_chain, build_llm
+from prompts import SYSTEM_PROMPT, build_prompt
 
 def test_retrieval_speed():
     """测试检索速度"""
@@ -68,6 +70,37 @@ def test_model_warmup():
     
     print(f"预热效果: {cold_ms/hot_ms:.1f}x 加速")
 
+def measure_first_token_ms(llm, prompt, question: str, context: str) -> float:
+    """流式调用LLM，返回首token延迟(ms)"""
+    messages = prompt.format_messages(question=question, chat_history="", context=context)
+    t_start = time.perf_counter()
+    for _ in llm.stream(messages):
+        return (time.perf_counter() - t_start) * 1000.0
+    return 0.0
+
+def test_prompt_prefix_cache():
+    """测试静态提示词前缀的KV缓存复用效果"""
+    print("\n=== 提示词前缀缓存测试 ===")
+    load_dotenv()
+
+    llm = build_llm()
+    chain, retriever = build_chain()
+    questions = ["湖北省博物馆镇馆之宝", "曾侯乙编钟", "越王勾践剑", "武汉美食推荐"]
+    contexts = ["\n\n".join(d.page_content for d in retriever.invoke(q)) for q in questions]
+
+    # 对照组：可变内容放在静态指令之前，每次请求前缀都不同，无法复用KV缓存
+    variable_first = ChatPromptTemplate.from_messages([
+        ("human", "背景资料：\n{context}\n\n对话上下文：\n{chat_history}\n\n" + SYSTEM_PROMPT.replace("{", "{{").replace("}", "}}") + "\n\n问题：{question}"),
+    ])
+    stable_prefix = build_prompt()
+
+    for name, prompt in [("可变内容在前", variable_first), ("静态前缀在前", stable_prefix)]:
+        # 先发一次请求，让模型加载并缓存（或无法缓存）前缀
+        measure_first_token_ms(llm, prompt, "你好", "")
+        latencies = [measure_first_token_ms(llm, prompt, q, c) for q, c in zip(questions, contexts)]
+        print(f"{name}: 平均首token延迟 {sum(latencies) / len(latencies):.1f} ms "
+              f"({', '.join(f'{ms:.0f}' for ms in latencies)})")
+
 if __name__ == "__main__":
     print("RAG性能基准测试")
     print("=" * 50)
@@ -75,6 +108,7 @@ if __name__ == "__main__":
     try:
         test_retrieval_speed()
         test_model_warmup()
+        test_prompt_prefix_cache()
     except KeyboardInterrupt:
         print("\n测试中断")
         sys.exit(0)
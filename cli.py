@@ -6,7 +6,8 @@ from typing import List, Dict
 
 from dotenv import load_dotenv
 
-from rag_chain import build_chain
+from rag_chain import build_chain_with_docs, build_sources
+from conversation_memory import build_conversation_memory
 from langchain_core.callbacks import BaseCallbackHandler
 
 
@@ -60,11 +61,11 @@ def interactive_chat() -> None:
 
     # 预热：提前构建chain和retriever，避免首次调用延迟
     print("正在初始化RAG系统...")
-    chain, retriever = build_chain()
+    chain, retriever = build_chain_with_docs()
     print("初始化完成！")
 
     print('RAG 对话（流式输出，输入 :q 退出）')
-    chat_history: List[str] = []
+    memory = build_conversation_memory()
 
     while True:
         try:
@@ -76,7 +77,7 @@ def interactive_chat() -> None:
 
             # 分步计时，诊断延迟来源
             t_retrieval_start = time.perf_counter()
-            docs = retriever.invoke(q)
+            docs = retriever.invoke(memory.rewrite_question(q))
             t_retrieval_end = time.perf_counter()
             
             if not docs:
@@ -86,7 +87,7 @@ def interactive_chat() -> None:
             print("助手：", end="", flush=True)
             handler = StdoutStreamingHandler()
             t_generation_start = time.perf_counter()
-            for _ in chain.stream({"question": q, "chat_history": "\n".join(chat_history)}, config={"callbacks": [handler]}):
+            for _ in chain.stream({"question": q, "chat_history": memory.render(), "docs": docs}, config={"callbacks": [handler]}):
                 pass
             t_generation_end = time.perf_counter()
 
@@ -114,16 +115,9 @@ def interactive_chat() -> None:
             print(f"总耗时：{retrieval_ms + generation_ms:.1f} ms")
             print(f"中文字符数：{chinese_count}")
 
-            chat_history.append(f"用户: {q}")
-            chat_history.append("助手: [上一轮回答略]")
+            memory.add_turn(q, output_text)
 
-            sources = []
-            for d in docs:
-                source = d.metadata.get("source", "unknown")
-                page = d.metadata.get("page")
-                chunk_id = d.metadata.get("chunk_id")
-                locator = f"page {page}" if page is not None else f"chunk {chunk_id}"
-                sources.append({"source": source, "locator": locator})
+            sources = build_sources(docs)
 
             if sources:
                 print("\n--- 引用 ---")
@@ -16,31 +16,77 @@ class RAGConfig:
             "docs_root": "./docs",  # 文档根目录
             "chunk_size": 800,  # 文档切分大小
             "chunk_overlap": 120,  # 文档切分重叠
+            "embed_batch_size": 64,  # 入库时每批嵌入的chunk数
+            "embed_workers": 4,  # 入库时并发嵌入请求数
+            "embed_max_retries": 3,  # 嵌入批次失败重试次数
+            "load_workers": 4,  # 并行加载/切分文档的工作进程数
+            "load_in_processes": True,  # True用进程池（PDF解析是CPU密集型），False用线程池
             
             # 向量库配置
             "store_dir": "./data_db/chroma_db/.hubei_vectdb",  # 向量库存储路径
             "collection_name": "local_knowledge",  # 集合名称
+            "vector_backend": "chroma",  # chroma | numpy (内存映射矩阵，适合几千个chunk的小语料)
+            "numpy_dtype": "float32",  # numpy后端的矩阵精度: float32 | float16 (省一半内存，查询时提升为float32)
             
             # 检索配置
             "top_k": 4,  # 检索文档数量
+            "retrieval_mode": "hybrid",  # hybrid (BM25+向量) | vector
+            "vector_top_k": 4,  # 混合检索中向量检索的候选数
+            "lexical_top_k": 8,  # 混合检索中BM25检索的候选数
+            "rrf_k": 60,  # 倒数排名融合常数
+            "rerank_enabled": False,  # 是否启用cross-encoder重排
+            "rerank_model": "BAAI/bge-reranker-base",  # 重排模型
+            "rerank_candidates": 12,  # 重排前检索的候选数
+            "rerank_budget_ms": 300,  # 重排时间预算，超时退回检索顺序
+            "context_token_budget": None,  # 提示词中检索上下文的token预算，None表示不限制（默认top_k个chunk全部保留）
+            "context_min_rerank_score": None,  # 低于该重排分数的chunk不放入上下文，None表示不过滤
+            
+            # 回答缓存配置
+            "answer_cache_size": 256,  # 缓存的问答条数上限
+            "answer_cache_ttl": 3600,  # 缓存有效期(秒)
+            "answer_cache_threshold": 0.92,  # 语义命中的余弦相似度阈值
             
             # 嵌入模型配置
             "embedding_backend": "sentence-transformers",  # sentence-transformers | ollama
             "embedding_model": "BAAI/bge-small-en-v1.5",  # 嵌入模型名称
+            "embedding_cache_size": 1024,  # 查询嵌入LRU缓存条数
+            "embedding_cache_dir": None,  # 嵌入磁盘缓存目录，None表示只用内存缓存
             
             # LLM配置
             "llm_backend": "ollama",  # ollama | openai
             "ollama_model": "qwen2.5:7b",  # Ollama模型
             "ollama_base_url": "http://localhost:11434",  # Ollama服务地址
+            "ollama_keep_alive": "30m",  # 模型在Ollama中的驻留时间
+            "ollama_num_ctx": 4096,  # 上下文窗口，保持固定以免模型重新加载、KV缓存失效
+            "pin_prompt_prefix": False,  # 启用后模型常驻(keep_alive=-1)并在预热时缓存静态提示词前缀的KV
+            
+            # 对话记忆配置
+            "history_turns": 3,  # 原文保留的最近对话轮数
+            "history_answer_chars": 120,  # 每轮保留的回答字数
+            "history_max_tokens": 600,  # 对话上下文的token上限
+            "history_summary_chars": 150,  # 旧轮次摘要的字数
+            "history_summarize": True,  # 是否用LLM在后台概括旧轮次
+            "history_rewrite_with_llm": False,  # 是否用LLM改写追问（否则用启发式改写，不增加延迟）
+            
+            # 服务配置
+            "max_concurrent_generations": 2,  # 同时进行的LLM生成数上限
+            "max_queue_size": 16,  # 等待生成的请求队列上限，超出返回503
+            "queue_timeout": 30,  # 排队等待超时(秒)
+            "session_backend": "memory",  # memory | sqlite (多个uvicorn worker共享会话)
+            "session_sqlite_path": "./data_db/sessions.sqlite3",  # sqlite会话库路径
+            "session_max": 1000,  # 最多保留的会话数
+            "session_idle_ttl": 1800,  # 会话空闲超时(秒)
             
             # 语音配置
             "voice_mode": "hybrid",  # voice | text | hybrid
             "auto_tts": True,  # 是否自动播放回答
             "record_duration": 5,  # 录音时长(秒)
+            "playback_buffer_seconds": 10,  # 播放缓冲区上限(秒)，满时送数线程等待播放腾出空间，TTS接收线程不等待
+            "playback_write_timeout": 5,  # 输出设备连续该时长(秒)没有进展时丢弃最旧的未播放数据
             
             # STT配置
-            "stt_backend": "whisper",  # whisper | gummy | speech_recognition
-            "stt_model": "base",  # STT模型大小
+            "stt_backend": "gummy",  # gummy | whisper（环境变量 STT_BACKEND 优先）
+            "stt_model": "base",  # 本地Whisper模型大小（环境变量 WHISPER_MODEL 优先）
             
             # TTS配置
             "tts_backend": "edge",  # edge | pyttsx3
@@ -58,6 +104,14 @@ class RAGConfig:
         os.makedirs(store_dir, exist_ok=True)
         return store_dir
     
+    def get_vector_backend_config(self) -> dict:
+        """获取向量库后端配置"""
+        return {
+            "backend": self.config["vector_backend"],
+            "numpy_dtype": self.config["numpy_dtype"],
+            "numpy_index_dir": os.path.join(self.get_store_dir(), "numpy_index")
+        }
+    
     def get_collection_name(self) -> str:
         """获取集合名称"""
         return self.config["collection_name"]
@@ -69,17 +123,57 @@ class RAGConfig:
             "chunk_overlap": self.config["chunk_overlap"]
         }
     
+    def get_ingest_config(self) -> dict:
+        """获取入库嵌入配置"""
+        return {
+            "embed_batch_size": self.config["embed_batch_size"],
+            "embed_workers": self.config["embed_workers"],
+            "embed_max_retries": self.config["embed_max_retries"],
+            "load_workers": self.config["load_workers"],
+            "load_in_processes": self.config["load_in_processes"]
+        }
+    
     def get_retrieval_config(self) -> dict:
         """获取检索配置"""
         return {
-            "top_k": self.config["top_k"]
+            "top_k": self.config["top_k"],
+            "mode": self.config["retrieval_mode"],
+            "vector_top_k": self.config["vector_top_k"],
+            "lexical_top_k": self.config["lexical_top_k"],
+            "rrf_k": self.config["rrf_k"]
+        }
+    
+    def get_context_config(self) -> dict:
+        """获取上下文打包配置"""
+        return {
+            "token_budget": self.config["context_token_budget"],
+            "min_rerank_score": self.config["context_min_rerank_score"]
+        }
+    
+    def get_rerank_config(self) -> dict:
+        """获取重排配置"""
+        return {
+            "enabled": self.config["rerank_enabled"],
+            "model": self.config["rerank_model"],
+            "candidates": self.config["rerank_candidates"],
+            "budget_ms": self.config["rerank_budget_ms"]
+        }
+    
+    def get_answer_cache_config(self) -> dict:
+        """获取回答缓存配置"""
+        return {
+            "max_size": self.config["answer_cache_size"],
+            "ttl": self.config["answer_cache_ttl"],
+            "similarity_threshold": self.config["answer_cache_threshold"]
         }
     
     def get_embedding_config(self) -> dict:
         """获取嵌入模型配置"""
         return {
             "backend": self.config["embedding_backend"],
-            "model": self.config["embedding_model"]
+            "model": self.config["embedding_model"],
+            "cache_size": self.config["embedding_cache_size"],
+            "cache_dir": self.config["embedding_cache_dir"]
         }
     
     def get_llm_config(self) -> dict:
@@ -87,7 +181,38 @@ class RAGConfig:
         return {
             "backend": self.config["llm_backend"],
             "ollama_model": self.config["ollama_model"],
-            "ollama_base_url": self.config["ollama_base_url"]
+            "ollama_base_url": self.config["ollama_base_url"],
+            "ollama_keep_alive": self.config["ollama_keep_alive"],
+            "ollama_num_ctx": self.config["ollama_num_ctx"],
+            "pin_prompt_prefix": self.config["pin_prompt_prefix"]
+        }
+    
+    def get_memory_config(self) -> dict:
+        """获取对话记忆配置"""
+        return {
+            "max_turns": self.config["history_turns"],
+            "answer_chars": self.config["history_answer_chars"],
+            "max_tokens": self.config["history_max_tokens"],
+            "summary_chars": self.config["history_summary_chars"],
+            "summarize": self.config["history_summarize"],
+            "rewrite_with_llm": self.config["history_rewrite_with_llm"]
+        }
+    
+    def get_server_config(self) -> dict:
+        """获取服务配置"""
+        return {
+            "max_concurrent_generations": self.config["max_concurrent_generations"],
+            "max_queue_size": self.config["max_queue_size"],
+            "queue_timeout": self.config["queue_timeout"]
+        }
+    
+    def get_session_config(self) -> dict:
+        """获取会话存储配置"""
+        return {
+            "backend": self.config["session_backend"],
+            "sqlite_path": self.config["session_sqlite_path"],
+            "max_sessions": self.config["session_max"],
+            "idle_ttl": self.config["session_idle_ttl"]
         }
     
     def get_voice_config(self) -> dict:
@@ -96,6 +221,8 @@ class RAGConfig:
             "mode": self.config["voice_mode"],
             "auto_tts": self.config["auto_tts"],
             "record_duration": self.config["record_duration"],
+            "playback_buffer_seconds": self.config["playback_buffer_seconds"],
+            "playback_write_timeout": self.config["playback_write_timeout"],
             "stt_backend": self.config["stt_backend"],
             "stt_model": self.config["stt_model"],
             "tts_backend": self.config["tts_backend"],
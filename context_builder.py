@@ -0,0 +1,108 @@
+"""
+上下文打包 - 在token预算内组装检索到的chunks
+去掉重复chunk，把同一来源相邻/重叠的chunk合并成一段（chunk_overlap 造成的重复文本只保留一次），
+丢弃重排分数过低的chunk，超出预算的部分截断
+"""
+import re
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+
+_CJK_RE = re.compile(r"[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文字符和全角标点约1个token，其余约4个字符1个token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按token预算截断，尽量停在句末标点"""
+    used = 0
+    for i, ch in enumerate(text):
+        used += 1 if _CJK_RE.match(ch) else 0.25
+        if used > max_tokens:
+            cut = text[:i]
+            boundary = max(cut.rfind(p) for p in "。！？；\n")
+            return cut[:boundary + 1] if boundary > len(cut) // 2 else cut
+    return text
+
+
+def _merge_group(docs: List[Document]) -> List[Document]:
+    """合并同一来源中重叠或相邻的chunk"""
+    positioned = sorted(docs, key=lambda d: d.metadata["start_index"])
+    merged: List[Document] = []
+    for doc in positioned:
+        start = doc.metadata["start_index"]
+        if merged:
+            last = merged[-1]
+            last_start = last.metadata["start_index"]
+            last_end = last_start + len(last.page_content)
+            if start <= last_end:
+                overlap = last_end - start
+                if overlap < len(doc.page_content):
+                    last.page_content += doc.page_content[overlap:]
+                last.metadata["chunk_ids"].append(doc.metadata.get("chunk_id"))
+                last.metadata["rank"] = min(last.metadata["rank"], doc.metadata["rank"])
+                continue
+        metadata = dict(doc.metadata)
+        metadata["chunk_ids"] = [doc.metadata.get("chunk_id")]
+        merged.append(Document(page_content=doc.page_content, metadata=metadata))
+    return merged
+
+
+def pack_context(docs: List[Document], token_budget: Optional[int] = None, min_rerank_score: Optional[float] = None) -> List[Document]:
+    """
+    返回打包后的片段列表（按检索排名排序）
+    合并后的片段 metadata["chunk_ids"] 记录了原始chunk编号
+    """
+    if not docs:
+        return []
+
+    # 丢弃重排分数过低的chunk（至少保留一个）
+    if min_rerank_score is not None:
+        kept = [d for d in docs if d.metadata.get("rerank_score", min_rerank_score) >= min_rerank_score]
+        docs = kept or docs[:1]
+
+    # 去掉完全重复的chunk，记录检索排名
+    seen = set()
+    ranked: List[Document] = []
+    for rank, doc in enumerate(docs):
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        ranked.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "rank": rank}))
+
+    # 同一来源（同一页）且有位置信息的chunk合并
+    groups = {}
+    segments: List[Document] = []
+    for doc in ranked:
+        if doc.metadata.get("start_index") is None:
+            doc.metadata["chunk_ids"] = [doc.metadata.get("chunk_id")]
+            segments.append(doc)
+            continue
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        groups.setdefault(key, []).append(doc)
+    for group in groups.values():
+        segments.extend(_merge_group(group))
+    segments.sort(key=lambda d: d.metadata["rank"])
+
+    if not token_budget:
+        return segments
+
+    packed: List[Document] = []
+    remaining = token_budget
+    for segment in segments:
+        tokens = estimate_tokens(segment.page_content)
+        if tokens <= remaining:
+            packed.append(segment)
+            remaining -= tokens
+            continue
+        # 剩余预算足够放下有意义的一段时截断放入，否则停止
+        if remaining >= 100 or not packed:
+            segment.page_content = _truncate_to_tokens(segment.page_content, remaining)
+            packed.append(segment)
+        break
+    return packed
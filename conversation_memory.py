@@ -0,0 +1,204 @@
+"""
+对话记忆 - 保留最近N轮原文（含截断后的真实回答），更早的轮次在后台线程中概括成摘要，
+渲染结果受token上限约束；同时负责在检索前把追问改写成独立的问题
+"""
+import re
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from context_builder import estimate_tokens
+
+
+SUMMARY_PROMPT = (
+    "请用不超过{limit}字概括下面这段对话的要点，保留提到的文物、地点和人物名称，只输出摘要本身。\n\n"
+    "已有摘要：\n{summary}\n\n"
+    "新增对话：\n{dialogue}"
+)
+
+REWRITE_PROMPT = (
+    "根据对话历史，把用户最新的追问改写成一个不依赖上下文、可以直接用于检索的完整问题，只输出改写后的问题。\n\n"
+    "对话历史：\n{history}\n\n"
+    "最新追问：{question}"
+)
+
+# 追问的判断只看真正的指代/承接形式，不匹配“应该”“其实”“因此”里的单字：
+# 以指代词或承接词开头；人称代词“它/他/她(们)”（排除“其它/其他”）；“这件/那座”等指示短语；以“呢”结尾的省略问
+_FOLLOW_UP_RE = re.compile(
+    r"^(那|这|其中|该|此|上面|刚才|还有|另外)"
+    r"|(?<!其)[它他她]们?"
+    r"|[这那](件|座|个|些|幅|尊|把|位|里)"
+    r"|呢[？?]?$"
+)
+
+
+class ConversationMemory:
+    """滚动窗口 + 摘要的对话记忆"""
+
+    def __init__(
+        self,
+        llm=None,
+        max_turns: int = 3,
+        answer_chars: int = 120,
+        max_tokens: int = 600,
+        summary_chars: int = 150,
+        summarize: bool = True,
+        rewrite_with_llm: bool = False,
+        background_summary: bool = True,
+    ):
+        self.llm = llm
+        self.max_turns = max_turns
+        self.answer_chars = answer_chars
+        self.max_tokens = max_tokens
+        self.summary_chars = summary_chars
+        self.summarize = summarize and llm is not None
+        self.rewrite_with_llm = rewrite_with_llm and llm is not None
+        # False 时不自动启动后台摘要线程，由调用方在合适的时机（如占到生成名额后）调用 summarize_pending()
+        self.background_summary = background_summary
+
+        self.turns: List[Tuple[str, str]] = []
+        self.summary = ""
+        self._pending: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._summarizer: Optional[threading.Thread] = None
+
+    def _truncate_answer(self, answer: str) -> str:
+        answer = answer.strip().replace("\n", " ")
+        return answer if len(answer) <= self.answer_chars else answer[:self.answer_chars] + "…"
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """记录一轮对话，超出窗口的旧轮次交给后台摘要"""
+        with self._lock:
+            self.turns.append((question, self._truncate_answer(answer)))
+            while len(self.turns) > self.max_turns:
+                self._pending.append(self.turns.pop(0))
+            start = self._pending and (self._summarizer is None or not self._summarizer.is_alive())
+        if start:
+            if self.summarize and not self.background_summary:
+                return
+            if self.summarize:
+                self._summarizer = threading.Thread(target=self._summarize_pending, daemon=True)
+                self._summarizer.start()
+            else:
+                self._fold_pending()
+
+    def _fold_pending(self) -> None:
+        """不使用LLM时的摘要：只保留旧问题，按字数截断"""
+        with self._lock:
+            questions = "；".join(q for q, _ in self._pending)
+            self._pending.clear()
+            merged = f"{self.summary}；{questions}" if self.summary else f"用户先前问过：{questions}"
+            self.summary = merged[-self.summary_chars:]
+
+    @property
+    def has_pending_summary(self) -> bool:
+        """是否有移出窗口、尚未概括的轮次"""
+        with self._lock:
+            return bool(self._pending)
+
+    def summarize_pending(self) -> None:
+        """在当前线程中概括待处理的旧轮次"""
+        self._summarize_pending()
+
+    def _summarize_pending(self) -> None:
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, []
+                summary = self.summary
+            dialogue = "\n".join(f"用户: {q}\n助手: {a}" for q, a in pending)
+            try:
+                result = self.llm.invoke(SUMMARY_PROMPT.format(limit=self.summary_chars, summary=summary or "（无）", dialogue=dialogue))
+                new_summary = getattr(result, "content", result).strip()[:self.summary_chars * 2]
+            except Exception as e:
+                logging.warning("History summarization failed, keeping questions only: %s", e)
+                with self._lock:
+                    self._pending = pending + self._pending
+                self._fold_pending()
+                return
+            with self._lock:
+                self.summary = new_summary
+
+    def render(self) -> str:
+        """渲染成提示词中的对话上下文，保证不超过token上限"""
+        with self._lock:
+            summary = self.summary
+            turns = list(self.turns)
+
+        lines = [f"用户: {q}\n助手: {a}" for q, a in turns]
+        header = f"之前对话摘要：{summary}" if summary else ""
+
+        def total() -> int:
+            return estimate_tokens(header) + sum(estimate_tokens(line) for line in lines)
+
+        # 先丢最旧的原文轮次，仍超限则截断摘要
+        while lines and total() > self.max_tokens:
+            lines.pop(0)
+        if header and total() > self.max_tokens:
+            header = header[:max(0, self.max_tokens - sum(estimate_tokens(line) for line in lines))]
+        return "\n".join(part for part in [header, *lines] if part)
+
+    def is_follow_up(self, question: str) -> bool:
+        return bool(self.turns) and bool(_FOLLOW_UP_RE.search(question))
+
+    def rewrite_question(self, question: str) -> str:
+        """把追问改写成可独立检索的问题；非追问原样返回"""
+        if not self.is_follow_up(question):
+            return question
+        with self._lock:
+            last_question = self.turns[-1][0]
+        if self.rewrite_with_llm:
+            try:
+                result = self.llm.invoke(REWRITE_PROMPT.format(history=self.render(), question=question))
+                rewritten = getattr(result, "content", result).strip()
+                if rewritten:
+                    return rewritten
+            except Exception as e:
+                logging.warning("Question rewrite failed, using heuristic: %s", e)
+        # 启发式改写：带上上一轮问题，给检索补充被省略的主语
+        return f"{last_question} {question}"
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns.clear()
+            self._pending.clear()
+            self.summary = ""
+
+    @property
+    def summarizing(self) -> bool:
+        """后台摘要是否正在进行"""
+        return self._summarizer is not None and self._summarizer.is_alive()
+
+    def wait_for_summary(self, timeout: Optional[float] = None) -> None:
+        """等待后台摘要完成"""
+        summarizer = self._summarizer
+        if summarizer is not None:
+            summarizer.join(timeout)
+
+    def to_dict(self) -> dict:
+        """导出可序列化的状态（尚未摘要的轮次一并保存，避免丢失）"""
+        with self._lock:
+            return {
+                "turns": [list(t) for t in self.turns],
+                "pending": [list(t) for t in self._pending],
+                "summary": self.summary,
+            }
+
+    def load_dict(self, state: dict) -> None:
+        """从 to_dict() 的结果恢复状态"""
+        with self._lock:
+            self.turns = [tuple(t) for t in state.get("turns", [])]
+            self._pending = [tuple(t) for t in state.get("pending", [])]
+            self.summary = state.get("summary", "")
+
+
+def build_conversation_memory(llm=None) -> ConversationMemory:
+    """按配置创建对话记忆；需要摘要或LLM改写时自动创建LLM客户端"""
+    from config import get_rag_config
+
+    memory_config = get_rag_config().get_memory_config()
+    if llm is None and (memory_config["summarize"] or memory_config["rewrite_with_llm"]):
+        from rag_chain import build_llm
+        llm = build_llm()
+    return ConversationMemory(llm=llm, **memory_config)
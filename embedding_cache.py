@@ -0,0 +1,106 @@
+"""
+嵌入缓存 - 对 (模型名, 调用类型, 文本) 的嵌入结果做LRU内存缓存，可选SQLite磁盘缓存
+重复的问题不再重新调用 Ollama / sentence-transformers 计算嵌入
+"""
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """带缓存的嵌入包装器，接口与被包装的 Embeddings 一致"""
+
+    def __init__(self, underlying: Embeddings, model_name: str, max_size: int = 1024, cache_dir: Optional[str] = None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.max_size = max_size
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, "embeddings.sqlite3"), check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._db.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        # 查询和文档分开缓存：BGE查询指令、Ollama查询/文档提示词等非对称模型对同一文本给出不同向量
+        return hashlib.sha1(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            return vector
+        if self._db is not None:
+            row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                vector = array("f", row[0]).tolist()
+                self._remember(key, vector, persist=False)
+                return vector
+        return None
+
+    def _remember(self, key: str, vector: List[float], persist: bool = True) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+        if persist and self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                (key, array("f", vector).tobytes()),
+            )
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        with self._lock:
+            vector = self._lookup(key)
+            if vector is not None:
+                self.hits += 1
+                return vector
+            self.misses += 1
+
+        vector = self.underlying.embed_query(text)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.commit()
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", t) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                results[i] = self._lookup(key)
+        missing = [i for i, v in enumerate(results) if v is None]
+
+        if missing:
+            vectors = self.underlying.embed_documents([texts[i] for i in missing])
+            with self._lock:
+                for i, vector in zip(missing, vectors):
+                    results[i] = vector
+                    self._remember(keys[i], vector)
+                if self._db is not None:
+                    self._db.commit()
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        logging.debug("Embedding cache: %d hits, %d misses", len(texts) - len(missing), len(missing))
+        return results  # type: ignore[return-value]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._memory), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,185 @@
+"""
+混合检索 - BM25词法检索 + 向量检索，使用倒数排名融合(RRF)合并结果
+词法索引在入库时构建，持久化在Chroma存储目录旁；索引只保存每个chunk的词频，正文按id从向量库取回
+中文分词优先使用jieba，未安装时退化为字符二元组
+"""
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from pydantic import ConfigDict, PrivateAttr
+
+# jieba分词导入
+try:
+    import jieba
+    jieba.setLogLevel(logging.WARNING)
+    JIEBA_AVAILABLE = True
+except ImportError:
+    JIEBA_AVAILABLE = False
+
+
+LEXICAL_INDEX_FILE = "bm25_index.json"
+
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
+_WORD_RE = re.compile(r"[\u4e00-\u9fff]+|[a-zA-Z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """中文分词：jieba可用时用jieba（搜索引擎模式），否则用单字+二元组"""
+    tokens: List[str] = []
+    for piece in _WORD_RE.findall(text.lower()):
+        if not _CJK_RE.fullmatch(piece):
+            tokens.append(piece)
+        elif JIEBA_AVAILABLE:
+            tokens.extend(t for t in jieba.cut_for_search(piece) if t.strip())
+        else:
+            tokens.extend(piece)
+            tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return tokens
+
+
+def doc_key(doc: Document) -> Tuple:
+    """用于在两路检索结果间对齐同一个chunk：优先用确定性的chunk id
+    （source 只是文件名，不同子目录下的同名文件会撞车），没有id时退回元数据"""
+    if doc.id:
+        return ("id", doc.id)
+    metadata = doc.metadata
+    return (metadata.get("source"), metadata.get("page"), metadata.get("start_index"), metadata.get("chunk_id"))
+
+
+class BM25Index:
+    """可增量更新的BM25索引（只存chunk id和词频，不保存正文）"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict[str, int]] = {}
+        # (倒排表, 文档长度, 平均长度, 文档数) 在锁内构建后一次性发布，并发的首批查询不会读到半成品
+        self._built: Optional[Tuple[Dict[str, List[Tuple[str, int]]], Dict[str, int], float, int]] = None
+        self._lock = threading.Lock()
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]) -> None:
+        counts = {chunk_id: dict(Counter(tokenize(text))) for chunk_id, text in zip(ids, texts)}
+        with self._lock:
+            self.docs.update(counts)
+            self._built = None
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id in ids:
+                self.docs.pop(chunk_id, None)
+            self._built = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self.docs.clear()
+            self._built = None
+
+    def _build(self) -> Tuple[Dict[str, List[Tuple[str, int]]], Dict[str, int], float, int]:
+        with self._lock:
+            if self._built is not None:
+                return self._built
+            postings: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+            lengths: Dict[str, int] = {}
+            for chunk_id, counts in self.docs.items():
+                lengths[chunk_id] = sum(counts.values())
+                for term, tf in counts.items():
+                    postings[term].append((chunk_id, tf))
+            avgdl = sum(lengths.values()) / len(lengths) if lengths else 0.0
+            self._built = (dict(postings), lengths, avgdl, len(lengths))
+            return self._built
+
+    def search(self, query: str, k: int = 8) -> List[Tuple[str, float]]:
+        built = self._built
+        postings_by_term, lengths, avgdl, n = built if built is not None else self._build()
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = postings_by_term.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * lengths[chunk_id] / (avgdl or 1.0))
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def save(self, store_dir: str) -> None:
+        path = Path(store_dir, LEXICAL_INDEX_FILE)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"k1": self.k1, "b": self.b, "docs": self.docs}, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, store_dir: str) -> Optional["BM25Index"]:
+        path = Path(store_dir, LEXICAL_INDEX_FILE)
+        if not path.exists():
+            return None
+        data = json.loads(path.read_text(encoding="utf-8"))
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        index.docs = data["docs"]
+        return index
+
+
+class HybridRetriever(BaseRetriever):
+    """向量检索 + BM25检索，倒数排名融合"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectordb: Any
+    lexical_index: Any
+    k: int = 4
+    vector_k: int = 4
+    lexical_k: int = 8
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        ranked: Dict[Tuple, float] = defaultdict(float)
+        documents: Dict[Tuple, Document] = {}
+
+        for rank, doc in enumerate(self.vectordb.similarity_search(query, k=self.vector_k)):
+            key = doc_key(doc)
+            ranked[key] += 1.0 / (self.rrf_k + rank + 1)
+            documents.setdefault(key, doc)
+
+        hits = [chunk_id for chunk_id, _ in self.lexical_index.search(query, k=self.lexical_k)]
+        # 词法索引不存正文，命中的chunk一次性按id从向量库取回
+        by_id = {doc.id: doc for doc in self.vectordb.get_by_ids(hits)} if hits else {}
+        for rank, doc in enumerate(by_id[chunk_id] for chunk_id in hits if chunk_id in by_id):
+            key = doc_key(doc)
+            ranked[key] += 1.0 / (self.rrf_k + rank + 1)
+            documents.setdefault(key, doc)
+
+        fused = sorted(ranked.items(), key=lambda item: item[1], reverse=True)[:self.k]
+        return [documents[key] for key, _ in fused]
+
+
+class CorpusReloadingRetriever(BaseRetriever):
+    """语料版本戳变化（重新入库）后重建内层检索器，BM25索引和向量库随之换成新语料"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    retriever: Any
+    build: Any  # 无参可调用对象，返回基于最新语料的检索器
+    watcher: Any  # answer_cache.CorpusVersionWatcher
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def _current(self) -> BaseRetriever:
+        if self.watcher.changed():
+            with self._lock:
+                try:
+                    self.retriever = self.build()
+                    logging.info("Corpus version changed (%s), reloaded retriever indexes", self.watcher.version)
+                except Exception as e:
+                    logging.error("Failed to reload retriever, keeping the previous indexes: %s", e)
+        return self.retriever
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._current().invoke(query, config={"callbacks": run_manager.get_child()})
@@ -1,13 +1,18 @@
 import os
 import sys
-import uuid
+import json
+import time
+import hashlib
 import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
 
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
+import chromadb
 from langchain_chroma import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
@@ -15,6 +20,10 @@ from langchain_huggingface import HuggingFaceEmbeddings
 
 from langchain_ollama import OllamaEmbeddings
 
+from answer_cache import write_corpus_version
+from hybrid_retriever import BM25Index
+from numpy_store import export_chroma_to_numpy
+
 
 def setup_logging() -> None:
     level = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -31,36 +40,143 @@ def getenv_int(name: str, default: int) -> int:
         return default
 
 
-def load_all_documents(docs_dir: Path) -> List:
-    docs = []
-    if not docs_dir.exists():
-        logging.warning("Docs directory does not exist: %s", docs_dir)
-        return docs
+SUPPORTED_SUFFIXES = {".pdf", ".txt", ".md", ".markdown"}
+MANIFEST_FILE = "ingest_manifest.json"
+
+
+def load_document(path: Path) -> List:
+    suffix = path.suffix.lower()
+    if suffix == ".pdf":
+        loaded = PyPDFLoader(str(path)).load()
+    elif suffix in {".txt", ".md", ".markdown"}:
+        loaded = TextLoader(str(path), autodetect_encoding=True).load()
+    else:
+        return []
+
+    # Attach filename into metadata
+    for d in loaded:
+        d.metadata = d.metadata or {}
+        d.metadata["source"] = path.name
+    return loaded
+
+
+def iter_doc_files(docs_dir: Path) -> Iterator[Path]:
+    for path in sorted(docs_dir.rglob("*")):
+        if path.is_file() and path.suffix.lower() in SUPPORTED_SUFFIXES:
+            yield path
+
+
+def _make_executor(workers: int, use_processes: bool) -> Executor:
+    if use_processes:
+        # spawn 避免在已有嵌入线程/Chroma线程的进程里 fork
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load")
+
 
-    for path in docs_dir.rglob("*"):
-        if not path.is_file():
+def iter_parallel(fn, items: Iterable, workers: int = 4, use_processes: bool = True) -> Iterator[Tuple]:
+    """
+    在进程池/线程池中并行执行 fn(*item)，按完成顺序产出 (item, result, error)
+    在途任务数限制为 workers * 2，内存占用与批大小而非语料规模成正比
+    """
+    items = iter(items)
+    max_inflight = max(1, workers) * 2
+    with _make_executor(max(1, workers), use_processes) as executor:
+        pending: Dict = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_inflight:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending[executor.submit(fn, *item)] = item
+            if not pending:
+                break
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id_for(rel_path: str, page, start_index, text: str) -> str:
+    """由源文件路径、页码、切分位置和内容哈希得到确定性的chunk id
+    （PDF的 start_index 按页计算，不含页码时不同页上的相同文本会得到相同id）"""
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha1(f"{rel_path}:{page}:{start_index}:{content_hash}".encode("utf-8")).hexdigest()
+
+
+def load_manifest(store_dir: str) -> Dict[str, Dict]:
+    path = Path(store_dir, MANIFEST_FILE)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        logging.warning("Ignoring unreadable manifest %s: %s", path, e)
+        return {}
+
+
+def save_manifest(store_dir: str, manifest: Dict[str, Dict]) -> None:
+    path = Path(store_dir, MANIFEST_FILE)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def plan_changes(docs_dir: Path, manifest: Dict[str, Dict]) -> Tuple[List[Tuple[Path, str, Dict]], List[str]]:
+    """
+    对比文档目录与清单，返回 (需要重新入库的文件, 已删除的文件)
+    mtime 和大小都未变的文件直接跳过，否则再比较内容哈希
+    """
+    changed = []
+    seen = set()
+    for path in iter_doc_files(docs_dir):
+        rel_path = path.relative_to(docs_dir).as_posix()
+        seen.add(rel_path)
+        stat = path.stat()
+        entry = manifest.get(rel_path)
+        if entry and entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
             continue
-        suffix = path.suffix.lower()
-        try:
-            if suffix == ".pdf":
-                loader = PyPDFLoader(str(path))
-                loaded = loader.load()
-            elif suffix in {".txt", ".md", ".markdown"}:
-                loader = TextLoader(str(path), autodetect_encoding=True)
-                loaded = loader.load()
-            else:
-                continue
 
-            # Attach filename into metadata
-            for d in loaded:
-                d.metadata = d.metadata or {}
-                d.metadata["source"] = path.name
+        sha256 = file_sha256(path)
+        if entry and entry.get("sha256") == sha256:
+            # 内容未变，只刷新 mtime
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+            continue
+        changed.append((path, rel_path, {"sha256": sha256, "mtime": stat.st_mtime, "size": stat.st_size}))
+
+    removed = [rel_path for rel_path in manifest if rel_path not in seen]
+    return changed, removed
 
-            docs.extend(loaded)
-            logging.info("Loaded %d docs from %s", len(loaded), path.name)
-        except Exception as e:
-            logging.exception("Failed to load %s: %s", path, e)
-    return docs
+
+def split_file(path: Path, rel_path: str, chunk_size: int, chunk_overlap: int) -> Tuple[List, List[str]]:
+    """加载并切分单个文件（在工作进程中运行）"""
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True,
+    )
+    splits = splitter.split_documents(load_document(path))
+    ids = []
+    # Add stable chunk ids for citation
+    for idx, d in enumerate(splits):
+        d.metadata = d.metadata or {}
+        d.metadata.setdefault("source", path.name)
+        d.metadata["chunk_id"] = idx  # used in citation when page missing
+        ids.append(chunk_id_for(rel_path, d.metadata.get("page"), d.metadata.get("start_index"), d.page_content))
+    return splits, ids
 
 
 def build_embeddings():
@@ -78,6 +194,209 @@ def build_embeddings():
         return HuggingFaceEmbeddings(model_name=model_name)
 
 
+def open_collection(store_dir: str, collection_name: str):
+    """通过 chromadb 的公开客户端打开与 LangChain Chroma 同一个集合，用于写入已算好的向量
+    （集合需在 reset_collection 之后打开，重建会换成新的集合）"""
+    return chromadb.PersistentClient(path=store_dir).get_or_create_collection(collection_name, embedding_function=None)
+
+
+def upsert_embedded(collection, ids: List[str], vectors: List[List[float]], docs: List) -> None:
+    """写入已算好向量的chunks（按id upsert）
+    LangChain Chroma 的公开接口 add_texts/add_documents 会在调用线程里重新嵌入，
+    而这里的向量已由嵌入线程池并行算好，写入也需留在主线程串行进行，所以直接写 chromadb 集合"""
+    collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=[d.page_content for d in docs],
+        metadatas=[d.metadata for d in docs],
+    )
+
+
+def rebuild_lexical_index(vectordb, page_size: int = 1000) -> BM25Index:
+    """从向量库中已有的chunk文本重建词法索引（分页读取，不重新嵌入）"""
+    index = BM25Index()
+    offset = 0
+    while True:
+        data = vectordb.get(include=["documents"], limit=page_size, offset=offset)
+        if not data["ids"]:
+            break
+        index.add(data["ids"], data["documents"])
+        offset += len(data["ids"])
+    logging.info("Rebuilt lexical index for %d chunks", len(index.docs))
+    return index
+
+
+def open_index_state(vectordb, store_dir: str, rebuild: bool) -> Tuple[Dict[str, Dict], BM25Index]:
+    """读取清单和词法索引；需要整体重建时清空集合并返回空的清单和索引"""
+    manifest = {} if rebuild else load_manifest(store_dir)
+    if not rebuild and not manifest and vectordb.get(limit=1, include=[])["ids"]:
+        # 旧版本建的库没有清单，chunk是随机id：增量入库会与其重复，整体重建一次
+        logging.info("Collection has chunks but no ingest manifest, rebuilding.")
+        rebuild = True
+    lexical_index = (None if rebuild else BM25Index.load(store_dir)) or BM25Index()
+    if not rebuild and not lexical_index.docs and manifest:
+        # 旧版本没有词法索引：用向量库里已有的chunk文本补建，不必重新嵌入
+        logging.info("Lexical index missing, rebuilding it from the vector store.")
+        lexical_index = rebuild_lexical_index(vectordb)
+    if rebuild:
+        try:
+            vectordb.reset_collection()
+            logging.info("Recreated Chroma collection.")
+        except Exception:
+            logging.info("Proceeding without collection reset.")
+    return manifest, lexical_index
+
+
+def remove_deleted_files(vectordb, lexical_index: BM25Index, manifest: Dict[str, Dict], removed: List[str]) -> None:
+    """删除已移除文件的chunks并从清单中去掉"""
+    for rel_path in removed:
+        old_ids = manifest.pop(rel_path).get("chunk_ids", [])
+        if old_ids:
+            vectordb.delete(ids=old_ids)
+            lexical_index.remove(old_ids)
+        logging.info("Removed %d chunks of deleted file %s", len(old_ids), rel_path)
+
+
+def record_indexed_file(vectordb, lexical_index: BM25Index, manifest: Dict[str, Dict], rel_path: str,
+                        file_info: Dict, ids: List[str], texts: List[str]) -> None:
+    """文件的新chunks全部写入后收尾：加入词法索引，删除不再存在的旧chunks，记入清单
+    （先写入新chunks再删旧的；嵌入失败的文件不收尾，词法索引不会命中向量库里没有的chunk）"""
+    lexical_index.add(ids, texts)
+    old_ids = set(manifest.get(rel_path, {}).get("chunk_ids", []))
+    stale_ids = list(old_ids - set(ids))
+    if stale_ids:
+        vectordb.delete(ids=stale_ids)
+        lexical_index.remove(stale_ids)
+    file_info["chunk_ids"] = ids
+    manifest[rel_path] = file_info
+    logging.info("Indexed %d chunks from %s", len(ids), rel_path)
+
+
+class DeferredDeletes:
+    """收集要从向量库删除的chunk id，入库结束时一次性删除
+    正在运行的服务在语料版本戳更新后才重新打开Chroma，在此之前它仍会检索到已删除的chunk（正文为空），
+    所以删除要紧挨着写版本戳，而不是在入库过程中逐个文件进行"""
+
+    def __init__(self, vectordb):
+        self.vectordb = vectordb
+        self.ids: List[str] = []
+
+    def delete(self, ids: List[str]) -> None:
+        self.ids.extend(ids)
+
+    def flush(self) -> int:
+        ids, self.ids = self.ids, []
+        if ids:
+            self.vectordb.delete(ids=ids)
+        return len(ids)
+
+
+class EmbeddingPipeline:
+    """
+    分批并发嵌入：按 batch_size 切批，多个批次同时请求嵌入模型，
+    完成一批就写入一批 Chroma，失败的批次单独重试，不影响其他批次
+    每个文件的chunks全部写入（或有批次失败）后回调 on_file_done(key, ok)，调用方据此收尾该文件
+    """
+
+    def __init__(
+        self,
+        collection,
+        embeddings,
+        batch_size: int = 64,
+        workers: int = 4,
+        max_retries: int = 3,
+        on_file_done: Optional[Callable[[str, bool], None]] = None,
+    ):
+        self.collection = collection
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.on_file_done = on_file_done
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+        self._pending: Dict = {}
+        self._buffer: List[Tuple] = []
+        # 文件 -> [未写入的chunk数, 是否有批次失败]
+        self._files: Dict[str, List] = {}
+        self.failed_ids: set = set()
+        self.stored = 0
+        self._start_time = time.perf_counter()
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = 2 ** attempt
+                logging.warning("Embedding batch failed (%s), retrying in %ds", e, delay)
+                time.sleep(delay)
+
+    def _dispatch(self) -> None:
+        batch, self._buffer = self._buffer, []
+        future = self._executor.submit(self._embed_batch, [d.page_content for d, _, _ in batch])
+        self._pending[future] = batch
+        # 限制在途批次数，避免内存随语料增长
+        if len(self._pending) >= self.workers * 2:
+            done, _ = wait(list(self._pending), return_when=FIRST_COMPLETED)
+            self._collect(done)
+        else:
+            self._collect([f for f in self._pending if f.done()])
+
+    def _collect(self, futures) -> None:
+        for future in futures:
+            batch = self._pending.pop(future)
+            ids = [chunk_id for _, chunk_id, _ in batch]
+            try:
+                vectors = future.result()
+                upsert_embedded(self.collection, ids, vectors, [d for d, _, _ in batch])
+                ok = True
+            except Exception as e:
+                logging.error("Embedding batch of %d chunks failed: %s", len(batch), e)
+                self.failed_ids.update(ids)
+                ok = False
+            else:
+                self.stored += len(batch)
+                elapsed = time.perf_counter() - self._start_time
+                logging.info("Embedded %d chunks (%.1f chunks/sec)", self.stored, self.stored / elapsed if elapsed else 0.0)
+
+            for _, _, key in batch:
+                if key is not None:
+                    self._chunk_done(key, ok)
+
+    def _chunk_done(self, key: str, ok: bool) -> None:
+        state = self._files[key]
+        state[0] -= 1
+        state[1] = state[1] or not ok
+        if state[0] == 0:
+            del self._files[key]
+            if self.on_file_done:
+                self.on_file_done(key, not state[1])
+
+    def add(self, docs: List, ids: List[str], key: Optional[str] = None) -> None:
+        """送入一批chunks；指定 key 时这些chunks作为一个文件跟踪完成情况"""
+        if key is not None:
+            if not ids:
+                if self.on_file_done:
+                    self.on_file_done(key, True)
+                return
+            self._files[key] = [len(ids), False]
+        for doc, chunk_id in zip(docs, ids):
+            self._buffer.append((doc, chunk_id, key))
+            if len(self._buffer) >= self.batch_size:
+                self._dispatch()
+
+    def close(self) -> None:
+        if self._buffer:
+            self._dispatch()
+        while self._pending:
+            done, _ = wait(list(self._pending), return_when=FIRST_COMPLETED)
+            self._collect(done)
+        self._executor.shutdown()
+
+
 def main() -> None:
     load_dotenv()
     setup_logging()
@@ -87,59 +406,95 @@ def main() -> None:
     config = get_rag_config()
     
     docs_dir = Path(config.get_docs_dir())
+    store_dir = config.get_store_dir()
     chunk_config = config.get_chunk_config()
     chunk_size = chunk_config["chunk_size"]
     chunk_overlap = chunk_config["chunk_overlap"]
+    rebuild = "--rebuild" in sys.argv[1:]
 
-    logging.info("Docs dir: %s | Store dir: %s", docs_dir, config.get_store_dir())
-    raw_docs = load_all_documents(docs_dir)
-    if not raw_docs:
-        logging.warning("No documents loaded. Put files into %s", docs_dir)
+    logging.info("Docs dir: %s | Store dir: %s", docs_dir, store_dir)
+    if not docs_dir.exists():
+        logging.warning("Docs directory does not exist: %s", docs_dir)
         return
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        add_start_index=True,
-    )
-    splits = splitter.split_documents(raw_docs)
-
-    # Add stable chunk ids for citation
-    for idx, d in enumerate(splits):
-        d.metadata = d.metadata or {}
-        d.metadata.setdefault("source", d.metadata.get("source", "unknown"))
-        d.metadata["chunk_id"] = idx  # used in citation when page missing
-
     embeddings = build_embeddings()
 
-    # 使用配置类
-    from config import get_rag_config
-    config = get_rag_config()
-    
     # Create / update Chroma collection
     vectordb = Chroma(
         collection_name=config.get_collection_name(),
         embedding_function=embeddings,
-        persist_directory=config.get_store_dir(),
+        persist_directory=store_dir,
     )
 
-    # Clear and re-ingest for simplicity
+    manifest, lexical_index = open_index_state(vectordb, store_dir, rebuild)
+
+    backend_config = config.get_vector_backend_config()
+    export_numpy = backend_config["backend"] == "numpy"
+
+    changed, removed = plan_changes(docs_dir, manifest)
+    if not changed and not removed:
+        lexical_index.save(store_dir)
+        if export_numpy and not Path(backend_config["numpy_index_dir"]).exists():
+            export_chroma_to_numpy(vectordb, backend_config["numpy_index_dir"], backend_config["numpy_dtype"])
+        save_manifest(store_dir, manifest)
+        logging.info("Index is up to date (%d files).", len(manifest))
+        return
+
+    deletes = DeferredDeletes(vectordb)
+    remove_deleted_files(deletes, lexical_index, manifest, removed)
+
+    # 已送入嵌入、尚未全部写入的文件；文件收尾后即丢弃其文本，内存只与在途批次有关
+    in_flight: Dict[str, Tuple[Dict, List[str], List[str]]] = {}
+
+    def on_file_done(rel_path: str, ok: bool) -> None:
+        file_info, ids, texts = in_flight.pop(rel_path)
+        if not ok:
+            logging.warning("Some chunks of %s failed to embed; it will be retried on the next run", rel_path)
+            return
+        record_indexed_file(deletes, lexical_index, manifest, rel_path, file_info, ids, texts)
+
+    embed_config = config.get_ingest_config()
+    pipeline = EmbeddingPipeline(
+        open_collection(store_dir, config.get_collection_name()),
+        embeddings,
+        batch_size=embed_config["embed_batch_size"],
+        workers=embed_config["embed_workers"],
+        max_retries=embed_config["embed_max_retries"],
+        on_file_done=on_file_done,
+    )
+
+    # 加载/切分与嵌入流水线化：文件在进程池中并行解析，完成一个就送入嵌入阶段
+    file_infos = {rel_path: file_info for _, rel_path, file_info in changed}
+    tasks = ((path, rel_path, chunk_size, chunk_overlap) for path, rel_path, _ in changed)
+    # 只有PDF解析值得付出进程池的启动开销，纯文本用线程池即可
+    use_processes = embed_config["load_in_processes"] and any(path.suffix.lower() == ".pdf" for path, _, _ in changed)
+    total_chunks = 0
     try:
-        ids = [str(uuid.uuid4()) for _ in splits]
-        vectordb.delete_collection()  # type: ignore[attr-defined]
-        logging.info("Recreated Chroma collection.")
-        vectordb = Chroma(
-            collection_name=config.get_collection_name(),
-            embedding_function=embeddings,
-            persist_directory=config.get_store_dir(),
-        )
-    except Exception:
-        # Fallback: if delete_collection not available
-        logging.info("Proceeding without collection reset.")
-        ids = [str(uuid.uuid4()) for _ in splits]
+        for item, result, error in iter_parallel(split_file, tasks, embed_config["load_workers"], use_processes):
+            path, rel_path = item[0], item[1]
+            if error is not None:
+                logging.error("Failed to load %s: %s", path, error)
+                continue
+            splits, ids = result
+            in_flight[rel_path] = (file_infos[rel_path], ids, [d.page_content for d in splits])
+            pipeline.add(splits, ids, key=rel_path)
+            total_chunks += len(splits)
+    finally:
+        pipeline.close()
 
-    vectordb.add_documents(splits, ids=ids)
-    logging.info("Ingestion complete: %d chunks.", len(splits))
+    # 旧chunks在新chunks全部写入后才删除，随后立即更新语料版本戳，让运行中的服务重新打开向量库
+    deleted = deletes.flush()
+    save_manifest(store_dir, manifest)
+    lexical_index.save(store_dir)
+    if export_numpy:
+        # Chroma仍是入库的主存储，NumPy索引从中整体导出（无需重新嵌入）
+        export_chroma_to_numpy(vectordb, backend_config["numpy_index_dir"], backend_config["numpy_dtype"])
+    # 更新语料版本戳，使回答缓存失效，运行中的服务据此重新加载索引
+    write_corpus_version(store_dir)
+    logging.info(
+        "Ingestion complete: %d changed files (%d chunks), %d removed files, %d stale chunks deleted.",
+        len(changed), total_chunks, len(removed), deleted,
+    )
 
 
 if __name__ == "__main__":
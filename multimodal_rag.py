@@ -5,10 +5,11 @@ import os
 import sys
 import time
 import logging
-from typing import List, Dict
+from typing import Dict
 
 from dotenv import load_dotenv
-from rag_chain import build_chain
+from rag_chain import build_chain_with_docs, build_sources
+from conversation_memory import build_conversation_memory
 from voice_interface import VoiceInterface, GummySTT, Qwen3TTSRealtime
 
 # 设置API Key
@@ -23,7 +24,7 @@ class MultimodalRAG:
         
         # 初始化RAG系统
         print("🔄 正在初始化RAG系统...")
-        self.chain, self.retriever = build_chain()
+        self.chain, self.retriever = build_chain_with_docs()
         print("✅ RAG系统初始化完成！")
         
         # 初始化语音系统 - 程序员可以在这里选择模型
@@ -34,7 +35,7 @@ class MultimodalRAG:
         # 配置
         self.auto_tts = os.getenv("AUTO_TTS", "true").lower() == "true"
         self.record_duration = int(os.getenv("RECORD_DURATION", "5"))
-        self.chat_history: List[str] = []
+        self.memory = build_conversation_memory()
         self.current_input_mode = "text"  # 跟踪当前输入方式
     
     def setup_logging(self):
@@ -83,7 +84,7 @@ class MultimodalRAG:
         
         # 第一步：向量检索
         t_retrieval_start = time.perf_counter()
-        docs = self.retriever.invoke(question)
+        docs = self.retriever.invoke(self.memory.rewrite_question(question))
         t_retrieval_end = time.perf_counter()
         
         if not docs:
@@ -101,7 +102,8 @@ class MultimodalRAG:
         print(f"✅ 检索到 {len(docs)} 个相关文档片段")
         print("🔄 正在生成回答...")
         
-        # 第二步：LLM流式生成回答
+        # 第二步：LLM流式生成回答，语音输入时边生成边朗读
+        speech = self.voice.start_speech_stream() if self.current_input_mode == "voice" else None
         t_generation_start = time.perf_counter()
         first_token_time = None
         answer = ""
@@ -109,19 +111,27 @@ class MultimodalRAG:
         print("🤖 AI回答: ", end="", flush=True)
         
         # 使用流式输出
-        for chunk in self.chain.stream({
+        tokens = self.chain.stream({
             "question": question, 
-            "chat_history": "\n".join(self.chat_history)
-        }):
-            if first_token_time is None:
-                first_token_time = time.perf_counter()
-                first_token_latency = (first_token_time - t_generation_start) * 1000.0
-                print(f"\n⚡ 首token延迟: {first_token_latency:.1f}ms")
-                print("🤖 AI回答: ", end="", flush=True)
-            
-            # 打印流式内容
-            print(chunk, end="", flush=True)
-            answer += chunk
+            "chat_history": self.memory.render(),
+            "docs": docs
+        })
+        try:
+            for chunk in (speech.tee(tokens) if speech else tokens):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                    first_token_latency = (first_token_time - t_generation_start) * 1000.0
+                    print(f"\n⚡ 首token延迟: {first_token_latency:.1f}ms")
+                    print("🤖 AI回答: ", end="", flush=True)
+                
+                # 打印流式内容
+                print(chunk, end="", flush=True)
+                answer += chunk
+        except BaseException:
+            # 生成中途出错时结束朗读，归还TTS连接
+            if speech:
+                speech.cancel()
+            raise
         
         t_generation_end = time.perf_counter()
         print()  # 换行
@@ -130,13 +140,7 @@ class MultimodalRAG:
         chinese_count = sum(1 for ch in answer if "\u4e00" <= ch <= "\u9fff")
         
         # 准备引用信息
-        sources = []
-        for d in docs:
-            source = d.metadata.get("source", "unknown")
-            page = d.metadata.get("page")
-            chunk_id = d.metadata.get("chunk_id")
-            locator = f"page {page}" if page is not None else f"chunk {chunk_id}"
-            sources.append({"source": source, "locator": locator})
+        sources = build_sources(docs)
         
         # 性能统计
         first_token_latency = (first_token_time - t_generation_start) * 1000.0 if first_token_time else 0
@@ -151,7 +155,8 @@ class MultimodalRAG:
         return {
             "answer": answer,
             "sources": sources,
-            "performance": performance
+            "performance": performance,
+            "speech": speech
         }
     
     def display_result(self, result: Dict):
@@ -176,10 +181,11 @@ class MultimodalRAG:
             for i, s in enumerate(sources, 1):
                 print(f"{i}. {s['source']} ({s['locator']})")
         
-        # 根据输入方式决定是否播放语音
-        if self.current_input_mode == "voice" and answer.strip():
+        # 根据输入方式决定是否播放语音；流式生成时已边生成边朗读，这里等待朗读结束
+        speech = result.get("speech")
+        if speech is not None or (self.current_input_mode == "voice" and answer.strip()):
             print("\n🔊 正在流式播放回答...")
-            tts_result = self.voice.text_to_voice_streaming(answer)
+            tts_result = speech.finish() if speech is not None else self.voice.text_to_voice_streaming(answer)
             
             # 显示语音性能统计
             if tts_result and "performance" in tts_result:
@@ -206,8 +212,7 @@ class MultimodalRAG:
         self.display_result(result)
         
         # 更新聊天历史
-        self.chat_history.append(f"用户: {question}")
-        self.chat_history.append("助手: [上一轮回答略]")
+        self.memory.add_turn(question, result["answer"])
     
     def run(self):
         """运行多模态RAG系统"""
@@ -0,0 +1,161 @@
+"""
+NumPy内存映射向量库 - 小语料下替代Chroma的进程内向量索引
+归一化后的嵌入存为 float16/float32 的 .npy 矩阵，启动时内存映射，
+元数据存在旁边的JSON文件；top-k检索是一次矩阵乘法加 argpartition，结果精确
+多个工作进程可以共享同一个内存映射矩阵
+每次导出写入一个新的版本目录，写完后原子替换 CURRENT 指针文件，读者总是看到成对的矩阵和元数据
+"""
+import os
+import json
+import time
+import shutil
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+MATRIX_FILE = "embeddings.npy"
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+KEEP_VERSIONS = 2  # 保留当前和上一个版本，正在加载旧版本的读者不受影响
+
+
+def _current_version_dir(index_dir: str) -> Optional[Path]:
+    """CURRENT 指向的版本目录；还没有导出过索引时返回 None"""
+    pointer = Path(index_dir, CURRENT_FILE)
+    if not pointer.exists():
+        return None
+    return Path(index_dir, pointer.read_text(encoding="utf-8").strip())
+
+
+def write_numpy_index(
+    index_dir: str,
+    ids: List[str],
+    vectors,
+    texts: List[str],
+    metadatas: List[dict],
+    dtype: str = "float32",
+) -> None:
+    """写入归一化嵌入矩阵和元数据：先写完整的新版本目录，再原子替换 CURRENT 指针"""
+    os.makedirs(index_dir, exist_ok=True)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(ids), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = (matrix / norms).astype(dtype)
+
+    version = f"v{time.time_ns()}"
+    version_dir = Path(index_dir, version)
+    version_dir.mkdir()
+    with open(version_dir / MATRIX_FILE, "wb") as f:
+        np.save(f, matrix)
+    (version_dir / META_FILE).write_text(
+        json.dumps({"ids": ids, "texts": texts, "metadatas": metadatas}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+
+    pointer = Path(index_dir, CURRENT_FILE)
+    tmp_pointer = pointer.with_suffix(".tmp")
+    tmp_pointer.write_text(version, encoding="utf-8")
+    os.replace(tmp_pointer, pointer)
+
+    # 清理更早的版本
+    versions = sorted((p for p in Path(index_dir).iterdir() if p.is_dir() and p.name.startswith("v")), key=lambda p: int(p.name[1:]))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def export_chroma_to_numpy(vectordb, index_dir: str, dtype: str = "float32") -> int:
+    """把Chroma集合导出为NumPy索引，返回chunk数"""
+    data = vectordb.get(include=["embeddings", "documents", "metadatas"])
+    ids = list(data["ids"])
+    if not ids:
+        logging.warning("Chroma collection is empty, skipping NumPy index export")
+        return 0
+    write_numpy_index(index_dir, ids, data["embeddings"], list(data["documents"]), list(data["metadatas"]), dtype)
+    logging.info("Exported %d chunks to NumPy index at %s", len(ids), index_dir)
+    return len(ids)
+
+
+class NumpyVectorStore(VectorStore):
+    """只读的内存映射向量库，接口与 langchain VectorStore 一致"""
+
+    def __init__(self, embedding: Embeddings, matrix: np.ndarray, ids: List[str], texts: List[str], metadatas: List[dict]):
+        self._embedding = embedding
+        self.matrix = matrix
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self._rows: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def load(cls, index_dir: str, embedding: Embeddings) -> Optional["NumpyVectorStore"]:
+        version_dir = _current_version_dir(index_dir)
+        if version_dir is None:
+            return None
+        matrix_path = version_dir / MATRIX_FILE
+        meta_path = version_dir / META_FILE
+        if not matrix_path.exists() or not meta_path.exists():
+            return None
+        matrix = np.load(matrix_path, mmap_mode="r")
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        logging.info("Memory-mapped NumPy index: %d x %d (%s)", matrix.shape[0], matrix.shape[1], matrix.dtype)
+        return cls(embedding, matrix, meta["ids"], meta["texts"], meta["metadatas"])
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _top_k(self, query_vector: List[float], k: int) -> List[Tuple[int, float]]:
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query /= norm
+        # float16 矩阵会在这里提升为 float32 计算（NumPy 没有 float16 的 BLAS 路径）
+        scores = self.matrix @ query
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def _to_document(self, i: int) -> Document:
+        return Document(id=self.ids[i], page_content=self.texts[i], metadata=dict(self.metadatas[i] or {}))
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        if self._rows is None:
+            self._rows = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        return [self._to_document(self._rows[chunk_id]) for chunk_id in ids if chunk_id in self._rows]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [self._to_document(i) for i, _ in self._top_k(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return [(self._to_document(i), score) for i, score in self._top_k(self._embedding.embed_query(query), k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # 余弦相似度本身就在 [-1, 1]，映射到 [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        """不支持：索引是只读的内存映射快照，入库时由 ingest.py 从Chroma整体导出（write_numpy_index）"""
+        raise TypeError("NumpyVectorStore is read-only; rebuild it with ingest.py")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any):
+        texts = list(texts)
+        ids = kwargs.get("ids") or [str(i) for i in range(len(texts))]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return cls(embedding, vectors, ids, texts, metadatas)
@@ -1,6 +1,6 @@
 import os
 import logging
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 from operator import itemgetter
 
 from dotenv import load_dotenv
@@ -9,8 +9,15 @@ from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_ollama import OllamaEmbeddings, ChatOllama
 from langchain_openai import ChatOpenAI
 
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from embedding_cache import CachedEmbeddings
+from answer_cache import CorpusVersionWatcher
+from hybrid_retriever import BM25Index, CorpusReloadingRetriever, HybridRetriever
+from numpy_store import NumpyVectorStore
+from reranker import CrossEncoderReranker, RerankingRetriever
+from context_builder import pack_context
+from prompts import build_prompt
+
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 
 
@@ -20,12 +27,24 @@ def setup_logging() -> None:
 
 
 def build_embeddings():
+    from config import get_rag_config
+
     backend = os.getenv("EMBEDDING_BACKEND", "ollama").strip().lower()
     model_name = os.getenv("EMBEDDING_MODEL", "qwen3-embedding:0.6b")
     if backend == "ollama":
         base_url = os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434"
-        return OllamaEmbeddings(model=model_name, base_url=base_url)
-    return HuggingFaceEmbeddings(model_name=model_name)
+        embeddings = OllamaEmbeddings(model=model_name, base_url=base_url)
+    else:
+        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+
+    # 查询嵌入缓存：重复的问题不再重新计算嵌入
+    embedding_config = get_rag_config().get_embedding_config()
+    return CachedEmbeddings(
+        embeddings,
+        model_name=f"{backend}:{model_name}",
+        max_size=embedding_config["cache_size"],
+        cache_dir=embedding_config["cache_dir"],
+    )
 
 
 def build_llm():
@@ -37,38 +56,145 @@ def build_llm():
         base_url = os.getenv("OPENAI_BASE_URL") or None
         return ChatOpenAI(model=model, temperature=temperature, base_url=base_url)
     else:
+        from config import get_rag_config
+
         model = os.getenv("OLLAMA_MODEL", "qwen2.5:3b")
         base_url = os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434"
-        model_kwargs={"num_predict": 512, "keep_alive": "30m"}
-        return ChatOllama(model=model, temperature=temperature, base_url=base_url, model_kwargs=model_kwargs)
+        llm_config = get_rag_config().get_llm_config()
+        # 固定前缀模式：模型常驻内存(keep_alive=-1)且 num_ctx 固定，Ollama 才能复用静态提示词前缀的KV缓存
+        keep_alive = -1 if llm_config["pin_prompt_prefix"] else llm_config["ollama_keep_alive"]
+        return ChatOllama(
+            model=model,
+            temperature=temperature,
+            base_url=base_url,
+            num_predict=512,
+            num_ctx=llm_config["ollama_num_ctx"],
+            keep_alive=keep_alive,
+        )
 
 
-def load_retriever():
+def load_vectorstore(embeddings=None):
     from config import get_rag_config
-    
-    embeddings = build_embeddings()
+
+    if embeddings is None:
+        embeddings = build_embeddings()
     config = get_rag_config()
-    
-    vectordb = Chroma(
+
+    backend_config = config.get_vector_backend_config()
+    if backend_config["backend"] == "numpy":
+        vectordb = NumpyVectorStore.load(backend_config["numpy_index_dir"], embeddings)
+        if vectordb is not None:
+            return vectordb
+        logging.warning("No NumPy index found, falling back to Chroma. Run ingest.py to build it.")
+
+    return Chroma(
         collection_name=config.get_collection_name(),
         embedding_function=embeddings,
         persist_directory=config.get_store_dir(),
     )
-    k = config.get_retrieval_config()["top_k"]
-    return vectordb.as_retriever(search_kwargs={"k": k})
+
+
+def clear_chroma_system_cache() -> None:
+    """chromadb按路径缓存System，同一进程里即使新建客户端，query() 也看不到其他进程（ingest.py）
+    后来写入/删除的数据，被删除的chunk会以空正文返回；清掉缓存后新打开的客户端才能读到最新的库"""
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:  # chromadb < 1.0
+        from chromadb.api.client import SharedSystemClient
+
+    SharedSystemClient.clear_system_cache()
+
+
+def load_retriever(vectordb=None, on_reload: Optional[Callable[[object], None]] = None):
+    """on_reload(vectordb): 重新入库后换上新向量库时回调（在检索器的重建锁内调用）"""
+    from config import get_rag_config
+
+    if vectordb is None:
+        vectordb = load_vectorstore()
+    config = get_rag_config()
+    retrieval_config = config.get_retrieval_config()
+    rerank_config = config.get_rerank_config()
+    k = retrieval_config["top_k"]
+
+    reranker = None
+    if rerank_config["enabled"]:
+        try:
+            reranker = CrossEncoderReranker(rerank_config["model"])
+        except Exception as e:
+            logging.error("Failed to load reranker, continuing without it: %s", e)
+
+    # 启用重排时先多取候选，再由cross-encoder挑出最好的k个
+    fetch_k = max(k, rerank_config["candidates"]) if reranker is not None else k
+
+    def build_base(db):
+        if retrieval_config["mode"] == "hybrid":
+            lexical_index = BM25Index.load(config.get_store_dir())
+            if lexical_index is not None:
+                return HybridRetriever(
+                    vectordb=db,
+                    lexical_index=lexical_index,
+                    k=fetch_k,
+                    vector_k=max(retrieval_config["vector_top_k"], fetch_k - retrieval_config["lexical_top_k"]),
+                    lexical_k=retrieval_config["lexical_top_k"],
+                    rrf_k=retrieval_config["rrf_k"],
+                )
+            logging.warning("No lexical index found, falling back to vector retrieval. Run ingest.py to build it.")
+        return db.as_retriever(search_kwargs={"k": fetch_k})
+
+    def rebuild():
+        # NumPy索引是加载时的快照，按CURRENT指针重新映射；Chroma丢掉缓存的System后重新打开
+        clear_chroma_system_cache()
+        db = load_vectorstore(vectordb.embeddings)
+        if on_reload is not None:
+            on_reload(db)
+        return build_base(db)
+
+    # 重新入库会更新语料版本戳，检索器据此重新加载BM25索引并重新打开向量库，无需重启服务
+    retriever = CorpusReloadingRetriever(
+        retriever=build_base(vectordb),
+        build=rebuild,
+        watcher=CorpusVersionWatcher(config.get_store_dir()),
+    )
+
+    if reranker is not None:
+        return RerankingRetriever(
+            base_retriever=retriever,
+            reranker=reranker,
+            k=k,
+            time_budget_ms=rerank_config["budget_ms"],
+        )
+    return retriever
+
+
+def pack_docs(docs: List) -> List:
+    """去重、合并相邻chunk并按token预算打包；提示词和引用都基于这份结果"""
+    from config import get_rag_config
+
+    return pack_context(docs, **get_rag_config().get_context_config())
+
+
+def segment_locator(d) -> str:
+    page = d.metadata.get("page")
+    chunk_ids = [c for c in d.metadata.get("chunk_ids", []) if c is not None]
+    chunk_id = f"{min(chunk_ids)}-{max(chunk_ids)}" if len(chunk_ids) > 1 else d.metadata.get("chunk_id")
+    return f"page {page}" if page is not None else f"chunk {chunk_id}"
 
 
 def format_docs_for_prompt(docs: List) -> str:
     chunks = []
-    for d in docs:
-        source = d.metadata.get("source", "unknown")
-        page = d.metadata.get("page")
-        chunk_id = d.metadata.get("chunk_id")
-        locator = f"page {page}" if page is not None else f"chunk {chunk_id}"
-        chunks.append(f"[{source} | {locator}]\n{d.page_content}")
+    for d in pack_docs(docs):
+        chunks.append(f"[{d.metadata.get('source', 'unknown')} | {segment_locator(d)}]\n{d.page_content}")
     return "\n\n---\n\n".join(chunks)
 
 
+def build_sources(docs: List) -> List[Dict[str, str]]:
+    """引用只列出实际放进提示词的片段（与 format_docs_for_prompt 的打包结果一致）"""
+    sources = []
+    for d in pack_docs(docs):
+        sources.append({"source": d.metadata.get("source", "unknown"), "locator": segment_locator(d)})
+    return sources
+
+
 def build_chain():
     """
     Build minimal LCEL pipeline with optional chat history:
@@ -79,41 +205,7 @@ def build_chain():
 
     retriever = load_retriever()
     llm = build_llm()
-
-    system_template = (
-        "你是一个熟悉湖北省武汉市和湖北博物馆的历史文化、美食、旅游、风土人情的知识助手，能够结合提供的文档内容和自身知识进行自然、准确的快速地回答，注意一定要严格按照提问者的要求进行回答，且不要进行思考。/no_think\n\n"
-        "你的任务是：\n"
-        "- 优先参考我提供的文档内容（即上下文）回答问题；\n"
-        "- 如果文档信息不足或缺失，可以适当补充你自身掌握的可靠知识，回答的内容不要过少；\n"
-        "- **严格按照用户要求的字数或长度进行回答**，如果用户指定了字数（如'200字'、'500字'、'简短回答'等），请严格控制输出长度；\n"
-        "- **不要输出任何思考过程、解释、格式说明或AI语气的语句**；\n"
-        "- **直接输出自然、口语化的中文回答正文**，像一个知识丰富的当地人那样娓娓道来。\n"
-        "- **请务必保证措辞合理、逻辑通顺、语义信息完整**。\n\n"
-        "字数控制要求：\n"
-        "- 如果用户要求'200字'，回答应控制在180-220字之间；\n"
-        "- 如果用户要求'500字'，回答应控制在450-550字之间；\n"
-        "- 如果用户要求'a字'，回答应控制在0.9a-1.1a字之间；\n"
-        "- 如果用户要求'简短'或'简要'，回答应控制在100字以内；\n"
-        "- 如果用户要求'详细'，回答可以适当展开到300-500字；\n"
-        "- 如果没有明确字数要求，回答控制在150-300字之间。\n\n"
-        "对话上下文（可能为空）：\n{chat_history}\n\n"
-        "现在请根据以下背景资料回答用户的问题：\n"
-        "{context}"
-    )
-    # "你是武汉文化助手，根据文档内容回答问题。\n"
-    #     "要求：\n"
-    #     "- 参考文档内容回答\n"
-    #     "- 控制字数：200字=180-220字，500字=450-550字，简短=100字内\n"
-    #     "- 直接输出回答，不要思考过程\n\n"
-    #     "上下文：\n{chat_history}\n\n"
-    #     "文档：\n{context}\n\n"
-    #     "问题：{question}"
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_template),
-            ("human", "{question}"),
-        ]
-    )
+    prompt = build_prompt()
 
     # 仅将 question 路由给 retriever，避免把整个 dict 传进去
     chain = (
@@ -129,51 +221,42 @@ def build_chain():
 
     return chain, retriever
 
+
+def build_chain_with_docs():
+    """
+    Build LCEL pipeline that takes pre-retrieved documents, so each question
+    costs exactly one embedding and one vector search:
+    inputs: {"question": str, "chat_history": str, "docs": List[Document]}
+    """
+    load_dotenv()
+    setup_logging()
+
+    retriever = load_retriever()
+    llm = build_llm()
+
+    chain = (
+        {
+            "context": itemgetter("docs") | RunnableLambda(format_docs_for_prompt),
+            "question": itemgetter("question"),
+            "chat_history": itemgetter("chat_history"),
+        }
+        | build_prompt()
+        | llm
+        | StrOutputParser()
+    )
+
+    return chain, retriever
+
+
 # 在 rag_chain.py 里加一个
 def build_generation_chain_only():
     load_dotenv(); setup_logging()
     llm = build_llm()
-    system_template = (
-        "你是一个熟悉湖北省武汉市和湖北博物馆的历史文化、美食、旅游、风土人情的知识助手，能够结合提供的文档内容和自身知识进行自然、准确的快速地回答，注意一定要严格按照提问者的要求进行回答，且不要进行思考。/no_think\n\n"
-        "你的任务是：\n"
-        "- 优先参考我提供的文档内容（即上下文）回答问题；\n"
-        "- 如果文档信息不足或缺失，可以适当补充你自身掌握的可靠知识，回答的内容不要过少；\n"
-        "- **严格按照用户要求的字数或长度进行回答**，如果用户指定了字数（如'200字'、'500字'、'简短回答'等），请严格控制输出长度；\n"
-        "- **不要输出任何思考过程、解释、格式说明或AI语气的语句**；\n"
-        "- **直接输出自然、口语化的中文回答正文**，像一个知识丰富的当地人那样娓娓道来。\n"
-        "- **请务必保证措辞合理、逻辑通顺、语义信息完整**。\n\n"
-        "字数控制要求：\n"
-        "- 如果用户要求'200字'，回答应控制在180-220字之间；\n"
-        "- 如果用户要求'500字'，回答应控制在450-550字之间；\n"
-        "- 如果用户要求'a字'，回答应控制在0.9a-1.1a字之间；\n"
-        "- 如果用户要求'简短'或'简要'，回答应控制在100字以内；\n"
-        "- 如果用户要求'详细'，回答可以适当展开到300-500字；\n"
-        "- 如果没有明确字数要求，回答控制在150-300字之间。\n\n"
-        "对话上下文（可能为空）：\n{chat_history}\n\n"
-        "现在请根据以下背景资料回答用户的问题：\n"
-        "{context}"
-    )
-    prompt = ChatPromptTemplate.from_messages(
-        [("system", system_template), ("human", "{question}")]
-    )
-    return prompt | llm | StrOutputParser()
+    return build_prompt() | llm | StrOutputParser()
 
 
 def answer_question(question: str) -> Dict:
-    gen_chain = build_generation_chain_only()
-    retriever = load_retriever()
-    docs = retriever.invoke(question)
-    if not docs:
-        return {"answer": "抱歉，未检索到相关内容。", "sources": []}
-
-    context = format_docs_for_prompt(docs)
-    answer = gen_chain.invoke({"question": question, "chat_history": "", "context": context})
+    """复用进程级RAG引擎回答问题，避免每次调用都重建嵌入模型、向量库和LLM客户端"""
+    from rag_engine import get_rag_engine
 
-    sources = []
-    for d in docs:
-        source = d.metadata.get("source", "unknown")
-        page = d.metadata.get("page")
-        chunk_id = d.metadata.get("chunk_id")
-        locator = f"page {page}" if page is not None else f"chunk {chunk_id}"
-        sources.append({"source": source, "locator": locator})
-    return {"answer": answer, "sources": sources}
+    return get_rag_engine().answer(question)
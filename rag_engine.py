@@ -0,0 +1,129 @@
+"""
+常驻RAG引擎 - 进程启动时构建一次，所有请求复用
+持有嵌入模型、向量库、提示词和LLM客户端，避免每次提问都重新加载
+"""
+import time
+import logging
+import threading
+from typing import AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.output_parsers import StrOutputParser
+
+from config import get_rag_config
+from answer_cache import AnswerCache
+from rag_chain import (
+    setup_logging,
+    build_embeddings,
+    build_llm,
+    build_prompt,
+    load_vectorstore,
+    load_retriever,
+    format_docs_for_prompt,
+    build_sources,
+)
+
+
+NO_RESULT_ANSWER = "抱歉，未检索到相关内容。"
+
+
+class RAGEngine:
+    """进程级RAG引擎"""
+
+    def __init__(self):
+        load_dotenv()
+        setup_logging()
+
+        t_start = time.perf_counter()
+        self.embeddings = build_embeddings()
+        self.vectordb = load_vectorstore(self.embeddings)
+        # 重新入库后检索器在重建锁内换上新打开的向量库
+        self.retriever = load_retriever(self.vectordb, on_reload=self._set_vectordb)
+        self.prompt = build_prompt()
+        self.llm = build_llm()
+        self.gen_chain = self.prompt | self.llm | StrOutputParser()
+
+        config = get_rag_config()
+        self.answer_cache = AnswerCache(
+            embeddings=self.embeddings,
+            store_dir=config.get_store_dir(),
+            **config.get_answer_cache_config(),
+        )
+
+        self.ready = False
+        self.warmup_stats: Dict[str, float] = {}
+        logging.info("RAG engine built in %.1f ms", (time.perf_counter() - t_start) * 1000.0)
+
+    def _set_vectordb(self, vectordb) -> None:
+        self.vectordb = vectordb
+
+    def warmup(self, question: str = "湖北省博物馆") -> Dict[str, float]:
+        """预热：触发嵌入模型、向量库和LLM的首次加载，完成后标记为就绪"""
+        stats: Dict[str, float] = {}
+        try:
+            t_start = time.perf_counter()
+            self.retriever.invoke(question)
+            stats["retrieval_ms"] = (time.perf_counter() - t_start) * 1000.0
+
+            # 用真实的提示词结构预热，让Ollama缓存静态前缀的KV；只需处理完提示词，生成1个token即可
+            t_start = time.perf_counter()
+            warmup_llm = self.llm.model_copy(update={"num_predict" if hasattr(self.llm, "num_predict") else "max_tokens": 1})
+            warmup_llm.invoke(self.prompt.format_messages(question="你好", chat_history="", context=""))
+            stats["llm_ms"] = (time.perf_counter() - t_start) * 1000.0
+        except Exception as e:
+            logging.exception("RAG engine warmup failed: %s", e)
+            self.ready = False
+            return stats
+
+        self.warmup_stats = stats
+        self.ready = True
+        logging.info("RAG engine warmed up: %s", stats)
+        return stats
+
+    def retrieve(self, question: str) -> List:
+        return self.retriever.invoke(question)
+
+    async def aretrieve(self, question: str) -> List:
+        return await self.retriever.ainvoke(question)
+
+    async def agenerate(self, question: str, docs: List, chat_history: str = "") -> str:
+        context = format_docs_for_prompt(docs)
+        return await self.gen_chain.ainvoke({"question": question, "chat_history": chat_history, "context": context})
+
+    async def astream_generate(self, question: str, docs: List, chat_history: str = "") -> AsyncIterator[str]:
+        context = format_docs_for_prompt(docs)
+        async for chunk in self.gen_chain.astream({"question": question, "chat_history": chat_history, "context": context}):
+            yield chunk
+
+    def answer(self, question: str, chat_history: str = "") -> Dict:
+        # 带对话上下文的回答依赖历史，不走缓存
+        if not chat_history:
+            cached = self.answer_cache.get(question)
+            if cached is not None:
+                return cached
+
+        docs = self.retrieve(question)
+        if not docs:
+            return {"answer": NO_RESULT_ANSWER, "sources": []}
+
+        context = format_docs_for_prompt(docs)
+        answer = self.gen_chain.invoke({"question": question, "chat_history": chat_history, "context": context})
+        result = {"answer": answer, "sources": build_sources(docs)}
+        if not chat_history:
+            self.answer_cache.put(question, result)
+        return result
+
+
+# 全局引擎实例
+_engine: Optional[RAGEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_rag_engine() -> RAGEngine:
+    """获取RAG引擎实例（首次调用时构建）"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RAGEngine()
+    return _engine
@@ -0,0 +1,89 @@
+"""
+交叉编码器重排 - 检索阶段多取候选，用本地cross-encoder一次性批量打分后保留最好的k个
+超过时间预算时退回原始检索顺序，重排永远不会拖慢回答
+"""
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from pydantic import ConfigDict, PrivateAttr
+
+# sentence-transformers导入
+try:
+    from sentence_transformers import CrossEncoder
+    CROSS_ENCODER_AVAILABLE = True
+except ImportError:
+    CROSS_ENCODER_AVAILABLE = False
+
+
+class CrossEncoderReranker:
+    """本地cross-encoder打分器（模型只加载一次）"""
+
+    def __init__(self, model_name: str = "BAAI/bge-reranker-base", max_length: int = 512, device: str = "cpu"):
+        if not CROSS_ENCODER_AVAILABLE:
+            raise ImportError("sentence-transformers not installed. Run: pip install sentence-transformers")
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, max_length=max_length, device=device)
+        logging.info("Cross-encoder reranker loaded: %s", model_name)
+
+    def score(self, query: str, docs: List[Document]) -> List[float]:
+        pairs = [(query, d.page_content) for d in docs]
+        return [float(s) for s in self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+
+
+class RerankingRetriever(BaseRetriever):
+    """先用基础检索器取候选，再重排保留前k个"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base_retriever: Any
+    reranker: Any
+    k: int = 4
+    time_budget_ms: float = 300
+
+    _executor: ThreadPoolExecutor = PrivateAttr(default_factory=lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank"))
+    # 并发查询在时间预算内排队等待工作线程；超时的打分任务无法中断，
+    # 它仍在运行时后续查询直接跳过重排，不在其后排队
+    _busy: threading.Semaphore = PrivateAttr(default_factory=lambda: threading.Semaphore(1))
+    _overrun: Optional[Future] = PrivateAttr(default=None)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        candidates = self.base_retriever.invoke(query)
+        if len(candidates) <= 1:
+            return candidates[:self.k]
+
+        overrun = self._overrun
+        if overrun is not None and not overrun.done():
+            logging.warning("Reranker still busy with a timed-out query, using retrieval order")
+            return candidates[:self.k]
+        t_start = time.perf_counter()
+        budget = self.time_budget_ms / 1000.0
+        if not self._busy.acquire(timeout=budget):
+            logging.warning("Reranker busy for the whole %.0f ms budget, using retrieval order", self.time_budget_ms)
+            return candidates[:self.k]
+        try:
+            future = self._executor.submit(self.reranker.score, query, candidates)
+        except Exception:
+            self._busy.release()
+            raise
+        future.add_done_callback(lambda _: self._busy.release())
+        try:
+            scores = future.result(timeout=max(0.0, budget - (time.perf_counter() - t_start)))
+        except FutureTimeoutError:
+            self._overrun = future
+            logging.warning("Rerank exceeded %.0f ms budget, using retrieval order", self.time_budget_ms)
+            return candidates[:self.k]
+        except Exception as e:
+            logging.error("Rerank failed, using retrieval order: %s", e)
+            return candidates[:self.k]
+
+        ranked = sorted(zip(candidates, scores), key=lambda item: item[1], reverse=True)[:self.k]
+        for doc, score in ranked:
+            doc.metadata["rerank_score"] = score
+        logging.debug("Reranked %d candidates in %.1f ms", len(candidates), (time.perf_counter() - t_start) * 1000.0)
+        return [doc for doc, _ in ranked]
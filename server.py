@@ -1,26 +1,312 @@
-from typing import Dict, List
-from fastapi import FastAPI
+import json
+import time
+import uuid
+import asyncio
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from rag_chain import answer_question
+from config import get_rag_config
+from rag_chain import build_sources
+from rag_engine import get_rag_engine, NO_RESULT_ANSWER
+from conversation_memory import ConversationMemory
+from session_store import build_session_store
+
+
+class GenerationLimiter:
+    """限制同时进行的LLM生成数，超出的请求排队等待，队列满或等待超时时拒绝"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, timeout: float):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.waiting = 0
+        self.active = 0
+
+    def _reject(self, detail: str) -> HTTPException:
+        return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(max(1, int(self.timeout)))})
+
+    def admit(self) -> None:
+        """队列已满时抛出503；不占用名额，用于在开始发送流式响应之前先做准入检查"""
+        if self.waiting + self.active >= self.max_concurrency + self.max_queue:
+            raise self._reject("Generation queue is full")
+
+    @asynccontextmanager
+    async def slot(self):
+        # 在任何await之前按计数决定是否接纳，同一轮事件循环里到达的突发请求也受限
+        self.admit()
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise self._reject("Timed out waiting for a generation slot")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def try_slot(self):
+        """有空闲名额时立即占用并产出True，否则产出False；不排队，用于可以推迟的后台任务"""
+        if self._semaphore.locked():
+            yield False
+            return
+        await self._semaphore.acquire()
+        self.active += 1
+        try:
+            yield True
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
 
-app = FastAPI(title="Minimal RAG API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时构建一次RAG引擎并预热，之后所有请求复用
+    engine = await asyncio.to_thread(get_rag_engine)
+    await asyncio.to_thread(engine.warmup)
+    app.state.engine = engine
+
+    server_config = get_rag_config().get_server_config()
+    app.state.limiter = GenerationLimiter(
+        max_concurrency=server_config["max_concurrent_generations"],
+        max_queue=server_config["max_queue_size"],
+        timeout=server_config["queue_timeout"],
+    )
+    app.state.sessions = build_session_store()
+    app.state.summary_tasks = set()
+    yield
+
+
+app = FastAPI(title="Minimal RAG API", version="0.1.0", lifespan=lifespan)
 
 
 class AskRequest(BaseModel):
     question: str
+    session_id: Optional[str] = None
 
 
 class AskResponse(BaseModel):
     answer: str
     sources: List[Dict[str, str]]
+    session_id: str
+
+
+def load_session(session_id: Optional[str]) -> ConversationMemory:
+    """取出会话对应的对话记忆；没有或已过期时返回空记忆
+    摘要不在后台线程里自动进行，而是由 summarize_session 占用生成名额后执行"""
+    memory = ConversationMemory(llm=app.state.engine.llm, background_summary=False, **get_rag_config().get_memory_config())
+    if session_id:
+        state = app.state.sessions.get(session_id)
+        if state is not None:
+            memory.load_dict(state)
+    return memory
+
+
+async def rewrite_query(memory: ConversationMemory, question: str) -> str:
+    """追问改写；需要调用LLM时与回答生成共用并发名额"""
+    if memory.rewrite_with_llm and memory.is_follow_up(question):
+        async with app.state.limiter.slot():
+            return await asyncio.to_thread(memory.rewrite_question, question)
+    return await asyncio.to_thread(memory.rewrite_question, question)
+
+
+async def summarize_session(session_id: str, memory: ConversationMemory) -> None:
+    """有空闲生成名额时概括旧轮次后再保存一次；没有空闲名额时立即跳过（不与访客请求排队），
+    未概括的轮次随会话保存，下一轮再概括"""
+    async with app.state.limiter.try_slot() as acquired:
+        if not acquired:
+            return
+        await asyncio.to_thread(memory.summarize_pending)
+    # 期间同一会话已有新的轮次时不覆盖
+    current = await asyncio.to_thread(app.state.sessions.get, session_id)
+    if current is not None and current.get("turns") == [list(t) for t in memory.turns]:
+        await asyncio.to_thread(app.state.sessions.save, session_id, memory.to_dict())
+
+
+async def save_session(session_id: str, memory: ConversationMemory, question: str, answer: str) -> None:
+    """记录本轮对话并保存（SQLite写入可能等待锁，放到线程里执行）；有需要概括的旧轮次时另起任务概括"""
+    memory.add_turn(question, answer)
+    await asyncio.to_thread(app.state.sessions.save, session_id, memory.to_dict())
+    if memory.summarize and memory.has_pending_summary:
+        task = asyncio.get_running_loop().create_task(summarize_session(session_id, memory))
+        # 保留任务引用，避免在完成前被回收
+        app.state.summary_tasks.add(task)
+        task.add_done_callback(app.state.summary_tasks.discard)
+
+
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """
+    Readiness probe:
+    - 200 once the engine is built and warmed up
+    - 503 otherwise
+    """
+    engine = getattr(app.state, "engine", None)
+    is_ready = engine is not None and engine.ready
+    body = {"ready": is_ready, "warmup": engine.warmup_stats if engine is not None else {}}
+    limiter = getattr(app.state, "limiter", None)
+    if limiter is not None:
+        body["generations"] = {"active": limiter.active, "waiting": limiter.waiting}
+    if engine is not None:
+        body["answer_cache"] = engine.answer_cache.stats()
+    return JSONResponse(status_code=200 if is_ready else 503, content=body)
 
 
 @app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest) -> AskResponse:
+async def ask(req: AskRequest) -> AskResponse:
     """
     Simple RAG endpoint:
-    - Input: question
-    - Output: answer + citations
+    - Input: question (+ optional session_id to continue a conversation)
+    - Output: answer + citations + session_id
+    - 503 + Retry-After when the generation queue is full
+    """
+    engine = app.state.engine
+    session_id = req.session_id or uuid.uuid4().hex
+    memory = await asyncio.to_thread(load_session, req.session_id)
+    chat_history = memory.render()
+
+    # 只有没有对话历史时才能使用答案缓存
+    cached = None if chat_history else await asyncio.to_thread(engine.answer_cache.get, req.question)
+    if cached is not None:
+        answer, sources = cached["answer"], cached["sources"]
+    else:
+        query = await rewrite_query(memory, req.question)
+        docs = await engine.aretrieve(query)
+        if not docs:
+            # 没有检索结果也记入会话，返回的 session_id 之后可以继续使用
+            await save_session(session_id, memory, req.question, NO_RESULT_ANSWER)
+            return AskResponse(answer=NO_RESULT_ANSWER, sources=[], session_id=session_id)
+
+        async with app.state.limiter.slot():
+            answer = await engine.agenerate(req.question, docs, chat_history=chat_history)
+        sources = build_sources(docs)
+        if not chat_history:
+            await asyncio.to_thread(engine.answer_cache.put, req.question, {"answer": answer, "sources": sources})
+
+    await save_session(session_id, memory, req.question, answer)
+    return AskResponse(answer=answer, sources=sources, session_id=session_id)
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest) -> StreamingResponse:
+    """
+    Streaming RAG endpoint (Server-Sent Events):
+    - event "sources": citations, sent as soon as retrieval finishes (before waiting for a generation slot)
+    - event "token": answer text as it is generated
+    - event "error": the generation slot could not be acquired after the stream had started
+    - event "done": rewrite / retrieval / queue / first-token / generation / total timings, plus session_id
+    - 503 + Retry-After when the generation queue is already full before the stream starts
     """
-    result = answer_question(req.question)
-    return AskResponse(answer=result["answer"], sources=result["sources"])
+    engine = app.state.engine
+    session_id = req.session_id or uuid.uuid4().hex
+    memory = await asyncio.to_thread(load_session, req.session_id)
+    chat_history = memory.render()
+
+    cached = None if chat_history else await asyncio.to_thread(engine.answer_cache.get, req.question)
+    if cached is not None:
+        async def cached_stream():
+            await save_session(session_id, memory, req.question, cached["answer"])
+            yield sse_event("sources", cached["sources"])
+            yield sse_event("token", cached["answer"])
+            yield sse_event("done", {
+                "rewrite_ms": 0,
+                "retrieval_ms": 0,
+                "queue_ms": 0,
+                "first_token_ms": 0,
+                "generation_ms": 0,
+                "total_ms": 0,
+                "chinese_count": sum(1 for ch in cached["answer"] if "\u4e00" <= ch <= "\u9fff"),
+                "cached": True,
+                "session_id": session_id,
+            })
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    t_start = time.perf_counter()
+    query = await rewrite_query(memory, req.question)
+    t_retrieval_start = time.perf_counter()
+    docs = await engine.aretrieve(query)
+    t_retrieval_end = time.perf_counter()
+    rewrite_ms = (t_retrieval_start - t_start) * 1000.0
+    retrieval_ms = (t_retrieval_end - t_retrieval_start) * 1000.0
+
+    # 队列已满时在返回响应前拒绝（503）；名额本身在发送 sources 之后再等待
+    if docs:
+        app.state.limiter.admit()
+    slot = AsyncExitStack()
+
+    async def event_stream():
+        try:
+            yield sse_event("sources", build_sources(docs))
+            if not docs:
+                await save_session(session_id, memory, req.question, NO_RESULT_ANSWER)
+                yield sse_event("token", NO_RESULT_ANSWER)
+                yield sse_event("done", {
+                    "rewrite_ms": rewrite_ms,
+                    "retrieval_ms": retrieval_ms,
+                    "queue_ms": 0,
+                    "first_token_ms": 0,
+                    "generation_ms": 0,
+                    "total_ms": (t_retrieval_end - t_start) * 1000.0,
+                    "chinese_count": 0,
+                    "session_id": session_id,
+                })
+                return
+
+            try:
+                await slot.enter_async_context(app.state.limiter.slot())
+            except HTTPException as e:
+                # 响应已经开始，无法再返回503，改为发送 error 事件
+                yield sse_event("error", {"status_code": e.status_code, "detail": e.detail, "session_id": session_id})
+                return
+
+            t_generation_start = time.perf_counter()
+            first_token_time = None
+            answer = ""
+            async for chunk in engine.astream_generate(req.question, docs, chat_history=chat_history):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                answer += chunk
+                yield sse_event("token", chunk)
+            t_generation_end = time.perf_counter()
+
+            if not chat_history:
+                await asyncio.to_thread(engine.answer_cache.put, req.question, {"answer": answer, "sources": build_sources(docs)})
+            await save_session(session_id, memory, req.question, answer)
+
+            chinese_count = sum(1 for ch in answer if "\u4e00" <= ch <= "\u9fff")
+            first_token_ms = (first_token_time - t_generation_start) * 1000.0 if first_token_time else 0
+            yield sse_event("done", {
+                "rewrite_ms": rewrite_ms,
+                "retrieval_ms": retrieval_ms,
+                "queue_ms": (t_generation_start - t_retrieval_end) * 1000.0,
+                "first_token_ms": first_token_ms,
+                "generation_ms": (t_generation_end - t_generation_start) * 1000.0,
+                "total_ms": (t_generation_end - t_start) * 1000.0,
+                "chinese_count": chinese_count,
+                "session_id": session_id,
+            })
+        finally:
+            await slot.aclose()
+
+    # 客户端提前断开时生成器可能不会被关闭，用后台任务兜底释放名额
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(slot.aclose),
+    )
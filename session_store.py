@@ -0,0 +1,137 @@
+"""
+会话存储 - HTTP API 按 session_id 保存每位访客的对话记忆
+默认进程内存储（LRU容量上限 + 空闲超时淘汰），可选SQLite文件后端供多个uvicorn worker共享
+"""
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class SessionStore(ABC):
+    """会话存储基类，状态是可JSON序列化的字典"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def save(self, session_id: str, state: Dict) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """进程内会话存储"""
+
+    def __init__(self, max_sessions: int = 1000, idle_ttl: float = 1800):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now: float) -> None:
+        # 按最近使用排序，最旧的在前面，遇到未过期的即可停止
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], now)
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def save(self, session_id: str, state: Dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (state, now)
+            self._sessions.move_to_end(session_id)
+            self._evict_idle(now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite文件会话存储，多个进程可共享同一个文件"""
+
+    def __init__(self, path: str, max_sessions: int = 1000, idle_ttl: float = 1800):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT, updated_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每个线程一个连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state FROM sessions WHERE id = ? AND updated_at >= ?",
+                (session_id, now - self.idle_ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def save(self, session_id: str, state: Dict) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state, ensure_ascii=False), now),
+            )
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.idle_ttl,))
+            conn.execute(
+                "DELETE FROM sessions WHERE id NOT IN (SELECT id FROM sessions ORDER BY updated_at DESC LIMIT ?)",
+                (self.max_sessions,),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+def build_session_store() -> SessionStore:
+    """按配置创建会话存储"""
+    from config import get_rag_config
+
+    session_config = get_rag_config().get_session_config()
+    if session_config["backend"] == "sqlite":
+        return SQLiteSessionStore(
+            session_config["sqlite_path"],
+            max_sessions=session_config["max_sessions"],
+            idle_ttl=session_config["idle_ttl"],
+        )
+    return InMemorySessionStore(max_sessions=session_config["max_sessions"], idle_ttl=session_config["idle_ttl"])
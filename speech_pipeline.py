@@ -0,0 +1,178 @@
+"""
+流水线语音输出 - 边生成边朗读
+LLM流式输出的token按中文句末标点切成句子，每凑够一句就发给TTS，不必等整段回答生成完
+支持增量文本的TTS（Qwen3TTSRealtime.open_stream）在后台线程里建立会话并逐句发送；
+其他TTS模型在后台线程里逐句合成
+"""
+import time
+import queue
+import logging
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from audio_buffer import PCMBuffer, PCM16_MONO_16K
+from audio_format import decode_audio
+
+
+SENTENCE_END = "。！？；!?;\n"
+SOFT_BREAK = "，、,：:"
+
+
+class SentenceSegmenter:
+    """把token流切成适合朗读的句子：遇到句末标点且长度不少于 min_chars 时切分，
+    过长仍无句末标点时在逗号处切分"""
+
+    def __init__(self, min_chars: int = 8, max_chars: int = 80):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def push(self, text: str) -> List[str]:
+        self.buffer += text
+        segments: List[str] = []
+        start = 0
+        for i, ch in enumerate(self.buffer):
+            if ch in SENTENCE_END and len(self.buffer[start:i + 1].strip()) >= self.min_chars:
+                segments.append(self.buffer[start:i + 1])
+                start = i + 1
+        self.buffer = self.buffer[start:]
+
+        while len(self.buffer) >= self.max_chars:
+            cut = max(self.buffer.rfind(p, 0, self.max_chars) for p in SOFT_BREAK)
+            cut = cut + 1 if cut >= self.min_chars else self.max_chars
+            segments.append(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+        return [s.strip() for s in segments if s.strip()]
+
+    def flush(self) -> str:
+        rest, self.buffer = self.buffer.strip(), ""
+        return rest
+
+
+class SpeechStream:
+    """一次回答的流水线朗读：feed()/tee() 送入token，finish() 等待朗读结束并返回性能统计"""
+
+    def __init__(
+        self,
+        tts,
+        voice: str = "Cherry",
+        callback: Optional[Callable[[bytes], None]] = None,
+        min_chars: int = 8,
+        max_chars: int = 80,
+        drain: Optional[Callable[[], None]] = None,
+    ):
+        self.tts = tts
+        self.voice = voice
+        self.callback = callback
+        self.drain = drain  # 等待播放结束
+        self.segmenter = SentenceSegmenter(min_chars, max_chars)
+        self.start_time = time.perf_counter()
+        self.first_audio_time: Optional[float] = None
+        self.text = ""
+        self.audio = PCMBuffer.of_format(getattr(tts, "output_format", PCM16_MONO_16K))
+
+        self._request = None
+        self._cancelled = False
+        self._queue: Optional["queue.Queue[Optional[str]]"] = queue.Queue()
+        # 增量TTS的连接在后台线程里建立，句子先进队列，文字生成从不等待TTS
+        target = self._stream_segments if hasattr(tts, "open_stream") else self._synthesize_segments
+        self._worker = threading.Thread(target=target, args=(self._queue,), daemon=True, name="tts-pipeline")
+        self._worker.start()
+
+    def _on_audio(self, chunk: bytes) -> None:
+        if self.first_audio_time is None:
+            self.first_audio_time = time.perf_counter()
+        self.audio.append(chunk)
+        if self.callback:
+            self.callback(chunk)
+
+    def _synthesize_segments(self, segments: "queue.Queue[Optional[str]]") -> None:
+        while True:
+            segment = segments.get()
+            if segment is None:
+                return
+            try:
+                if hasattr(self.tts, "synthesize_streaming"):
+                    self.tts.synthesize_streaming(segment, voice=self.voice, callback=self._on_audio)
+                else:
+                    # 整段合成的结果可能是WAV文件内容，去掉头后再累积
+                    self._on_audio(decode_audio(self.tts.synthesize(segment), self.audio.format).view())
+            except Exception as e:
+                logging.error("Pipelined TTS failed for segment %r: %s", segment[:20], e)
+
+    def _stream_segments(self, segments: "queue.Queue[Optional[str]]") -> None:
+        try:
+            request = self.tts.open_stream(self.voice, self.callback)
+        except Exception as e:
+            # TTS不可用时只朗读失败，文字回答照常生成
+            logging.error("Pipelined TTS unavailable, answering in text only: %s", e)
+            request = None
+        self._request = request
+        while True:
+            segment = segments.get()
+            if segment is None:
+                break
+            if request is not None:
+                request.feed(segment)
+        if request is None:
+            return
+        if self._cancelled:
+            request.cancel(RuntimeError("Speech stream cancelled"))
+        else:
+            request.end()
+
+    def _speak(self, segment: str) -> None:
+        self.text += segment
+        if self._queue is not None:
+            self._queue.put(segment)
+
+    def feed(self, token: str) -> None:
+        for segment in self.segmenter.push(token):
+            self._speak(segment)
+
+    def tee(self, tokens: Iterable[str]) -> Iterator[str]:
+        """原样转发token，同时把凑够的句子送去朗读"""
+        for token in tokens:
+            self.feed(token)
+            yield token
+
+    def cancel(self) -> None:
+        """放弃朗读（例如生成中途出错），结束合成请求以归还TTS连接"""
+        if self._queue is not None:
+            self._cancelled = True
+            self._queue.put(None)
+            self._queue = None
+
+    def finish(self, timeout: float = 30) -> dict:
+        """送出剩余文本并等待合成（以及播放）结束"""
+        rest = self.segmenter.flush()
+        if rest:
+            self._speak(rest)
+
+        audio_data = b""
+        first_audio_time = self.first_audio_time
+        try:
+            if self._queue is not None:
+                self._queue.put(None)
+                self._queue = None
+            self._worker.join(timeout)
+            if self._request is not None:
+                audio_data = self._request.wait(timeout)
+                first_audio_time = self._request.first_audio_time
+            else:
+                audio_data = self.audio.view()
+                first_audio_time = self.first_audio_time
+        except Exception as e:
+            logging.error("Pipelined TTS failed: %s", e)
+
+        end_time = time.perf_counter()
+        if self.drain:
+            self.drain()
+        return {
+            "audio_data": audio_data,
+            "performance": {
+                "first_audio_ms": (first_audio_time - self.start_time) * 1000.0 if first_audio_time else 0,
+                "total_synthesis_ms": (end_time - self.start_time) * 1000.0,
+                "chinese_count": sum(1 for ch in self.text if "\u4e00" <= ch <= "\u9fff"),
+            },
+        }
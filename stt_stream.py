@@ -0,0 +1,119 @@
+"""
+流式语音识别接口 - 录音时逐帧送入识别器，边说边识别
+部分识别结果通过 on_partial(text, is_final) 回调返回，说完后 finish() 拿到最终文本
+不支持流式的STT模型使用 BufferedSTTStream：先缓存音频，finish() 时一次性识别；
+本地模型可用 IncrementalSTTStream：录音期间在后台定期重新识别已录到的音频，给出部分结果
+"""
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import Callable, Optional
+
+from audio_buffer import AudioFormat, PCMBuffer, PCM16_MONO_16K
+
+PartialCallback = Callable[[str, bool], None]
+
+
+class STTStream(ABC):
+    """一次流式识别会话"""
+
+    def __init__(self, on_partial: Optional[PartialCallback] = None):
+        self.on_partial = on_partial
+        self.text = ""
+        self.done = False  # 识别器已判定句子结束，之后的音频可以不再发送
+
+    def _update(self, text: str, is_final: bool = False) -> None:
+        self.text = text
+        if is_final:
+            self.done = True
+        if self.on_partial:
+            self.on_partial(text, is_final)
+
+    @abstractmethod
+    def feed(self, frame) -> None:
+        """送入一帧PCM音频，不应阻塞录音线程"""
+
+    @abstractmethod
+    def finish(self) -> str:
+        """音频结束，等待并返回最终识别文本"""
+
+
+class BufferedSTTStream(STTStream):
+    """通用实现：缓存音频，finish() 时调用 transcribe()"""
+
+    def __init__(self, stt, on_partial: Optional[PartialCallback] = None, audio_format: AudioFormat = PCM16_MONO_16K):
+        super().__init__(on_partial)
+        self.stt = stt
+        self.audio = PCMBuffer.of_format(audio_format, capacity=audio_format.bytes_per_second * 5)
+
+    def feed(self, frame) -> None:
+        self.audio.append(frame)
+
+    def finish(self) -> str:
+        self._update(self.stt.transcribe(self.audio), is_final=True)
+        return self.text
+
+
+class IncrementalSTTStream(BufferedSTTStream):
+    """边录边识别（非流式模型）：每多录 interval_s 秒就在线程池里把整段音频重新识别一遍作为部分结果；
+    同一时刻最多一个识别任务，识别跟不上录音时跳过中间的部分结果"""
+
+    def __init__(
+        self,
+        stt,
+        on_partial: Optional[PartialCallback] = None,
+        audio_format: AudioFormat = PCM16_MONO_16K,
+        executor: Optional[Executor] = None,
+        interval_s: float = 1.0,
+    ):
+        super().__init__(stt, on_partial, audio_format)
+        self.executor = executor
+        self.interval_bytes = int(audio_format.bytes_per_second * interval_s)
+        self._next_partial = self.interval_bytes
+        self._pending = None
+        self._pending_bytes = 0  # 进行中的部分识别覆盖的音频字节数
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def feed(self, frame) -> None:
+        self.audio.append(frame)
+        if self.executor is None or len(self.audio) < self._next_partial:
+            return
+        if self._pending is not None and not self._pending.done():
+            return
+        self._next_partial = len(self.audio) + self.interval_bytes
+        self._pending_bytes = len(self.audio)
+        # 只追加不清空，已录部分的切片在识别期间保持不变
+        self._pending = self.executor.submit(self.stt.transcribe, self.audio.view())
+        self._pending.add_done_callback(self._on_partial_done)
+
+    def _on_partial_done(self, future) -> None:
+        if future.cancelled():
+            return
+        try:
+            text = future.result()
+        except Exception as e:
+            logging.debug(f"Partial transcription failed: {e}")
+            return
+        with self._lock:
+            if not self._finished and text:
+                self._update(text)
+
+    def finish(self) -> str:
+        with self._lock:
+            self._finished = True
+        pending = self._pending
+        text = None
+        if pending is not None and not pending.cancel():
+            # 已在运行的部分识别无法中断，模型又是串行的：若它已覆盖全部音频，直接用它的结果
+            if self._pending_bytes == len(self.audio):
+                try:
+                    text = pending.result()
+                except Exception as e:
+                    logging.debug(f"Partial transcription failed: {e}")
+        if text is None:
+            text = self.stt.transcribe(self.audio)
+        with self._lock:
+            self._update(text, is_final=True)
+        return self.text
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+测试语义回答缓存
+"""
+import os
+import tempfile
+
+from answer_cache import AnswerCache, CORPUS_VERSION_FILE, extract_length_constraint, normalize_question, write_corpus_version
+
+
+class FakeEmbeddings:
+    """按字符计数的简易嵌入，足以区分不同问题"""
+
+    def embed_query(self, text: str):
+        vector = [0.0] * 64
+        for ch in text:
+            vector[ord(ch) % 64] += 1.0
+        return vector
+
+
+def test_answer_cache():
+    """测试精确命中、语义命中、LRU淘汰和版本失效"""
+    print("🔧 测试语义回答缓存...")
+
+    store_dir = tempfile.mkdtemp()
+    write_corpus_version(store_dir)
+    cache = AnswerCache(embeddings=FakeEmbeddings(), store_dir=store_dir, max_size=2, ttl=3600, similarity_threshold=0.95)
+    result = {"answer": "曾侯乙编钟是湖北省博物馆的镇馆之宝。", "sources": []}
+
+    assert normalize_question("曾侯乙编钟？ ") == normalize_question("曾侯乙编钟")
+    assert cache.get("曾侯乙编钟") is None
+    cache.put("曾侯乙编钟", result)
+    assert cache.get("曾侯乙编钟？") is result
+    print("✅ 精确命中")
+
+    assert cache.get("编钟曾侯乙") is result
+    print("✅ 语义命中")
+
+    cache.put("武汉美食推荐", {"answer": "热干面", "sources": []})
+    cache.put("武汉大学简介", {"answer": "武汉大学", "sources": []})
+    assert cache.stats()["size"] == 2
+    assert cache.get("曾侯乙编钟") is None
+    print("✅ LRU淘汰")
+
+    version_path = os.path.join(store_dir, CORPUS_VERSION_FILE)
+    old_mtime = os.stat(version_path).st_mtime
+    write_corpus_version(store_dir)
+    # 文件系统时间戳精度可能较粗，显式推后修改时间，与重新入库后的效果一致
+    os.utime(version_path, (old_mtime + 1, old_mtime + 1))
+    assert cache.get("武汉大学简介") is None
+    assert cache.stats()["size"] == 0
+    print("✅ 语料版本变化后缓存失效")
+
+    stats = cache.stats()
+    print(f"📊 缓存统计: {stats}")
+    assert stats["exact_hits"] == 1 and stats["semantic_hits"] == 1
+
+    # 只有字数要求不同的问题向量几乎相同，但不能共用回答
+    cache = AnswerCache(embeddings=FakeEmbeddings(), max_size=8, ttl=3600, similarity_threshold=0.9)
+    short = {"answer": "两百字的介绍", "sources": []}
+    cache.put("用200字介绍曾侯乙编钟", short)
+    assert cache.get("用500字介绍曾侯乙编钟") is None
+    assert cache.get("介绍曾侯乙编钟，用200字") is short
+    assert extract_length_constraint("三百字以内简短介绍") == "三百字|简短" and extract_length_constraint("编钟") == ""
+    print("✅ 字数要求不同时不走语义命中")
+
+    print("\n✅ 语义回答缓存测试完成")
+
+
+if __name__ == "__main__":
+    test_answer_cache()
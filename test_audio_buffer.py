@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+测试共享PCM音频缓冲区
+"""
+import io
+import wave
+
+from audio_buffer import PCMBuffer
+
+
+def test_audio_buffer():
+    """测试追加、零拷贝切片、分帧和WAV编码"""
+    print("🔧 测试PCM音频缓冲区...")
+
+    buffer = PCMBuffer.for_duration(0.1)
+    assert len(buffer) == 0 and not buffer
+    storage = buffer._data
+    for i in range(5):
+        buffer.append(bytes([i]) * 640)
+    assert buffer._data is storage and len(buffer) == 3200
+    assert buffer.duration == 0.1
+    print("✅ 预分配容量内追加不重新分配")
+
+    first = buffer.view(0, 640)
+    buffer.append(b"\x09" * 10000)
+    assert bytes(first) == b"\x00" * 640
+    assert bytes(buffer.view(3200, 3210)) == b"\x09" * 10
+    print("✅ 扩容后已导出的切片仍然有效")
+
+    source = bytearray(b"\x01\x02" * 100)
+    wrapped = PCMBuffer.wrap(source)
+    source[0] = 7
+    assert wrapped.view()[0] == 7 and len(wrapped) == 200
+    wrapped.append(b"\x03\x04")
+    assert source[0] == 7 and len(source) == 200 and bytes(wrapped.view(198)) == b"\x01\x02\x03\x04"
+    print("✅ 包装已有数据不复制，追加时不改写原数据")
+
+    frames = list(PCMBuffer.wrap(bytes(range(256)) * 25).frames(100))
+    assert [len(f) for f in frames] == [3200, 3200]
+    assert all(isinstance(f, memoryview) for f in frames)
+    print("✅ 按时长零拷贝分帧")
+
+    wav = PCMBuffer.wrap(b"\x01\x02" * 800).to_wav()
+    with wave.open(io.BytesIO(wav)) as wf:
+        assert wf.getframerate() == 16000 and wf.getnframes() == 800
+    print("✅ 编码为WAV")
+
+    print("\n✅ PCM音频缓冲区测试完成")
+
+
+if __name__ == "__main__":
+    test_audio_buffer()
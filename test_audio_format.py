@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+测试音频格式层：WAV解析、流式去头和采样格式转换
+"""
+import numpy as np
+
+from audio_buffer import AudioFormat, PCMBuffer, PCM16_MONO_16K
+from audio_format import decode_audio, convert, convert_pcm, frame_converter, WavStreamDecoder
+
+
+def test_audio_format():
+    """测试WAV头不再被当作PCM，以及48kHz立体声转16kHz单声道"""
+    print("🔧 测试音频格式层...")
+
+    pcm = np.arange(-800, 800, dtype=np.int16).tobytes()
+    wav = PCMBuffer.wrap(pcm, sample_rate=24000).to_wav()
+    decoded = decode_audio(wav)
+    assert decoded.format == AudioFormat(24000, 2, 1)
+    assert decoded.to_bytes() == pcm
+    assert decode_audio(pcm).format == PCM16_MONO_16K and decode_audio(pcm).to_bytes() == pcm
+    print("✅ WAV文件解析出真实格式，只保留PCM数据")
+
+    decoder = WavStreamDecoder()
+    out = b"".join(bytes(decoder.feed(wav[i:i + 10])) for i in range(0, 60, 10))
+    out += bytes(decoder.feed(wav[60:]))
+    assert out == pcm and decoder.format.sample_rate == 24000
+    assert bytes(decoder.feed(b"\x01\x02")) == b"\x01\x02"
+    print("✅ 跨片段的WAV头被完整去掉")
+
+    t = np.arange(48000) / 48000
+    tone = (np.sin(2 * np.pi * 440 * t) * 10000).astype(np.int16)
+    stereo = np.stack([tone, tone], axis=1).tobytes()
+    mono = convert(PCMBuffer.wrap(stereo, sample_rate=48000, channels=2), PCM16_MONO_16K)
+    assert mono.format == PCM16_MONO_16K and len(mono) == 32000
+    samples = np.frombuffer(mono.view(), dtype=np.int16)
+    assert abs(int(np.abs(samples[100:-100]).max()) - 10000) < 200
+    print("✅ 48kHz立体声转换为16kHz单声道，时长和幅度不变")
+
+    # 44.1kHz麦克风逐帧（1024样本）转换给16kHz识别器：与整段转换的长度和平滑度一致
+    t = np.arange(88200) / 44100
+    tone = (np.sin(2 * np.pi * 440 * t) * 10000).astype(np.int16).tobytes()
+    mic = AudioFormat(44100, 2, 1)
+    to_stt = frame_converter(mic, PCM16_MONO_16K)
+    framed = np.frombuffer(b"".join(to_stt(tone[i:i + 2048]) for i in range(0, len(tone), 2048)), dtype=np.int16)
+    whole = np.frombuffer(convert(PCMBuffer.wrap(tone, sample_rate=44100), PCM16_MONO_16K).view(), dtype=np.int16)
+    assert len(framed) == len(whole) == 32000
+    max_step = lambda x: int(np.abs(np.diff(x.astype(np.int32))).max())
+    assert max_step(framed) <= max_step(whole[100:-100]) * 1.1, (max_step(framed), max_step(whole[100:-100]))
+    print("✅ 逐帧转换跨帧保留状态：长度不漂移，帧边界无跳变")
+
+    decoder = WavStreamDecoder(target=PCM16_MONO_16K)
+    wav = PCMBuffer.wrap(tone[:8820], sample_rate=44100).to_wav()
+    out = b"".join(bytes(decoder.feed(wav[i:i + 1000])) for i in range(0, len(wav), 1000))
+    assert decoder.format == mic and abs(len(out) // 2 - 1600) <= 1
+    print("✅ 流式解码按WAV头中的格式转换为目标格式")
+
+    same = PCMBuffer.wrap(pcm)
+    assert convert(same, PCM16_MONO_16K) is same
+    assert convert_pcm(pcm, PCM16_MONO_16K, PCM16_MONO_16K) is pcm
+    assert frame_converter(PCM16_MONO_16K, PCM16_MONO_16K)(pcm) is pcm
+    print("✅ 格式相同时不做任何拷贝")
+
+    print("\n✅ 音频格式层测试完成")
+
+
+if __name__ == "__main__":
+    test_audio_format()
@@ -31,7 +31,7 @@ def test_audio_playback():
             # 测试系统播放器
             print("🔊 使用aplay播放...")
             with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_data)
+                temp_file.write(audio_data.to_wav())
                 temp_file_path = temp_file.name
             
             try:
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+测试token预算内的上下文打包
+"""
+from langchain_core.documents import Document
+
+from context_builder import estimate_tokens, pack_context
+
+
+def test_context_builder():
+    """测试去重、相邻合并、低分过滤和预算截断"""
+    print("🔧 测试上下文打包...")
+
+    text = "曾侯乙编钟是战国早期的大型礼乐重器。" * 20
+    first = Document(page_content=text[:200], metadata={"source": "bianzhong.txt", "start_index": 0, "chunk_id": 0})
+    second = Document(page_content=text[150:350], metadata={"source": "bianzhong.txt", "start_index": 150, "chunk_id": 1})
+    other = Document(page_content="越王勾践剑。", metadata={"source": "jian.txt", "start_index": 0, "chunk_id": 0})
+
+    packed = pack_context([second, other, first, first], token_budget=None)
+    assert len(packed) == 2
+    assert packed[0].page_content == text[:350]
+    assert packed[0].metadata["chunk_ids"] == [0, 1]
+    assert packed[1].page_content == "越王勾践剑。"
+    print("✅ 重复chunk去除，重叠chunk合并")
+
+    scored = [
+        Document(page_content="相关", metadata={"rerank_score": 0.9}),
+        Document(page_content="无关", metadata={"rerank_score": 0.1}),
+    ]
+    assert [d.page_content for d in pack_context(scored, token_budget=None, min_rerank_score=0.5)] == ["相关"]
+    print("✅ 低分chunk被过滤")
+
+    packed = pack_context([first, other], token_budget=120)
+    total = sum(estimate_tokens(d.page_content) for d in packed)
+    assert total <= 120
+    print(f"✅ 打包结果不超过预算 ({total} tokens)")
+
+    # 默认配置下 top_k 个互不重叠的默认大小chunk都应放进提示词
+    from config import get_rag_config
+    config = get_rag_config()
+    chunk_size = config.get_chunk_config()["chunk_size"]
+    top_k = config.get_retrieval_config()["top_k"]
+    chunks = [
+        Document(page_content=char * chunk_size, metadata={"source": f"{i}.txt", "start_index": 0, "chunk_id": i})
+        for i, char in enumerate("甲乙丙丁戊己庚辛"[:top_k])
+    ]
+    packed = pack_context(chunks, **config.get_context_config())
+    assert [d.page_content for d in packed] == [d.page_content for d in chunks]
+    print(f"✅ 默认配置保留全部{top_k}个{chunk_size}字的chunk")
+
+    from rag_chain import build_sources
+    docs = [
+        Document(page_content="甲" * 50, metadata={"source": "a.pdf", "page": 1, "start_index": 0, "chunk_id": 0}),
+        Document(page_content="甲" * 50, metadata={"source": "a.pdf", "page": 1, "start_index": 0, "chunk_id": 0}),
+        Document(page_content="乙" * 3000, metadata={"source": "b.txt", "chunk_id": 3}),
+        Document(page_content="丙" * 100, metadata={"source": "c.txt", "chunk_id": 4}),
+    ]
+    # 设定预算后超出预算的片段不进入提示词，也不出现在引用里
+    config.update_config(context_token_budget=1500)
+    try:
+        assert build_sources(docs) == [{"source": "a.pdf", "locator": "page 1"}, {"source": "b.txt", "locator": "chunk 3"}]
+    finally:
+        config.update_config(context_token_budget=None)
+    print("✅ 引用只列出实际放进提示词的片段")
+
+    print("\n✅ 上下文打包测试完成")
+
+
+if __name__ == "__main__":
+    test_context_builder()
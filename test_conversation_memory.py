@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+测试滚动摘要对话记忆
+"""
+from conversation_memory import ConversationMemory
+from context_builder import estimate_tokens
+
+
+class FakeLLM:
+    """返回固定摘要的LLM"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return "用户了解了编钟和越王勾践剑。"
+
+
+def test_conversation_memory():
+    """测试窗口、摘要、token上限和追问改写"""
+    print("🔧 测试对话记忆...")
+
+    llm = FakeLLM()
+    memory = ConversationMemory(llm=llm, max_turns=2, answer_chars=10, max_tokens=80)
+    memory.add_turn("曾侯乙编钟有多少件？", "曾侯乙编钟共65件，是战国早期的大型礼乐重器。")
+    assert "共65件" in memory.render()
+    assert "…" in memory.render()
+    print("✅ 保留截断后的真实回答")
+
+    memory.add_turn("越王勾践剑在哪里出土？", "出土于江陵望山一号楚墓。")
+    memory.add_turn("湖北省博物馆开放时间？", "周二至周日开放。")
+    memory.wait_for_summary(timeout=5)
+    assert not memory.summarizing
+    rendered = memory.render()
+    assert llm.calls == 1
+    assert rendered.startswith("之前对话摘要：用户了解了编钟")
+    assert "曾侯乙编钟有多少件" not in rendered
+    print("✅ 超出窗口的轮次被后台摘要")
+
+    for i in range(5):
+        memory.add_turn(f"很长的问题{i}" * 10, "很长的回答" * 20)
+    memory.wait_for_summary(timeout=5)
+    assert estimate_tokens(memory.render()) <= 80
+    print("✅ 渲染结果不超过token上限")
+
+    memory.clear()
+    memory.add_turn("越王勾践剑在哪里出土？", "江陵望山。")
+    assert memory.rewrite_question("它有多长？") == "越王勾践剑在哪里出土？ 它有多长？"
+    assert memory.rewrite_question("湖北省博物馆的镇馆之宝有哪些？") == "湖北省博物馆的镇馆之宝有哪些？"
+    assert memory.rewrite_question("那青铜鼎呢？") == "越王勾践剑在哪里出土？ 那青铜鼎呢？"
+    assert memory.rewrite_question("编钟") == "编钟" and memory.rewrite_question("越王勾践剑") == "越王勾践剑"
+    for question in ["我应该几点去湖北省博物馆", "武汉其实有哪些美食", "因此黄鹤楼在哪", "湖北省博物馆还有其他展品吗"]:
+        assert memory.rewrite_question(question) == question, question
+    assert memory.rewrite_question("这件文物是哪个朝代的？") == "越王勾践剑在哪里出土？ 这件文物是哪个朝代的？"
+    print("✅ 追问改写为可独立检索的问题")
+
+    deferred = ConversationMemory(llm=FakeLLM(), max_turns=1, background_summary=False)
+    deferred.add_turn("编钟", "答")
+    deferred.add_turn("青铜剑", "答")
+    assert deferred.has_pending_summary and not deferred.summarizing and deferred.llm.calls == 0
+    deferred.summarize_pending()
+    assert not deferred.has_pending_summary and deferred.summary and deferred.llm.calls == 1
+    print("✅ 可由调用方决定何时概括旧轮次")
+
+    plain = ConversationMemory(max_turns=1)
+    plain.add_turn("编钟", "答")
+    plain.add_turn("青铜剑", "答")
+    assert "编钟" in plain.summary
+    print("✅ 无LLM时退化为问题列表摘要")
+
+    print("\n✅ 对话记忆测试完成")
+
+
+if __name__ == "__main__":
+    test_conversation_memory()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+测试查询嵌入缓存
+"""
+import tempfile
+
+from embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings:
+    """记录调用次数的简易嵌入，查询和文档的向量不同（模拟带查询指令的非对称模型）"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text: str):
+        self.calls += 1
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(t)), 0.0] for t in texts]
+
+
+def test_embedding_cache():
+    """测试内存LRU缓存和磁盘缓存"""
+    print("🔧 测试查询嵌入缓存...")
+
+    cache_dir = tempfile.mkdtemp()
+    underlying = CountingEmbeddings()
+    embeddings = CachedEmbeddings(underlying, model_name="fake", max_size=2, cache_dir=cache_dir)
+
+    embeddings.embed_query("越王勾践剑")
+    embeddings.embed_query("越王勾践剑")
+    assert underlying.calls == 1
+    print("✅ 重复问题命中内存缓存")
+
+    embeddings.embed_documents(["越王勾践剑", "曾侯乙尊盘"])
+    assert embeddings.embed_documents(["越王勾践剑", "曾侯乙尊盘", "元青花四爱图梅瓶"])[0] == [5.0, 0.0]
+    assert underlying.calls == 4
+    print("✅ 批量嵌入只计算未缓存的文本")
+
+    assert embeddings.embed_query("越王勾践剑") == [5.0, 1.0]
+    assert underlying.calls == 4
+    print("✅ 查询和文档嵌入分开缓存，互不命中")
+
+    # 新实例共享同一个磁盘缓存
+    underlying2 = CountingEmbeddings()
+    reloaded = CachedEmbeddings(underlying2, model_name="fake", max_size=2, cache_dir=cache_dir)
+    assert reloaded.embed_query("越王勾践剑") == [5.0, 1.0]
+    assert underlying2.calls == 0
+    print("✅ 磁盘缓存跨实例复用")
+
+    other_model = CachedEmbeddings(underlying2, model_name="other", cache_dir=cache_dir)
+    other_model.embed_query("越王勾践剑")
+    assert underlying2.calls == 1
+    print("✅ 不同模型互不命中")
+
+    print(f"📊 缓存统计: {embeddings.stats()}")
+    print("\n✅ 查询嵌入缓存测试完成")
+
+
+if __name__ == "__main__":
+    test_embedding_cache()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试BM25 + 向量混合检索
+"""
+import os
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from answer_cache import CORPUS_VERSION_FILE, CorpusVersionWatcher, write_corpus_version
+from hybrid_retriever import LEXICAL_INDEX_FILE, BM25Index, CorpusReloadingRetriever, HybridRetriever, tokenize
+
+
+class FakeVectorStore:
+    """相似度检索总是返回固定顺序结果的向量库"""
+
+    def __init__(self, ranked, corpus):
+        self.ranked = ranked
+        self.corpus = corpus
+
+    def similarity_search(self, query, k=4):
+        return self.ranked[:k]
+
+    def get_by_ids(self, ids):
+        return [doc for doc in self.corpus if doc.id in ids]
+
+
+def test_hybrid_retriever():
+    """测试分词、BM25检索、持久化和RRF融合"""
+    print("🔧 测试混合检索...")
+
+    ids = ["a", "b", "c"]
+    docs = [
+        Document(id="a", page_content="越王勾践剑出土于湖北江陵望山一号楚墓。", metadata={"source": "qtq.txt", "chunk_id": 0}),
+        Document(id="b", page_content="曾侯乙尊盘是采用失蜡法铸造的青铜器。", metadata={"source": "qtq.txt", "chunk_id": 1}),
+        Document(id="c", page_content="武汉的热干面是著名的早餐。", metadata={"source": "food.txt", "chunk_id": 0}),
+    ]
+
+    assert tokenize("越王勾践剑"), "分词结果不应为空"
+    index = BM25Index()
+    index.add(ids, [d.page_content for d in docs])
+    assert index.search("越王勾践剑", k=1)[0][0] == "a"
+    print("✅ BM25精确命中文物名称")
+
+    store_dir = tempfile.mkdtemp()
+    index.save(store_dir)
+    reloaded = BM25Index.load(store_dir)
+    assert reloaded.search("曾侯乙尊盘", k=1)[0][0] == "b"
+    reloaded.remove(["b"])
+    assert all(chunk_id != "b" for chunk_id, _ in reloaded.search("曾侯乙尊盘"))
+    assert docs[0].page_content not in Path(store_dir, LEXICAL_INDEX_FILE).read_text(encoding="utf-8")
+    print("✅ 索引持久化与增量删除（不保存正文）")
+
+    # 刚加载的索引被多个线程同时首次查询时，倒排表只构建一次且不会读到半成品
+    shared = BM25Index()
+    shared.add([f"doc-{i}" for i in range(2000)], [f"青铜器{i} 编钟 尊盘 越王勾践剑" for i in range(2000)])
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: shared.search("编钟", k=3), range(32)))
+    assert all(len(r) == 3 for r in results)
+    print("✅ 并发首次查询安全")
+
+    # 向量检索把热干面排在第一，词法检索把越王勾践剑排在第一，融合后两者都应保留
+    retriever = HybridRetriever(
+        vectordb=FakeVectorStore([docs[2], docs[0]], docs),
+        lexical_index=index,
+        k=2,
+        vector_k=2,
+        lexical_k=2,
+    )
+    results = retriever.invoke("越王勾践剑")
+    assert results[0].page_content == docs[0].page_content
+    assert len(results) == 2
+    print("✅ RRF融合两路结果")
+
+    # 不同子目录下的同名文件：source 相同，按chunk id区分，两者都应保留
+    same_name = [
+        Document(id="f1", page_content="一楼展厅介绍青铜器。", metadata={"source": "intro.md", "chunk_id": 0}),
+        Document(id="f2", page_content="二楼展厅介绍青铜器。", metadata={"source": "intro.md", "chunk_id": 0}),
+    ]
+    floors = BM25Index()
+    floors.add(["f1", "f2"], [d.page_content for d in same_name])
+    retriever = HybridRetriever(
+        vectordb=FakeVectorStore([same_name[0]], same_name),
+        lexical_index=floors,
+        k=4,
+        vector_k=1,
+        lexical_k=2,
+    )
+    assert sorted(d.id for d in retriever.invoke("展厅青铜器")) == ["f1", "f2"]
+    print("✅ 同名文件的chunk按id区分")
+
+    # 重新入库后（语料版本戳变化）检索器重新加载索引
+    write_corpus_version(store_dir)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return HybridRetriever(vectordb=FakeVectorStore([], docs), lexical_index=BM25Index.load(store_dir), k=1, vector_k=1, lexical_k=1)
+
+    reloading = CorpusReloadingRetriever(retriever=build(), build=build, watcher=CorpusVersionWatcher(store_dir))
+    assert reloading.invoke("武汉热干面")[0].page_content == docs[2].page_content
+    assert len(builds) == 1, "版本未变化时不应重建"
+
+    index.remove(["c"])
+    index.save(store_dir)
+    write_corpus_version(store_dir)
+    version_path = os.path.join(store_dir, CORPUS_VERSION_FILE)
+    mtime = os.stat(version_path).st_mtime + 10
+    os.utime(version_path, (mtime, mtime))
+    assert all(doc.page_content != docs[2].page_content for doc in reloading.invoke("武汉热干面"))
+    assert len(builds) == 2
+    print("✅ 语料版本变化后重新加载索引")
+
+    print("\n✅ 混合检索测试完成")
+
+
+if __name__ == "__main__":
+    test_hybrid_retriever()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+测试增量入库：并行加载、变更检测、清单和分批嵌入
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from pathlib import Path
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from answer_cache import CORPUS_VERSION_FILE
+from config import get_rag_config
+from ingest import (
+    iter_parallel, split_file, plan_changes, load_manifest, save_manifest,
+    open_index_state, remove_deleted_files, record_indexed_file,
+    EmbeddingPipeline, DeferredDeletes, open_collection,
+)
+
+
+class FakeVectorDB:
+    """按id保存chunk文本的向量库"""
+
+    def __init__(self, chunks=None):
+        self.chunks = dict(chunks or {})
+        self.resets = 0
+
+    def get(self, limit=None, offset=0, include=None):
+        ids = list(self.chunks)[offset:offset + limit if limit else None]
+        return {"ids": ids, "documents": [self.chunks[i] for i in ids]}
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.chunks.pop(chunk_id, None)
+
+    def reset_collection(self):
+        self.chunks.clear()
+        self.resets += 1
+
+
+class FakeCollection:
+    """记录upsert的chromadb集合"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.rows.update(zip(ids, documents))
+
+
+class FlakyEmbeddings:
+    """含 "坏" 的批次总是失败，含 "抖" 的批次第一次失败"""
+
+    def __init__(self):
+        self.flaked = False
+
+    def embed_documents(self, texts):
+        if any("坏" in t for t in texts):
+            raise RuntimeError("model crashed")
+        if any("抖" in t for t in texts) and not self.flaked:
+            self.flaked = True
+            raise ConnectionError("timeout")
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def index_file(vectordb, lexical_index, manifest, docs_dir, rel_path, file_info):
+    """模拟一个文件嵌入成功后的收尾"""
+    splits, ids = split_file(Path(docs_dir, rel_path), rel_path, 100, 0)
+    vectordb.chunks.update((i, d.page_content) for i, d in zip(ids, splits))
+    record_indexed_file(vectordb, lexical_index, manifest, rel_path, file_info, ids, [d.page_content for d in splits])
+    return ids
+
+
+def test_iter_parallel():
+    """测试并行加载：结果与任务对应、出错不中断、在途任务数有上限"""
+    print("🔧 测试并行加载...")
+
+    drawn = []
+
+    def tasks():
+        for name in ["a", "slow", "bad", "b", "c", "d", "e", "f", "g", "h"]:
+            drawn.append(name)
+            yield (name,)
+
+    def work(name):
+        if name == "slow":
+            time.sleep(0.2)
+        if name == "bad":
+            raise ValueError("cannot parse")
+        return name.upper()
+
+    results = {}
+    errors = {}
+    for item, result, error in iter_parallel(work, tasks(), workers=2, use_processes=False):
+        # 在途任务 = 已取出的任务 - 已产出的结果
+        assert len(drawn) - len(results) - len(errors) <= 4
+        if error is None:
+            results[item[0]] = result
+        else:
+            errors[item[0]] = error
+    assert results == {name: name.upper() for name in drawn if name != "bad"}
+    assert list(errors) == ["bad"] and isinstance(errors["bad"], ValueError)
+    print("✅ 结果带回对应任务，单个文件出错不中断其余文件")
+    print("✅ 在途任务数不超过 workers * 2")
+
+    docs_dir = Path(tempfile.mkdtemp())
+    (docs_dir / "floor1").mkdir()
+    path = docs_dir / "floor1" / "intro.md"
+    path.write_text("曾侯乙编钟共65件。" * 40, encoding="utf-8")
+    splits, ids = split_file(path, "floor1/intro.md", 100, 20)
+    assert len(splits) == len(ids) > 1 and len(set(ids)) == len(ids)
+    assert all(d.metadata["source"] == "intro.md" for d in splits)
+    assert [d.metadata["chunk_id"] for d in splits] == list(range(len(splits)))
+    assert split_file(path, "floor1/intro.md", 100, 20)[1] == ids
+    assert split_file(path, "floor2/intro.md", 100, 20)[1] != ids
+    print("✅ 切分结果带确定性chunk id，同名文件按相对路径区分")
+
+    print("\n✅ 并行加载测试完成")
+
+
+def test_incremental_ingest():
+    """测试新增、未变、修改、删除文件的变更检测，以及无清单旧库的迁移"""
+    print("🔧 测试增量入库...")
+
+    docs_dir = Path(tempfile.mkdtemp())
+    store_dir = tempfile.mkdtemp()
+    (docs_dir / "a.txt").write_text("越王勾践剑出土于湖北江陵。", encoding="utf-8")
+    (docs_dir / "b.txt").write_text("曾侯乙编钟共65件。", encoding="utf-8")
+    (docs_dir / "notes.docx").write_text("不支持的格式", encoding="utf-8")
+
+    vectordb = FakeVectorDB()
+    manifest, lexical_index = open_index_state(vectordb, store_dir, rebuild=False)
+    assert manifest == {} and vectordb.resets == 0
+    changed, removed = plan_changes(docs_dir, manifest)
+    assert [rel_path for _, rel_path, _ in changed] == ["a.txt", "b.txt"] and removed == []
+    for _, rel_path, file_info in changed:
+        index_file(vectordb, lexical_index, manifest, docs_dir, rel_path, file_info)
+    save_manifest(store_dir, manifest)
+    assert load_manifest(store_dir) == manifest
+    print("✅ 新文件全部入库，清单可保存和读取")
+
+    manifest = load_manifest(store_dir)
+    assert plan_changes(docs_dir, manifest) == ([], [])
+    # mtime变了但内容没变：按sha256判定未变，只刷新mtime
+    path = docs_dir / "a.txt"
+    mtime = path.stat().st_mtime + 10
+    os.utime(path, (mtime, mtime))
+    assert plan_changes(docs_dir, manifest) == ([], [])
+    assert manifest["a.txt"]["mtime"] == mtime
+    print("✅ 未变文件按mtime+大小跳过，mtime变化时按内容哈希判定")
+
+    old_ids = set(manifest["b.txt"]["chunk_ids"])
+    (docs_dir / "b.txt").write_text("曾侯乙编钟共65件，出土于随州。", encoding="utf-8")
+    changed, removed = plan_changes(docs_dir, manifest)
+    assert [rel_path for _, rel_path, _ in changed] == ["b.txt"] and removed == []
+    new_ids = index_file(vectordb, lexical_index, manifest, docs_dir, "b.txt", changed[0][2])
+    assert old_ids.isdisjoint(vectordb.chunks) and set(new_ids) <= set(vectordb.chunks)
+    assert old_ids.isdisjoint(lexical_index.docs) and manifest["b.txt"]["chunk_ids"] == new_ids
+    print("✅ 修改的文件写入新chunks后删除旧chunks")
+
+    a_ids = manifest["a.txt"]["chunk_ids"]
+    path.unlink()
+    changed, removed = plan_changes(docs_dir, manifest)
+    assert changed == [] and removed == ["a.txt"]
+    remove_deleted_files(vectordb, lexical_index, manifest, removed)
+    assert "a.txt" not in manifest
+    assert not set(a_ids) & set(vectordb.chunks) and not set(a_ids) & set(lexical_index.docs)
+    print("✅ 删除的文件连同chunks一起移除")
+
+    # 入库过程中只记下要删除的chunk，结束时一次性删除
+    vectordb.chunks["stale"] = "旧chunk"
+    deletes = DeferredDeletes(vectordb)
+    deletes.delete(ids=["stale"])
+    assert "stale" in vectordb.chunks
+    assert deletes.flush() == 1 and "stale" not in vectordb.chunks and deletes.flush() == 0
+    print("✅ 旧chunks推迟到入库结束时删除")
+
+    # 旧版本建的库：有chunk但没有清单，整体重建一次
+    legacy = FakeVectorDB({"random-uuid": "旧chunk"})
+    manifest, lexical_index = open_index_state(legacy, tempfile.mkdtemp(), rebuild=False)
+    assert legacy.resets == 1 and not legacy.chunks and manifest == {} and not lexical_index.docs
+    print("✅ 没有清单的旧集合整体重建")
+
+    # 有清单但缺词法索引：从向量库已有的chunk补建，不重建集合
+    legacy = FakeVectorDB({"x": "越王勾践剑"})
+    legacy_store = tempfile.mkdtemp()
+    save_manifest(legacy_store, {"a.txt": {"chunk_ids": ["x"]}})
+    manifest, lexical_index = open_index_state(legacy, legacy_store, rebuild=False)
+    assert legacy.resets == 0 and list(lexical_index.docs) == ["x"]
+    print("✅ 缺少词法索引时从向量库补建")
+
+    print("\n✅ 增量入库测试完成")
+
+
+def test_embedding_pipeline():
+    """测试分批嵌入的重试、失败记录和按文件的完成回调"""
+    print("🔧 测试嵌入流水线...")
+
+    collection = FakeCollection()
+    finished = []
+    pipeline = EmbeddingPipeline(
+        collection, FlakyEmbeddings(), batch_size=2, workers=2, max_retries=1,
+        on_file_done=lambda key, ok: finished.append((key, ok)),
+    )
+    docs = lambda *texts: [Document(page_content=t, metadata={"source": "test.txt"}) for t in texts]
+    pipeline.add(docs("编钟一", "编钟二", "编钟三", "编钟四"), ["a1", "a2", "a3", "a4"], key="a.txt")
+    pipeline.add(docs("抖动", "尊盘"), ["b1", "b2"], key="b.txt")
+    pipeline.add(docs("坏块", "坏块二"), ["c1", "c2"], key="c.txt")
+    pipeline.add([], [], key="empty.txt")
+    pipeline.close()
+
+    assert sorted(finished) == [("a.txt", True), ("b.txt", True), ("c.txt", False), ("empty.txt", True)]
+    assert {"a1", "a2", "a3", "a4", "b1", "b2"} == set(collection.rows)
+    print("✅ 失败的批次重试后成功写入")
+    assert pipeline.failed_ids == {"c1", "c2"} and pipeline.stored == 6
+    print("✅ 重试仍失败的chunk记入 failed_ids，所在文件回调 ok=False")
+
+    # 与其他文件混在同一批里失败时，两个文件都不收尾，下次入库重试
+    finished.clear()
+    pipeline = EmbeddingPipeline(
+        FakeCollection(), FlakyEmbeddings(), batch_size=2, workers=1, max_retries=0,
+        on_file_done=lambda key, ok: finished.append((key, ok)),
+    )
+    pipeline.add(docs("编钟"), ["d1"], key="d.txt")
+    pipeline.add(docs("坏块"), ["e1"], key="e.txt")
+    pipeline.close()
+    assert sorted(finished) == [("d.txt", False), ("e.txt", False)]
+    print("✅ 文件的任何chunk失败都不会被记为已入库")
+
+    # 通过chromadb公开客户端写入的向量在LangChain Chroma里可见
+    store_dir = tempfile.mkdtemp()
+    vectordb = Chroma(collection_name="museum", embedding_function=FlakyEmbeddings(), persist_directory=store_dir)
+    pipeline = EmbeddingPipeline(open_collection(store_dir, "museum"), FlakyEmbeddings(), batch_size=2)
+    pipeline.add(docs("越王勾践剑", "曾侯乙编钟"), ["x1", "x2"], key="x.txt")
+    pipeline.close()
+    assert [d.page_content for d in vectordb.get_by_ids(["x1", "x2"])] == ["越王勾践剑", "曾侯乙编钟"]
+    print("✅ 写入的chunk可通过向量库按id取回")
+
+    print("\n✅ 嵌入流水线测试完成")
+
+
+def write_from_other_process(store_dir, upsert=(), delete=()):
+    """在另一个进程里像 ingest.py 一样写入/删除chunk，并更新语料版本戳"""
+    script = (
+        "import sys, json, chromadb\n"
+        "from answer_cache import write_corpus_version\n"
+        "store_dir, upsert, delete = sys.argv[1], json.loads(sys.argv[2]), json.loads(sys.argv[3])\n"
+        "collection = chromadb.PersistentClient(path=store_dir).get_or_create_collection('museum', embedding_function=None)\n"
+        "if upsert:\n"
+        "    collection.upsert(ids=list(upsert), embeddings=[[float(len(t)), 1.0] for t in upsert.values()],\n"
+        "                      documents=list(upsert.values()), metadatas=[{'source': 'x.txt'} for _ in upsert])\n"
+        "if delete:\n"
+        "    collection.delete(ids=delete)\n"
+        "write_corpus_version(store_dir)\n"
+    )
+    subprocess.run(
+        [sys.executable, "-c", script, store_dir, json.dumps(dict(upsert), ensure_ascii=False), json.dumps(list(delete))],
+        check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+def test_chroma_reload_after_reingest():
+    """测试另一个进程增量入库（写入新chunk、删除旧chunk）后，常驻检索器重新打开Chroma"""
+    print("🔧 测试重新入库后重新打开Chroma...")
+
+    from rag_chain import load_retriever
+
+    store_dir = tempfile.mkdtemp()
+    config = get_rag_config().config
+    saved = dict(config)
+    config.update(store_dir=store_dir, collection_name="museum", vector_backend="chroma",
+                  retrieval_mode="vector", rerank_enabled=False)
+    try:
+        write_from_other_process(store_dir, upsert={"x1": "越王勾践剑"})
+        vectordb = Chroma(collection_name="museum", embedding_function=FlakyEmbeddings(), persist_directory=store_dir)
+        reloaded = []
+        retriever = load_retriever(vectordb, on_reload=reloaded.append)
+        assert [d.id for d in retriever.invoke("青铜剑")] == ["x1"]
+
+        # 修改文件后重新入库：旧chunk被删除，新chunk以新id写入
+        write_from_other_process(store_dir, upsert={"x2": "曾侯乙编钟"}, delete=["x1"])
+        version_path = os.path.join(store_dir, CORPUS_VERSION_FILE)
+        mtime = os.stat(version_path).st_mtime + 10
+        os.utime(version_path, (mtime, mtime))
+
+        docs = retriever.invoke("青铜剑")
+        assert [d.id for d in docs] == ["x2"] and docs[0].page_content == "曾侯乙编钟"
+        assert len(reloaded) == 1 and reloaded[0] is not vectordb
+        print("✅ 重新入库后检索到新chunk，已删除的chunk不再返回")
+    finally:
+        config.clear()
+        config.update(saved)
+
+    print("\n✅ Chroma重新加载测试完成")
+
+
+if __name__ == "__main__":
+    test_iter_parallel()
+    test_incremental_ingest()
+    test_embedding_pipeline()
+    test_chroma_reload_after_reingest()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+测试NumPy内存映射向量库
+"""
+import os
+import tempfile
+
+import numpy as np
+
+from numpy_store import NumpyVectorStore, write_numpy_index
+
+
+class AxisEmbeddings:
+    """把文本映射到固定坐标轴的简易嵌入"""
+
+    AXES = {"编钟": 0, "青铜剑": 1, "热干面": 2}
+
+    def embed_query(self, text):
+        vector = [0.1, 0.1, 0.1]
+        for word, axis in self.AXES.items():
+            if word in text:
+                vector[axis] = 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def test_numpy_store():
+    """测试写入、内存映射加载和精确top-k"""
+    print("🔧 测试NumPy向量库...")
+
+    embeddings = AxisEmbeddings()
+    texts = ["曾侯乙编钟", "越王勾践青铜剑", "武汉热干面"]
+    metadatas = [{"source": f"{i}.txt", "chunk_id": i} for i in range(3)]
+
+    for dtype in ("float32", "float16"):
+        index_dir = tempfile.mkdtemp()
+        write_numpy_index(index_dir, ["a", "b", "c"], embeddings.embed_documents(texts), texts, metadatas, dtype=dtype)
+        store = NumpyVectorStore.load(index_dir, embeddings)
+        assert isinstance(store.matrix, np.memmap)
+        assert store.matrix.dtype == np.dtype(dtype)
+
+        results = store.similarity_search("青铜剑", k=2)
+        assert results[0].page_content == "越王勾践青铜剑"
+        assert len(results) == 2
+
+        docs = store.as_retriever(search_kwargs={"k": 1}).invoke("热干面")
+        assert docs[0].metadata["source"] == "2.txt"
+        assert [d.page_content for d in store.get_by_ids(["c", "missing", "a"])] == ["武汉热干面", "曾侯乙编钟"]
+        print(f"✅ {dtype} 矩阵检索正确")
+
+    # 重新导出：新版本写完后才切换指针，已加载的旧版本仍可使用
+    write_numpy_index(index_dir, ["a", "b"], embeddings.embed_documents(texts[:2]), texts[:2], metadatas[:2])
+    newer = NumpyVectorStore.load(index_dir, embeddings)
+    assert newer.matrix.shape[0] == len(newer.ids) == 2
+    assert store.similarity_search("热干面", k=1)[0].page_content == "武汉热干面"
+    write_numpy_index(index_dir, ["a"], embeddings.embed_documents(texts[:1]), texts[:1], metadatas[:1])
+    assert len([p for p in os.listdir(index_dir) if p.startswith("v")]) == 2
+    print("✅ 矩阵和元数据按版本整体切换，只保留最近两个版本")
+
+    try:
+        newer.add_texts(["元青花四爱图梅瓶"])
+        raise AssertionError("expected TypeError")
+    except TypeError:
+        pass
+    print("✅ 只读索引拒绝写入")
+
+    assert NumpyVectorStore.load(tempfile.mkdtemp(), embeddings) is None
+    print("✅ 索引不存在时返回None")
+
+    print("\n✅ NumPy向量库测试完成")
+
+
+if __name__ == "__main__":
+    test_numpy_store()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+测试连续音频播放器（环形缓冲区 + 独立播放线程）
+"""
+import time
+import threading
+
+import audio_playback
+from audio_playback import PCMRingBuffer, AudioPlaybackSink
+
+
+class SlowDevice:
+    """模拟按实时速率消费数据的输出设备"""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.played = bytearray()
+
+    def write(self, data):
+        time.sleep(len(data) / self.bytes_per_second)
+        self.played += data
+
+
+class FakePyAudio:
+    """与PyAudio相同的调用方式；write 像 write_stream 的 "s#" 一样拒绝 memoryview"""
+
+    paInt16 = 8
+
+    class Stream:
+        def __init__(self):
+            self.played = bytearray()
+
+        def write(self, data):
+            if not isinstance(data, bytes):
+                raise TypeError(f"must be read-only bytes-like object, not {type(data).__name__}")
+            self.played += data
+
+        def stop_stream(self):
+            pass
+
+        def close(self):
+            pass
+
+    class PyAudio:
+        def get_format_from_width(self, width):
+            return FakePyAudio.paInt16
+
+        def open(self, **kwargs):
+            self.stream = FakePyAudio.Stream()
+            return self.stream
+
+        def terminate(self):
+            pass
+
+
+def test_pyaudio_backend():
+    """通过PyAudio后端的真实写入路径播放（PyAudio只接受bytes）"""
+    saved = audio_playback.pyaudio if audio_playback.PYAUDIO_AVAILABLE else None, audio_playback.PYAUDIO_AVAILABLE
+    audio_playback.pyaudio, audio_playback.PYAUDIO_AVAILABLE = FakePyAudio, True
+    try:
+        sink = AudioPlaybackSink(backend="pyaudio")
+        audio = bytes(range(256)) * 25
+        sink.write(memoryview(audio))
+        assert sink.drain(timeout=5)
+        assert bytes(sink._stream.played) == audio
+        sink.close()
+    finally:
+        audio_playback.pyaudio, audio_playback.PYAUDIO_AVAILABLE = saved
+    print("✅ PyAudio后端收到的是bytes，播放数据完整")
+
+
+def test_playback_sink():
+    """测试环形缓冲区和非阻塞播放"""
+    print("🔧 测试连续音频播放...")
+
+    ring = PCMRingBuffer(8, max_capacity=8)
+    assert ring.write(b"abcdef") == 0
+    assert ring.read(4) == b"abcd"
+    assert ring.write(b"ghijkl") == 0
+    assert ring.read(100) == b"efghijkl"
+    assert ring.write(b"0123456789") == 2
+    assert ring.read(100) == b"23456789"
+    ring.close()
+    assert ring.read(1) is None
+    print("✅ 环形缓冲区回绕读写，达到容量上限时丢弃最旧数据")
+
+    ring = PCMRingBuffer(8)
+    ring.write(b"abcdef")
+    assert ring.read(4) == b"abcd"
+    assert ring.write(b"0123456789") == 0 and ring.capacity >= 12
+    assert ring.read(100) == b"ef0123456789"
+    print("✅ 未设上限时放不下就扩容，不丢弃未播放的数据")
+
+    ring = PCMRingBuffer(4, max_capacity=8)
+    ring.write(b"abcdef")
+    reader = threading.Timer(0.05, lambda: ring.read(6))
+    reader.start()
+    t_start = time.perf_counter()
+    assert ring.write(b"0123456", timeout=2) == 0
+    assert 0.03 < time.perf_counter() - t_start < 1
+    assert ring.capacity == 8 and ring.read(100) == b"0123456"
+    print("✅ 达到上限时写入等待读取腾出空间，不丢数据")
+
+    ring = PCMRingBuffer(8, max_capacity=8)
+    ring.write(b"abcdef")
+    t_start = time.perf_counter()
+    assert ring.write(b"0123", timeout=0.05) == 2
+    assert time.perf_counter() - t_start >= 0.05
+    assert ring.read(100) == b"cdef0123"
+    print("✅ 读取方停滞超过超时后丢弃最旧数据")
+
+    # 读取方持续有进展时，总等待时间超过超时也不丢数据
+    ring = PCMRingBuffer(4, max_capacity=4)
+    ring.write(b"abcd")
+    stop_reading = threading.Event()
+
+    def trickle():
+        while not stop_reading.is_set():
+            time.sleep(0.03)
+            ring.read(1)
+    reader = threading.Thread(target=trickle)
+    reader.start()
+    t_start = time.perf_counter()
+    assert ring.write(b"0123", timeout=0.05) == 0
+    assert time.perf_counter() - t_start > 0.05
+    stop_reading.set()
+    reader.join()
+    print("✅ 超时按没有进展的时长计算，而不是整次写入的时长")
+
+    device = SlowDevice(bytes_per_second=32000)
+    sink = AudioPlaybackSink(writer=device.write, frame_ms=20)
+    audio = bytes(range(256)) * 25  # 0.2秒
+    t_start = time.perf_counter()
+    for i in range(0, len(audio), 640):
+        sink.write(audio[i:i + 640])
+    assert time.perf_counter() - t_start < 0.05
+    print("✅ 写入立即返回，不等待播放")
+
+    assert sink.drain(timeout=5)
+    assert bytes(device.played) == audio
+    print("✅ 独立线程连续播放，数据顺序完整")
+
+    # 远快于实时写入超过初始容量的长回答（0.2秒缓冲区写入1秒音频），一个字节都不丢
+    device = SlowDevice(bytes_per_second=320000)
+    long_sink = AudioPlaybackSink(writer=device.write, buffer_seconds=0.2)
+    long_audio = bytes(range(256)) * 125
+    for i in range(0, len(long_audio), 640):
+        long_sink.write(long_audio[i:i + 640])
+    assert long_sink.drain(timeout=5) and bytes(device.played) == long_audio
+    long_sink.close()
+    print("✅ 长回答超出初始缓冲区时不丢失语音")
+
+    # 输出设备比写入慢、环形缓冲区已满时：写入方（TTS接收线程）仍立即返回，
+    # 送数线程等待播放腾出空间，总时长远超 write_timeout 也不丢数据
+    device = SlowDevice(bytes_per_second=32000)
+    bounded = AudioPlaybackSink(writer=device.write, buffer_seconds=0.05, max_buffer_seconds=0.1, write_timeout=0.2)
+    t_start = time.perf_counter()
+    for i in range(0, len(long_audio), 6400):
+        bounded.write(long_audio[i:i + 6400])
+    assert time.perf_counter() - t_start < 0.05
+    assert bounded.drain(timeout=5) and bytes(device.played) == long_audio
+    assert bounded.buffer.capacity <= 3200 and bounded.buffer.dropped == 0
+    bounded.close()
+    print("✅ 缓冲区有上限，满时写入仍不等待播放，语音完整")
+
+    # 输出设备卡住：送数线程在没有进展 write_timeout 秒后丢弃最旧数据，环形缓冲区不再增长
+    stalled = threading.Event()
+    stuck = AudioPlaybackSink(writer=lambda data: stalled.wait(), max_buffer_seconds=0.1, write_timeout=0.05)
+    for i in range(0, len(long_audio), 6400):
+        stuck.write(long_audio[i:i + 6400])
+    deadline = time.perf_counter() + 2
+    while not stuck.buffer.dropped and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert stuck.buffer.capacity <= 3200 and stuck.buffer.dropped > 0
+    stalled.set()
+    stuck.close()
+    print("✅ 输出设备停滞时丢弃最旧数据，内存有上限")
+
+    writer = threading.Thread(target=sink.write, args=(audio,))
+    writer.start()
+    writer.join()
+    sink.stop()
+    assert sink.drain(timeout=1)
+    sink.close()
+    print("✅ 打断时丢弃未播放数据")
+
+    test_pyaudio_backend()
+
+    print("\n✅ 连续音频播放测试完成")
+
+
+if __name__ == "__main__":
+    test_playback_sink()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+测试cross-encoder重排阶段
+"""
+import time
+import threading
+
+from langchain_core.documents import Document
+
+from reranker import RerankingRetriever
+
+
+class FixedRetriever:
+    """返回固定候选的检索器"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def invoke(self, query):
+        return [Document(page_content=d.page_content, metadata=dict(d.metadata)) for d in self.docs]
+
+
+class LengthReranker:
+    """按文本长度打分的简易重排器，可模拟慢速打分"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def score(self, query, docs):
+        time.sleep(self.delay)
+        return [float(len(d.page_content)) for d in docs]
+
+
+def test_reranker():
+    """测试重排结果和超时回退"""
+    print("🔧 测试重排阶段...")
+
+    docs = [Document(page_content="短", metadata={}), Document(page_content="较长的片段", metadata={}), Document(page_content="中等", metadata={})]
+
+    retriever = RerankingRetriever(base_retriever=FixedRetriever(docs), reranker=LengthReranker(), k=2, time_budget_ms=1000)
+    results = retriever.invoke("问题")
+    assert [d.page_content for d in results] == ["较长的片段", "中等"]
+    assert results[0].metadata["rerank_score"] == 5.0
+    print("✅ 按重排分数保留前k个")
+
+    slow = RerankingRetriever(base_retriever=FixedRetriever(docs), reranker=LengthReranker(delay=0.5), k=2, time_budget_ms=50)
+    t_start = time.perf_counter()
+    results = slow.invoke("问题")
+    elapsed_ms = (time.perf_counter() - t_start) * 1000.0
+    assert [d.page_content for d in results] == ["短", "较长的片段"]
+    assert elapsed_ms < 400
+    print(f"✅ 超出时间预算时退回检索顺序 ({elapsed_ms:.1f} ms)")
+
+    # 上一个超时的打分任务仍在运行：下一次查询直接跳过重排，不排队等待
+    t_start = time.perf_counter()
+    results = slow.invoke("问题")
+    assert (time.perf_counter() - t_start) * 1000.0 < 40
+    assert [d.page_content for d in results] == ["短", "较长的片段"]
+    time.sleep(0.6)
+    slow.time_budget_ms = 1000
+    assert [d.page_content for d in slow.invoke("问题")] == ["较长的片段", "中等"]
+    print("✅ 超时任务占用重排线程时跳过重排，空闲后恢复")
+
+    # 并发查询：工作线程被另一个正常查询占用时，在时间预算内等待而不是跳过重排
+    busy = RerankingRetriever(base_retriever=FixedRetriever(docs), reranker=LengthReranker(delay=0.1), k=2, time_budget_ms=1000)
+    results = [None, None]
+
+    def run(i):
+        results[i] = busy.invoke("问题")
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all([d.page_content for d in r] == ["较长的片段", "中等"] for r in results)
+    print("✅ 并发查询排队等待重排线程，都得到重排结果")
+
+    print("\n✅ 重排阶段测试完成")
+
+
+if __name__ == "__main__":
+    test_reranker()
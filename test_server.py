@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+测试HTTP API：生成并发限制、就绪探针、流式回答
+"""
+import json
+import asyncio
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate
+
+from rag_engine import RAGEngine
+from session_store import InMemorySessionStore
+from server import AskRequest, GenerationLimiter, app, ask_stream
+
+
+class FakeLLM:
+    """记录每次调用时生成上限的LLM"""
+
+    def __init__(self, num_predict=512, calls=None):
+        self.num_predict = num_predict
+        self.calls = [] if calls is None else calls
+
+    def model_copy(self, update):
+        return FakeLLM(update.get("num_predict", self.num_predict), self.calls)
+
+    def invoke(self, messages):
+        self.calls.append(self.num_predict)
+        return "好"
+
+
+class FakeRetriever:
+    def invoke(self, question):
+        return []
+
+
+class FakeAnswerCache:
+    def __init__(self):
+        self.answers = {}
+
+    def get(self, question):
+        return self.answers.get(question)
+
+    def put(self, question, result):
+        self.answers[question] = result
+
+    def stats(self):
+        return {"size": len(self.answers)}
+
+
+def stub_engine():
+    """不加载模型的RAG引擎"""
+    engine = RAGEngine.__new__(RAGEngine)
+    engine.retriever = FakeRetriever()
+    engine.prompt = ChatPromptTemplate.from_messages([("system", "{context}"), ("human", "{chat_history}{question}")])
+    engine.llm = FakeLLM()
+    engine.answer_cache = FakeAnswerCache()
+    engine.ready = False
+    engine.warmup_stats = {}
+    return engine
+
+
+class StreamingEngine:
+    """检索返回固定文档、逐token生成固定回答的引擎"""
+
+    def __init__(self):
+        self.llm = FakeLLM()
+        self.answer_cache = FakeAnswerCache()
+
+    async def aretrieve(self, question):
+        return [Document(page_content="曾侯乙编钟共65件。", metadata={"source": "bells.txt", "page": 1})]
+
+    async def astream_generate(self, question, docs, chat_history=""):
+        for token in ["曾侯乙", "编钟", "共65件。"]:
+            yield token
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def burst(limiter, count):
+    async def request():
+        try:
+            async with limiter.slot():
+                await asyncio.sleep(0.05)
+            return 200
+        except HTTPException as e:
+            return e.status_code
+
+    return await asyncio.gather(*(request() for _ in range(count)))
+
+
+def test_generation_limiter():
+    """测试同一时刻到达的突发请求只接纳并发数+队列长度个"""
+    print("🔧 测试生成并发限制...")
+
+    limiter = GenerationLimiter(max_concurrency=1, max_queue=1, timeout=5)
+    statuses = asyncio.run(burst(limiter, 20))
+    assert statuses.count(200) == 2 and statuses.count(503) == 18
+    assert limiter.waiting == 0 and limiter.active == 0
+    print("✅ 突发20个请求时接纳2个，其余返回503")
+
+    limiter = GenerationLimiter(max_concurrency=2, max_queue=3, timeout=5)
+    statuses = asyncio.run(burst(limiter, 10))
+    assert statuses.count(200) == 5
+    print("✅ 接纳数等于并发数加队列长度")
+
+    limiter = GenerationLimiter(max_concurrency=1, max_queue=5, timeout=0.02)
+    statuses = asyncio.run(burst(limiter, 3))
+    assert statuses.count(200) == 1 and statuses.count(503) == 2
+    print("✅ 排队超时的请求返回503")
+
+    print("\n✅ 生成并发限制测试完成")
+
+
+def test_ready():
+    """测试预热前就绪探针返回503，预热后返回200，且预热只生成1个token"""
+    print("🔧 测试就绪探针...")
+
+    engine = stub_engine()
+    app.state.engine = engine
+    try:
+        client = TestClient(app)
+        assert client.get("/ready").status_code == 503
+        print("✅ 预热前返回503")
+
+        engine.warmup()
+        response = client.get("/ready")
+        assert response.status_code == 200 and response.json()["ready"]
+        assert engine.llm.calls == [1] and engine.llm.num_predict == 512
+        print("✅ 预热后返回200，预热调用只生成1个token")
+    finally:
+        del app.state.engine
+
+    print("\n✅ 就绪探针测试完成")
+
+
+def test_ask_stream():
+    """测试SSE事件顺序、缓存命中路径，以及流结束或客户端断开后归还生成名额"""
+    print("🔧 测试流式回答...")
+
+    engine = StreamingEngine()
+    app.state.engine = engine
+    app.state.limiter = GenerationLimiter(max_concurrency=1, max_queue=0, timeout=1)
+    app.state.sessions = InMemorySessionStore()
+    app.state.summary_tasks = set()
+    try:
+        client = TestClient(app)
+        response = client.post("/ask/stream", json={"question": "曾侯乙编钟有多少件？"})
+        assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(response.text)
+        kinds = [kind for kind, _ in events]
+        assert kinds == ["sources", "token", "token", "token", "done"]
+        assert events[0][1][0]["source"] == "bells.txt"
+        assert "".join(data for kind, data in events if kind == "token") == "曾侯乙编钟共65件。"
+        assert not events[-1][1].get("cached") and events[-1][1]["session_id"]
+        assert app.state.limiter.active == 0 and app.state.limiter.waiting == 0
+        print("✅ 事件顺序 sources → token* → done，结束后归还名额")
+
+        events = parse_sse(client.post("/ask/stream", json={"question": "曾侯乙编钟有多少件？"}).text)
+        assert [kind for kind, _ in events] == ["sources", "token", "done"]
+        assert events[1][1] == "曾侯乙编钟共65件。" and events[-1][1]["cached"]
+        print("✅ 重复问题走答案缓存")
+
+        async def sources_before_slot():
+            # 名额被占用时 sources 仍立即发出，名额空出后才开始生成
+            limiter = app.state.limiter
+            app.state.limiter = GenerationLimiter(max_concurrency=1, max_queue=1, timeout=1)
+            async with app.state.limiter.slot():
+                response = await ask_stream(AskRequest(question="编钟由谁铸造？"))
+                first = await asyncio.wait_for(response.body_iterator.__anext__(), timeout=0.5)
+                assert first.startswith("event: sources")
+                pending = asyncio.ensure_future(response.body_iterator.__anext__())
+                await asyncio.sleep(0.05)
+                assert not pending.done() and app.state.limiter.waiting == 1
+            assert (await pending).startswith("event: token")
+            events = parse_sse("".join([chunk async for chunk in response.body_iterator]))
+            timings = events[-1][1]
+            assert timings["queue_ms"] >= 40 and timings["retrieval_ms"] < timings["queue_ms"]
+            assert "rewrite_ms" in timings
+            app.state.limiter = limiter
+
+        asyncio.run(sources_before_slot())
+        print("✅ sources 不等待生成名额，排队时间单独统计")
+
+        async def disconnect(close_generator):
+            response = await ask_stream(AskRequest(question="编钟是什么时候出土的？"))
+            first = await response.body_iterator.__anext__()
+            assert first.startswith("event: sources")
+            assert (await response.body_iterator.__anext__()).startswith("event: token")
+            assert app.state.limiter.active == 1
+            # 客户端断开：生成器被关闭，或者未被关闭而由后台任务兜底
+            if close_generator:
+                await response.body_iterator.aclose()
+            else:
+                await response.background()
+            assert app.state.limiter.active == 0
+
+        asyncio.run(disconnect(close_generator=True))
+        asyncio.run(disconnect(close_generator=False))
+        assert client.post("/ask/stream", json={"question": "编钟是什么时候出土的？"}).status_code == 200
+        print("✅ 客户端中途断开后名额被归还")
+    finally:
+        for name in ("engine", "limiter", "sessions", "summary_tasks"):
+            delattr(app.state, name)
+
+    print("\n✅ 流式回答测试完成")
+
+
+class EmptyEngine(StreamingEngine):
+    """检索不到任何文档的引擎"""
+
+    async def aretrieve(self, question):
+        return []
+
+
+def test_no_result_session():
+    """测试没有检索结果时也保存会话，返回的 session_id 可以继续使用"""
+    print("🔧 测试无检索结果时的会话...")
+
+    app.state.engine = EmptyEngine()
+    app.state.limiter = GenerationLimiter(max_concurrency=1, max_queue=0, timeout=1)
+    app.state.sessions = InMemorySessionStore()
+    app.state.summary_tasks = set()
+    try:
+        client = TestClient(app)
+        body = client.post("/ask", json={"question": "火星上有博物馆吗？"}).json()
+        state = app.state.sessions.get(body["session_id"])
+        assert state is not None and len(state["turns"]) == 1
+        print("✅ /ask 无结果时会话被保存")
+
+        events = parse_sse(client.post("/ask/stream", json={"question": "月球上呢？", "session_id": body["session_id"]}).text)
+        assert events[-1][1]["session_id"] == body["session_id"]
+        assert len(app.state.sessions.get(body["session_id"])["turns"]) == 2
+        print("✅ /ask/stream 无结果时本轮记入同一会话")
+    finally:
+        for name in ("engine", "limiter", "sessions", "summary_tasks"):
+            delattr(app.state, name)
+
+    print("\n✅ 无检索结果会话测试完成")
+
+
+if __name__ == "__main__":
+    test_generation_limiter()
+    test_ready()
+    test_ask_stream()
+    test_no_result_session()
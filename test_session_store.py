@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+测试HTTP API会话存储
+"""
+import os
+import time
+import tempfile
+
+from conversation_memory import ConversationMemory
+from session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def check_store(store):
+    memory = ConversationMemory(max_turns=1)
+    memory.add_turn("曾侯乙编钟有多少件？", "共65件。")
+    memory.add_turn("越王勾践剑在哪里出土？", "江陵望山。")
+    store.save("visitor-a", memory.to_dict())
+
+    restored = ConversationMemory(max_turns=1)
+    restored.load_dict(store.get("visitor-a"))
+    assert restored.render() == memory.render()
+    assert store.get("visitor-b") is None
+
+    store.delete("visitor-a")
+    assert store.get("visitor-a") is None
+
+
+def test_session_store():
+    """测试会话保存/恢复、LRU淘汰和空闲超时"""
+    print("🔧 测试会话存储...")
+
+    check_store(InMemorySessionStore())
+    print("✅ 内存存储保存并恢复对话记忆")
+
+    store = InMemorySessionStore(max_sessions=2)
+    store.save("a", {"turns": []})
+    store.save("b", {"turns": []})
+    store.get("a")
+    store.save("c", {"turns": []})
+    assert store.get("b") is None and store.get("a") is not None
+    print("✅ 超出容量时淘汰最久未使用的会话")
+
+    store = InMemorySessionStore(idle_ttl=0.05)
+    store.save("a", {"turns": []})
+    time.sleep(0.1)
+    assert store.get("a") is None
+    print("✅ 空闲超时的会话被清除")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.sqlite3")
+        check_store(SQLiteSessionStore(path))
+
+        store = SQLiteSessionStore(path, max_sessions=1)
+        store.save("a", {"summary": "编钟"})
+        assert SQLiteSessionStore(path).get("a") == {"summary": "编钟"}
+        store.save("b", {"summary": "青铜剑"})
+        assert store.get("a") is None
+    print("✅ SQLite存储可跨实例共享")
+
+    print("\n✅ 会话存储测试完成")
+
+
+if __name__ == "__main__":
+    test_session_store()
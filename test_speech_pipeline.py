@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+测试边生成边朗读的流水线语音输出
+"""
+import time
+
+from speech_pipeline import SentenceSegmenter, SpeechStream
+
+
+class FakeTTSRequest:
+    def __init__(self):
+        self.fed = []
+        self.first_audio_time = None
+        self.ended = False
+
+    def feed(self, text):
+        if self.first_audio_time is None:
+            self.first_audio_time = time.perf_counter()
+        self.fed.append(text)
+
+    def end(self):
+        self.ended = True
+
+    def wait(self, timeout=None):
+        return "".join(self.fed).encode()
+
+    def cancel(self, error):
+        self.cancelled = error
+
+
+class FakeStreamingTTS:
+    """支持增量文本的TTS"""
+
+    def __init__(self):
+        self.request = FakeTTSRequest()
+
+    def open_stream(self, voice, callback):
+        return self.request
+
+
+class UnreachableTTS:
+    """连接不上的增量TTS"""
+
+    def open_stream(self, voice, callback):
+        raise ConnectionError("TTS server unreachable")
+
+
+class SlowTTS:
+    """建立连接很慢的增量TTS"""
+
+    def __init__(self):
+        self.request = FakeTTSRequest()
+
+    def open_stream(self, voice, callback):
+        time.sleep(0.5)
+        return self.request
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class FakeTTS:
+    """只能整句合成的TTS"""
+
+    def __init__(self):
+        self.segments = []
+
+    def synthesize(self, text):
+        self.segments.append(text)
+        return text.encode()
+
+
+def test_speech_pipeline():
+    """测试句子切分和流水线朗读"""
+    print("🔧 测试流水线语音输出...")
+
+    segmenter = SentenceSegmenter(min_chars=6, max_chars=30)
+    tokens = ["曾侯乙编钟", "共65件。", "好的。它出土于", "湖北随州擂鼓墩", "。还有其他问题吗？", "欢迎"]
+    segments = [s for t in tokens for s in segmenter.push(t)]
+    assert segments == ["曾侯乙编钟共65件。", "好的。它出土于湖北随州擂鼓墩。", "还有其他问题吗？"]
+    assert segmenter.flush() == "欢迎"
+    print("✅ 按句末标点切分，过短的句子与下一句合并")
+
+    segmenter = SentenceSegmenter(min_chars=4, max_chars=20)
+    segments = segmenter.push("这件文物体量巨大，纹饰精美，铸造工艺复杂，代表了先秦青铜技术的最高水平")
+    assert segments[0] == "这件文物体量巨大，纹饰精美，"
+    assert all(len(s) <= 20 for s in segments)
+    print("✅ 过长无句号时在逗号处切分")
+
+    tts = FakeStreamingTTS()
+    speech = SpeechStream(tts, min_chars=6)
+    seen = []
+    for i, token in enumerate(speech.tee(tokens)):
+        seen.append(token)
+        if i == 1:
+            # 第一句生成完时已经送去合成，不等整段回答
+            assert wait_until(lambda: tts.request.fed == ["曾侯乙编钟共65件。"])
+    result = speech.finish()
+    assert seen == tokens and tts.request.ended
+    assert "".join(tts.request.fed) == "".join(tokens)
+    assert result["performance"]["chinese_count"] > 0
+    print("✅ 增量TTS在生成过程中逐句发送")
+
+    tts = FakeTTS()
+    chunks = []
+    speech = SpeechStream(tts, callback=chunks.append, min_chars=6)
+    for _ in speech.tee(tokens):
+        pass
+    result = speech.finish()
+    assert tts.segments[-1] == "欢迎" and len(tts.segments) == 4
+    assert result["audio_data"] == "".join(tokens).encode() and len(chunks) == 4
+    print("✅ 不支持增量文本的TTS在后台逐句合成")
+
+    speech = SpeechStream(UnreachableTTS(), min_chars=6)
+    assert list(speech.tee(tokens)) == tokens
+    assert not speech.finish()["audio_data"]
+    print("✅ TTS不可用时文字回答照常返回")
+
+    tts = SlowTTS()
+    start = time.perf_counter()
+    speech = SpeechStream(tts, min_chars=6)
+    assert list(speech.tee(tokens)) == tokens
+    assert time.perf_counter() - start < 0.2
+    speech.finish()
+    assert "".join(tts.request.fed) == "".join(tokens) and tts.request.ended
+    print("✅ TTS建立连接时文字生成不等待，句子在连接就绪后补发")
+
+    tts = FakeStreamingTTS()
+    speech = SpeechStream(tts, min_chars=6)
+
+    def failing_tokens():
+        yield tokens[0]
+        raise RuntimeError("LLM connection lost")
+
+    try:
+        for _ in speech.tee(failing_tokens()):
+            pass
+    except RuntimeError:
+        speech.cancel()
+    assert wait_until(lambda: hasattr(tts.request, "cancelled"))
+    assert isinstance(tts.request.cancelled, RuntimeError)
+    print("✅ 生成中途出错时取消合成请求，归还TTS连接")
+
+    print("\n✅ 流水线语音输出测试完成")
+
+
+if __name__ == "__main__":
+    test_speech_pipeline()
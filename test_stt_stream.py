@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试流式语音识别接口
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from stt_stream import STTStream, BufferedSTTStream, IncrementalSTTStream
+
+
+class FakeSTT:
+    def __init__(self):
+        self.received = None
+
+    def transcribe(self, audio_data):
+        self.received = len(audio_data)
+        return "编钟有多少件"
+
+
+class SlowSTT:
+    """识别结果为收到的音频秒数，每次识别耗时50ms"""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def transcribe(self, audio_data):
+        with self.lock:
+            self.calls += 1
+        time.sleep(0.05)
+        return f"{len(audio_data) / 32000:.1f}秒"
+
+
+class FakeStreamingSTT(STTStream):
+    """每收到一帧就返回一个字，收满4帧判定句子结束"""
+
+    def __init__(self, on_partial=None):
+        super().__init__(on_partial)
+        self.frames = 0
+
+    def feed(self, frame):
+        if self.done:
+            return
+        self.frames += 1
+        self._update("编钟有多"[:self.frames], is_final=self.frames == 4)
+
+    def finish(self):
+        return self.text
+
+
+def test_stt_stream():
+    """测试部分结果回调和缓存回退"""
+    print("🔧 测试流式语音识别接口...")
+
+    partials = []
+    stream = FakeStreamingSTT(on_partial=lambda text, final: partials.append((text, final)))
+    for _ in range(6):
+        stream.feed(b"\x00" * 960)
+    assert stream.done and stream.finish() == "编钟有多"
+    assert partials[0] == ("编", False) and partials[-1] == ("编钟有多", True) and len(partials) == 4
+    print("✅ 部分识别结果实时回调，句子结束后不再处理音频")
+
+    stt = FakeSTT()
+    partials.clear()
+    stream = BufferedSTTStream(stt, on_partial=lambda text, final: partials.append((text, final)))
+    for _ in range(10):
+        stream.feed(b"\x00" * 960)
+    assert stream.finish() == "编钟有多少件"
+    assert stt.received == 9600 and partials == [("编钟有多少件", True)]
+    print("✅ 不支持流式的STT缓存音频后一次性识别")
+
+    stt = SlowSTT()
+    partials.clear()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        stream = IncrementalSTTStream(stt, on_partial=lambda text, final: partials.append((text, final)), executor=executor, interval_s=0.5)
+        for _ in range(100):  # 3秒音频，每帧30ms，模拟实时录音
+            stream.feed(b"\x00" * 960)
+            time.sleep(0.005)
+        partial_calls = stt.calls
+        assert stream.finish() == "3.0秒"
+    assert 1 <= partial_calls <= 6, partial_calls
+    assert partials[-1] == ("3.0秒", True)
+    assert all(not final for _, final in partials[:-1]) and len(partials) >= 2
+    print(f"✅ 本地模型录音期间定期给出部分结果（{partial_calls}次），结束后给出最终结果")
+
+    # 最后一次部分识别已覆盖全部音频：结束时直接复用，不再重复识别
+    stt = SlowSTT()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        stream = IncrementalSTTStream(stt, executor=executor, interval_s=1.5)
+        for _ in range(50):  # 1.5秒音频，最后一帧正好触发部分识别
+            stream.feed(b"\x00" * 960)
+        assert stream.finish() == "1.5秒"
+    assert stt.calls == 1
+    print("✅ 结束时复用已覆盖全部音频的部分识别结果")
+
+    print("\n✅ 流式语音识别接口测试完成")
+
+
+if __name__ == "__main__":
+    test_stt_stream()
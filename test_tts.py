@@ -34,7 +34,7 @@ def test_tts():
             
             # 保存音频文件
             with open("test_output.wav", "wb") as f:
-                f.write(audio_data)
+                f.write(audio_data.to_wav())
             print("💾 音频已保存为 test_output.wav")
         else:
             print("❌ 合成失败")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+测试TTS WebSocket连接池（使用本地模拟的TTS服务）
+"""
+import json
+import time
+import base64
+import socket
+import threading
+from types import SimpleNamespace
+
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_pool import TTSConnectionPool, TTSRequest, TTSError
+
+try:
+    from websockets.sync.server import serve
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
+
+class FakeTTSServer:
+    """收到end后把文本当作音频返回并发送done；"错误"返回error，"沉默"不回复，收到drop时主动断开"""
+
+    def __init__(self):
+        self.connections = 0
+        self.server = serve(self.handle, "127.0.0.1", 0)
+        self.url = f"ws://127.0.0.1:{self.server.socket.getsockname()[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, ws):
+        self.connections += 1
+        for message in ws:
+            data = json.loads(message)
+            if data["type"] == "text":
+                text = data["text"]
+            elif data["type"] == "end":
+                if text == "错误":
+                    ws.send(json.dumps({"type": "error", "message": "bad voice"}))
+                elif text != "沉默":
+                    time.sleep(0.05)
+                    ws.send(json.dumps({"type": "audio", "audio": base64.b64encode(text.encode()).decode()}))
+                    ws.send(json.dumps({"type": "done"}))
+            elif data["type"] == "drop":
+                return
+
+
+def synthesize(pool):
+    done = threading.Event()
+    chunks = []
+
+    def on_message(data):
+        if data["type"] == "audio":
+            chunks.append(base64.b64decode(data["audio"]))
+        elif data["type"] == "done":
+            done.set()
+
+    listener = SimpleNamespace(on_message=on_message, on_disconnect=lambda reason: done.set())
+    with pool.connection(listener) as conn:
+        conn.send({"type": "text", "text": "你好"})
+        conn.send({"type": "end"})
+        assert done.wait(5)
+    return b"".join(chunks)
+
+
+def test_tts_pool():
+    """测试连接复用、断线重连和连接失败退避"""
+    print("🔧 测试TTS连接池...")
+    if not WEBSOCKETS_AVAILABLE:
+        print("⚠️ websockets 未安装，跳过")
+        return
+
+    server = FakeTTSServer()
+    pool = TTSConnectionPool(server.url, headers=[], size=1, ping_interval=0)
+    assert pool.warmup(timeout=5) == 1
+    for _ in range(3):
+        assert synthesize(pool) == "你好".encode()
+    assert server.connections == 1
+    print("✅ 多次合成复用同一条连接")
+
+    with pool.connection(SimpleNamespace(on_message=lambda d: None, on_disconnect=lambda r: None)) as conn:
+        conn.send({"type": "drop"})
+    deadline = time.time() + 5
+    while pool.stats()["connects"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert synthesize(pool) == "你好".encode()
+    assert server.connections == 2 and pool.stats()["connects"] == 2
+    print("✅ 服务端断开后自动重连")
+    messages = lambda text: [{"type": "text", "text": text}, {"type": "end"}]
+    pool.close()
+    pool = TTSConnectionPool(server.url, headers=[], size=3, ping_interval=0)
+    pool.warmup(timeout=5)
+    texts = ["第一句", "第二句", "第三句"]
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda t: pool.submit(TTSRequest(t), messages(t)).wait(5), texts))
+    assert results == [t.encode() for t in texts]
+    print("✅ 同一连接池上并发合成互不干扰")
+
+    t_start = time.perf_counter()
+    try:
+        pool.submit(TTSRequest("错误"), messages("错误")).wait(5)
+        raise AssertionError("expected TTSError")
+    except TTSError:
+        pass
+    assert time.perf_counter() - t_start < 1
+    try:
+        pool.submit(TTSRequest("沉默"), messages("沉默")).wait(0.2)
+        raise AssertionError("expected TimeoutError")
+    except TimeoutError:
+        pass
+    print("✅ 错误和超时立即通知等待方")
+
+    request = pool.submit(TTSRequest("沉默"), messages("沉默"))
+    assert request.future.cancel()
+    deadline = time.time() + 5
+    while pool.stats()["idle"] < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert pool.stats()["idle"] == 3
+    print("✅ 调用方取消Future（如asyncio超时）后连接仍归还")
+
+    errors = []
+    for _ in range(200):
+        request = TTSRequest("竞争")
+        barrier = threading.Barrier(3)
+
+        def finish(action):
+            barrier.wait()
+            try:
+                action()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=finish, args=(lambda: request.on_message({"type": "done"}),)),
+            threading.Thread(target=finish, args=(lambda: request.cancel(TimeoutError("timeout")),)),
+            threading.Thread(target=finish, args=(request.future.cancel,)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert request.future.done()
+    assert not errors, errors
+    print("✅ 多个线程同时结束同一请求不会出错")
+
+    deadline = time.time() + 5
+    while pool.stats()["idle"] < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert pool.submit(TTSRequest("恢复"), messages("恢复")).wait(5) == "恢复".encode()
+    print("✅ 出错的连接归还后重连可用")
+    pool.close()
+
+    pool = TTSConnectionPool(server.url, headers=[], size=1, ping_interval=0)
+    pool.warmup(timeout=5)
+    for _ in range(3):
+        try:
+            pool.submit(TTSRequest("沉默"), messages("沉默")).wait(0.1)
+        except TimeoutError:
+            pass
+        # 单连接池：出错后紧接着的请求等重连完成，不会拿到已关闭的连接
+        assert pool.submit(TTSRequest("恢复"), messages("恢复")).wait(5) == "恢复".encode()
+    print("✅ 出错的连接重连完成前不会被再次取出")
+    pool.close()
+    server.server.shutdown()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    pool = TTSConnectionPool(f"ws://127.0.0.1:{port}", headers=[], size=1, connect_timeout=0.5, backoff_base=0.05)
+    try:
+        synthesize(pool)
+        raise AssertionError("expected ConnectionError")
+    except ConnectionError:
+        pass
+    assert pool.connections[0].failures >= 2
+    pool.close()
+    print("✅ 连接失败时按退避重试并报错")
+
+    print("\n✅ TTS连接池测试完成")
+
+
+if __name__ == "__main__":
+    test_tts_pool()
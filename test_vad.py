@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+测试VAD录音端点检测
+"""
+import numpy as np
+
+from vad import EnergyVAD, SpeechEndpointer
+
+FRAME_MS = 30
+FRAME_SAMPLES = 16000 * FRAME_MS // 1000
+
+
+def tone(ms, amplitude):
+    t = np.arange(16000 * ms // 1000) / 16000
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16).tobytes()
+
+
+def noise(ms, amplitude=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, amplitude, 16000 * ms // 1000).astype(np.int16).tobytes()
+
+
+def run(audio, **kwargs):
+    endpointer = SpeechEndpointer(EnergyVAD(), frame_ms=FRAME_MS, **kwargs)
+    frame_bytes = FRAME_SAMPLES * 2
+    for start in range(0, len(audio), frame_bytes):
+        if endpointer.push(audio[start:start + frame_bytes]):
+            break
+    return endpointer
+
+
+def test_vad():
+    """测试尾部静音结束、未开口超时和最长时长"""
+    print("🔧 测试VAD端点检测...")
+
+    audio = noise(300) + tone(1200, 8000) + noise(3000, seed=1)
+    endpointer = run(audio, trailing_silence_ms=600)
+    assert endpointer.stop_reason == "silence"
+    assert 2000 <= endpointer.elapsed_ms <= 2200
+    print(f"✅ 说完后静音600ms即结束 ({endpointer.elapsed_ms}ms，而不是录满{len(audio) // 32}ms)")
+
+    endpointer = run(noise(300) + tone(20, 8000) + noise(6000, seed=2), no_speech_timeout_s=2)
+    assert endpointer.stop_reason == "no_speech"
+    print("✅ 短促噪声不算开口，未说话时超时结束")
+
+    endpointer = run(noise(300) + tone(5000, 8000), max_duration_s=3)
+    assert endpointer.stop_reason == "max_duration" and endpointer.elapsed_ms <= 3030
+    print("✅ 达到最长时长时结束")
+
+    print("\n✅ VAD端点检测测试完成")
+
+
+if __name__ == "__main__":
+    test_vad()
@@ -0,0 +1,358 @@
+"""
+TTS WebSocket连接池 - 预先建立并保持已认证的长连接，多次合成复用，省去每句话的TLS握手
+每个连接在自己的后台线程里运行，按间隔发送ping做健康检查，断开后按指数退避自动重连
+每次合成的状态保存在独立的 TTSRequest 中，完成/出错/超时通过 Future 立即通知等待方
+"""
+import json
+import time
+import queue
+import base64
+import random
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import websocket
+
+from audio_buffer import AudioFormat, PCMBuffer, PCM16_MONO_16K
+from audio_format import WavStreamDecoder
+
+
+class TTSError(RuntimeError):
+    """TTS服务返回的错误"""
+
+
+class TTSRequest:
+    """一次合成请求的状态，作为连接的 listener 接收消息"""
+
+    def __init__(
+        self,
+        text: str,
+        callback: Optional[Callable[[bytes], None]] = None,
+        on_first_audio: Optional[Callable[[float], None]] = None,
+        output_format: AudioFormat = PCM16_MONO_16K,
+    ):
+        self.text = text
+        self.callback = callback
+        self.on_first_audio = on_first_audio
+        self.future: Future = Future()
+        # 服务端返回的WAV片段在这里解码为 output_format 的裸PCM，回调和累积的都是PCM
+        self.output_format = output_format
+        self.decoder = WavStreamDecoder(output_format, target=output_format)
+        self.audio = PCMBuffer.of_format(output_format)
+        self.start_time = time.perf_counter()
+        self.first_audio_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.connection: Optional["PooledConnection"] = None  # submit() 后绑定
+        # websocket线程（完成/出错/断开）和调用方（超时取消/发送失败）可能同时结束请求
+        self._finish_lock = threading.Lock()
+
+    def _finish(self, error: Optional[BaseException] = None) -> None:
+        with self._finish_lock:
+            if self.future.done():
+                return
+            self.end_time = time.perf_counter()
+            try:
+                if error is None:
+                    self.future.set_result(self.audio.view())
+                else:
+                    self.future.set_exception(error)
+            except InvalidStateError:
+                # 调用方直接 future.cancel()（如asyncio超时）不经过这把锁
+                pass
+
+    def on_message(self, data: Dict) -> None:
+        kind = data.get("type")
+        if kind == "audio":
+            chunk = self.decoder.feed(base64.b64decode(data["audio"]))
+            if not chunk:
+                return
+            if self.first_audio_time is None:
+                self.first_audio_time = time.perf_counter()
+                if self.on_first_audio:
+                    self.on_first_audio((self.first_audio_time - self.start_time) * 1000.0)
+            self.audio.append(chunk)
+            if self.callback:
+                try:
+                    self.callback(chunk)
+                except Exception as e:
+                    logging.error("TTS audio callback failed: %s", e)
+        elif kind == "audio.done":
+            logging.debug("Audio generation completed")
+        elif kind == "done":
+            self._finish()
+        elif kind == "error":
+            self._finish(TTSError(data.get("message", "Unknown error")))
+
+    def on_disconnect(self, reason: str) -> None:
+        self._finish(ConnectionError(f"TTS connection lost: {reason}"))
+
+    def cancel(self, error: BaseException) -> None:
+        self._finish(error)
+
+    def feed(self, text: str) -> None:
+        """流式追加一段文本（服务端边收边合成）；请求已结束时忽略，错误在 wait() 时抛出"""
+        self.text += text
+        self.send({"type": "text", "text": text})
+
+    def end(self) -> None:
+        """文本发送完毕"""
+        self.send({"type": "end"})
+
+    def send(self, message: Dict) -> None:
+        connection = self.connection
+        if connection is None or self.future.done():
+            return
+        try:
+            connection.send(message)
+        except Exception as e:
+            self.cancel(e)
+
+    def wait(self, timeout: Optional[float] = None) -> bytes:
+        """阻塞到合成完成，超时抛出 TimeoutError，服务端错误抛出 TTSError"""
+        try:
+            return self.future.result(timeout)
+        except FutureTimeoutError:
+            self.cancel(TimeoutError(f"TTS synthesis timed out after {timeout}s"))
+            return self.future.result()
+
+    @property
+    def performance(self) -> Dict:
+        end_time = self.end_time or time.perf_counter()
+        return {
+            "first_audio_ms": (self.first_audio_time - self.start_time) * 1000.0 if self.first_audio_time else 0,
+            "total_synthesis_ms": (end_time - self.start_time) * 1000.0,
+            "chinese_count": sum(1 for ch in self.text if "\u4e00" <= ch <= "\u9fff"),
+        }
+
+
+class PooledConnection:
+    """连接池中的一条长连接，listener 是当前占用该连接的请求"""
+
+    def __init__(
+        self,
+        url: str,
+        headers: List[str],
+        ping_interval: float = 20,
+        ping_timeout: float = 10,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30,
+        on_open: Optional[Callable[["PooledConnection"], None]] = None,
+    ):
+        self.url = url
+        self.headers = headers
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.listener = None  # 需提供 on_message(data) / on_disconnect(reason)
+        self.on_open = on_open  # 每次（重新）连上时回调
+        self.opened = threading.Event()
+        self.connect_count = 0
+        self.failures = 0
+        self._ws: Optional[websocket.WebSocketApp] = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="tts-ws")
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._ws = websocket.WebSocketApp(
+                self.url,
+                header=self.headers,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close,
+            )
+            connects = self.connect_count
+            self._ws.run_forever(ping_interval=self.ping_interval, ping_timeout=self.ping_timeout)
+            # reset() 会提前清除 opened，因此用连接计数判断本轮是否连上过
+            was_open = self.connect_count > connects
+            self.opened.clear()
+            self._notify_disconnect("connection closed")
+            if self._stopped.is_set():
+                break
+
+            # 连上过则立即重连，连续失败时指数退避（带抖动，避免多条连接同时重试）
+            self.failures = 0 if was_open else self.failures + 1
+            delay = 0 if was_open else min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+            if delay:
+                delay *= random.uniform(0.5, 1.0)
+                logging.warning("TTS connection failed %d time(s), reconnecting in %.1fs", self.failures, delay)
+            self._stopped.wait(delay)
+
+    def _on_open(self, ws) -> None:
+        self.connect_count += 1
+        self.failures = 0
+        self.opened.set()
+        logging.info("Connected to TTS server: %s", self.url)
+        if self.on_open is not None:
+            self.on_open(self)
+
+    def _on_message(self, ws, message) -> None:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logging.error("Invalid TTS message: %r", message[:100])
+            return
+        listener = self.listener
+        if listener is not None:
+            listener.on_message(data)
+        else:
+            logging.debug("Dropping TTS message with no active request: %s", data.get("type"))
+
+    def _on_error(self, ws, error) -> None:
+        logging.error("TTS WebSocket error: %s", error)
+
+    def _on_close(self, ws, close_status_code, close_msg) -> None:
+        logging.info("TTS WebSocket connection closed (%s)", close_status_code)
+
+    def _notify_disconnect(self, reason: str) -> None:
+        listener = self.listener
+        if listener is not None:
+            listener.on_disconnect(reason)
+
+    @property
+    def healthy(self) -> bool:
+        ws = self._ws
+        return self.opened.is_set() and ws is not None and ws.sock is not None and ws.sock.connected
+
+    def wait_ready(self, timeout: Optional[float]) -> bool:
+        return self.opened.wait(timeout)
+
+    def send(self, message: Dict) -> None:
+        self._ws.send(json.dumps(message, ensure_ascii=False))
+
+    def reset(self) -> None:
+        """主动断开，后台线程会立即重连（用于请求中途出错、连接状态不确定时）；
+        立即清除 opened，重连完成前 wait_ready() 不会返回True"""
+        self.opened.clear()
+        ws = self._ws
+        sock = ws.sock if ws is not None else None
+        if sock is not None:
+            # 跨线程用 abort()（shutdown socket）唤醒后台线程的 select；
+            # ws.close() 会与后台线程并发读取关闭帧，可能让 run_forever 一直卡住
+            try:
+                sock.send_close()
+            except Exception:
+                pass
+            sock.abort()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self.reset()
+        self._thread.join(timeout=2)
+
+
+class TTSConnectionPool:
+    """固定大小的TTS连接池，connection() 取出一条健康的连接，用完自动归还"""
+
+    def __init__(
+        self,
+        url: str,
+        headers: List[str],
+        size: int = 2,
+        connect_timeout: float = 10,
+        ping_interval: float = 20,
+        ping_timeout: float = 10,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30,
+    ):
+        self.url = url
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self._idle: "queue.Queue[PooledConnection]" = queue.Queue()
+        self._reconnecting = set()  # 已断开、重连完成后才放回空闲队列的连接
+        self._lock = threading.Lock()
+        self.connections = [
+            PooledConnection(url, headers, ping_interval, ping_timeout, backoff_base, backoff_max, on_open=self._on_connection_open)
+            for _ in range(size)
+        ]
+        for conn in self.connections:
+            self._idle.put(conn)
+
+    def warmup(self, timeout: Optional[float] = None) -> int:
+        """等待连接建立，返回已就绪的连接数"""
+        deadline = time.perf_counter() + (timeout if timeout is not None else self.connect_timeout)
+        for conn in self.connections:
+            conn.wait_ready(max(0.0, deadline - time.perf_counter()))
+        return sum(1 for conn in self.connections if conn.healthy)
+
+    def _checkout(self, timeout: float) -> PooledConnection:
+        deadline = time.perf_counter() + timeout
+        try:
+            conn = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No idle TTS connection available")
+        # 健康检查：优先等待当前连接（重连中）就绪，超时则归还并报错；
+        # opened 已置位但socket已断开（后台线程尚未察觉）时继续等待
+        while not conn.healthy:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not conn.wait_ready(remaining):
+                self._idle.put(conn)
+                raise ConnectionError(f"TTS server unreachable: {self.url}")
+            if not conn.healthy:
+                time.sleep(0.01)
+        return conn
+
+    def _release(self, conn: PooledConnection, failed: bool) -> None:
+        conn.listener = None
+        if not failed:
+            self._idle.put(conn)
+            return
+        # 出错时连接上可能还有未收完的消息：断开重连，连上后由 _on_connection_open 放回空闲队列
+        with self._lock:
+            self._reconnecting.add(conn)
+        conn.reset()
+
+    def _on_connection_open(self, conn: PooledConnection) -> None:
+        with self._lock:
+            if conn not in self._reconnecting:
+                return
+            self._reconnecting.discard(conn)
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, listener, timeout: Optional[float] = None):
+        conn = self._checkout(timeout if timeout is not None else self.connect_timeout)
+        conn.listener = listener
+        failed = False
+        try:
+            yield conn
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._release(conn, failed)
+
+    def submit(self, request: TTSRequest, messages: List[Dict], timeout: Optional[float] = None) -> TTSRequest:
+        """在空闲连接上发出请求后立即返回；请求结束（完成/出错/超时）时连接自动归还"""
+        conn = self._checkout(timeout if timeout is not None else self.connect_timeout)
+        conn.listener = request
+        request.connection = conn
+
+        def release(future: Future) -> None:
+            request.connection = None
+            # 出错、超时或被调用方取消时连接上可能还有未收完的消息，断开重连
+            self._release(conn, future.cancelled() or future.exception() is not None)
+
+        request.future.add_done_callback(release)
+        for message in messages:
+            request.send(message)
+        return request
+
+    def stats(self) -> Dict:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "healthy": sum(1 for conn in self.connections if conn.healthy),
+            "connects": sum(conn.connect_count for conn in self.connections),
+        }
+
+    def close(self) -> None:
+        for conn in self.connections:
+            conn.close()
@@ -0,0 +1,116 @@
+"""
+语音活动检测(VAD) - 录音时判断说话是否结束
+默认基于能量（NumPy计算每帧RMS，噪声底随环境自适应），安装了webrtcvad时可选用webrtcvad
+SpeechEndpointer 在说话后出现足够长的静音、始终没有开口或达到最长时长时结束录音
+"""
+import logging
+from typing import Optional
+
+import numpy as np
+
+# webrtcvad导入
+try:
+    import webrtcvad
+    WEBRTCVAD_AVAILABLE = True
+except ImportError:
+    WEBRTCVAD_AVAILABLE = False
+
+
+class EnergyVAD:
+    """能量VAD：RMS超过 噪声底 x threshold_ratio（且不低于 min_rms）视为语音"""
+
+    def __init__(self, threshold_ratio: float = 3.0, min_rms: float = 300.0, calibration_frames: int = 10, noise_alpha: float = 0.05):
+        self.threshold_ratio = threshold_ratio
+        self.min_rms = min_rms
+        self.calibration_frames = calibration_frames
+        self.noise_alpha = noise_alpha
+        self.noise_rms: Optional[float] = None
+        self._calibration = []
+
+    @staticmethod
+    def rms(frame) -> float:
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+    def is_speech(self, frame) -> bool:
+        level = self.rms(frame)
+        # 开头几帧估计环境噪声（取最小值，用户立即开口也不会把语音当噪声）
+        if self.noise_rms is None:
+            self._calibration.append(level)
+            if len(self._calibration) >= self.calibration_frames:
+                self.noise_rms = min(self._calibration)
+            return level > self.min_rms * self.threshold_ratio
+
+        speech = level > max(self.min_rms, self.noise_rms * self.threshold_ratio)
+        if not speech:
+            self.noise_rms += self.noise_alpha * (level - self.noise_rms)
+        return speech
+
+
+class WebRTCVAD:
+    """webrtcvad封装；帧长须为10/20/30ms，采样率须为8k/16k/32k/48kHz"""
+
+    def __init__(self, sample_rate: int = 16000, aggressiveness: int = 2):
+        if not WEBRTCVAD_AVAILABLE:
+            raise ImportError("webrtcvad not installed. Run: pip install webrtcvad")
+        self.sample_rate = sample_rate
+        self.vad = webrtcvad.Vad(aggressiveness)
+
+    def is_speech(self, frame) -> bool:
+        return self.vad.is_speech(bytes(frame), self.sample_rate)
+
+
+def create_vad(backend: str = "auto", sample_rate: int = 16000):
+    """backend: auto | energy | webrtc"""
+    if backend == "webrtc" or (backend == "auto" and WEBRTCVAD_AVAILABLE and sample_rate in (8000, 16000, 32000, 48000)):
+        return WebRTCVAD(sample_rate)
+    return EnergyVAD()
+
+
+class SpeechEndpointer:
+    """逐帧判断录音是否应该结束，stop_reason 记录结束原因"""
+
+    def __init__(
+        self,
+        vad,
+        frame_ms: int = 30,
+        trailing_silence_ms: int = 800,
+        max_duration_s: float = 15,
+        no_speech_timeout_s: float = 5,
+        min_speech_ms: int = 120,
+    ):
+        self.vad = vad
+        self.frame_ms = frame_ms
+        self.trailing_silence_ms = trailing_silence_ms
+        self.max_duration_ms = max_duration_s * 1000
+        self.no_speech_timeout_ms = no_speech_timeout_s * 1000
+        self.min_speech_ms = min_speech_ms
+
+        self.elapsed_ms = 0
+        self.speech_run_ms = 0
+        self.silence_ms = 0
+        self.speech_started = False
+        self.stop_reason: Optional[str] = None
+
+    def push(self, frame) -> bool:
+        """送入一帧，返回是否应停止录音"""
+        self.elapsed_ms += self.frame_ms
+        if self.vad.is_speech(frame):
+            self.speech_run_ms += self.frame_ms
+            self.silence_ms = 0
+            # 连续语音足够长才算开口，过滤咳嗽、敲击等短促噪声
+            if self.speech_run_ms >= self.min_speech_ms:
+                self.speech_started = True
+        else:
+            self.speech_run_ms = 0
+            self.silence_ms += self.frame_ms
+
+        if self.speech_started and self.silence_ms >= self.trailing_silence_ms:
+            self.stop_reason = "silence"
+        elif not self.speech_started and self.elapsed_ms >= self.no_speech_timeout_ms:
+            self.stop_reason = "no_speech"
+        elif self.elapsed_ms >= self.max_duration_ms:
+            self.stop_reason = "max_duration"
+        if self.stop_reason:
+            logging.debug("Recording stopped after %d ms: %s", self.elapsed_ms, self.stop_reason)
+        return self.stop_reason is not None
@@ -8,7 +8,8 @@ import logging
 from typing import List
 
 from dotenv import load_dotenv
-from rag_chain import build_chain
+from rag_chain import build_chain_with_docs, build_sources
+from conversation_memory import build_conversation_memory
 from voice_interface import VoiceInterface
 
 
@@ -21,7 +22,7 @@ class VoiceRAGCLI:
         
         # 初始化RAG系统
         print("正在初始化RAG系统...")
-        self.chain, self.retriever = build_chain()
+        self.chain, self.retriever = build_chain_with_docs()
         print("RAG系统初始化完成！")
         
         # 初始化语音系统
@@ -34,7 +35,7 @@ class VoiceRAGCLI:
         self.auto_tts = os.getenv("AUTO_TTS", "true").lower() == "true"
         self.record_duration = int(os.getenv("RECORD_DURATION", "5"))
         
-        self.chat_history: List[str] = []
+        self.memory = build_conversation_memory()
     
     def setup_logging(self):
         level = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -88,11 +89,6 @@ class VoiceRAGCLI:
             print("\n--- 引用 ---")
             for i, s in enumerate(sources, 1):
                 print(f"{i}. {s['source']} ({s['locator']})")
-        
-        # 自动语音输出
-        if self.auto_tts and answer.strip():
-            print("\n🔊 正在播放回答...")
-            self.voice.text_to_voice(answer)
     
     def process_question(self, question: str):
         """处理单个问题 - 完整的RAG流程"""
@@ -107,7 +103,7 @@ class VoiceRAGCLI:
         
         # 第一步：检索相关文档（RAG的核心）
         t_retrieval_start = time.perf_counter()
-        docs = self.retriever.invoke(question)
+        docs = self.retriever.invoke(self.memory.rewrite_question(question))
         t_retrieval_end = time.perf_counter()
         
         if not docs:
@@ -120,41 +116,53 @@ class VoiceRAGCLI:
         print(f"✅ 检索到 {len(docs)} 个相关文档片段")
         print("🔄 正在生成回答...")
         
-        # 第二步：使用检索到的文档生成回答
+        # 第二步：使用检索到的文档流式生成回答，开启语音输出时边生成边朗读
+        speech = self.voice.start_speech_stream() if self.auto_tts else None
         t_generation_start = time.perf_counter()
-        answer = self.chain.invoke({
+        first_token_time = None
+        answer = ""
+        tokens = self.chain.stream({
             "question": question, 
-            "chat_history": "\n".join(self.chat_history)
+            "chat_history": self.memory.render(),
+            "docs": docs
         })
+        try:
+            for chunk in (speech.tee(tokens) if speech else tokens):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                answer += chunk
+        except BaseException:
+            # 生成中途出错时结束朗读，归还TTS连接
+            if speech:
+                speech.cancel()
+            raise
         t_generation_end = time.perf_counter()
         
         # 统计中文字符
         chinese_count = sum(1 for ch in answer if "\u4e00" <= ch <= "\u9fff")
         
         # 准备引用信息
-        sources = []
-        for d in docs:
-            source = d.metadata.get("source", "unknown")
-            page = d.metadata.get("page")
-            chunk_id = d.metadata.get("chunk_id")
-            locator = f"page {page}" if page is not None else f"chunk {chunk_id}"
-            sources.append({"source": source, "locator": locator})
+        sources = build_sources(docs)
         
         # 性能统计
         performance_stats = {
             "retrieval_ms": (t_retrieval_end - t_retrieval_start) * 1000.0,
             "generation_ms": (t_generation_end - t_generation_start) * 1000.0,
-            "first_token_ms": None,  # 非流式模式无法获取
+            "first_token_ms": (first_token_time - t_generation_start) * 1000.0 if first_token_time else None,
             "total_ms": (t_retrieval_end - t_retrieval_start + t_generation_end - t_generation_start) * 1000.0,
             "chinese_count": chinese_count
         }
         
-        # 显示回答
-        self.display_response(answer, sources, performance_stats)
+        # 显示回答，然后等待语音朗读结束
+        try:
+            self.display_response(answer, sources, performance_stats)
+        finally:
+            if speech:
+                print("\n🔊 正在播放回答...")
+                speech.finish()
         
         # 更新聊天历史
-        self.chat_history.append(f"用户: {question}")
-        self.chat_history.append("助手: [上一轮回答略]")
+        self.memory.add_turn(question, answer)
     
     def run(self):
         """运行语音RAG CLI"""
@@ -1,18 +1,25 @@
 """
-语音接口模块 - 只支持GummySTT和qwen3-tts-flash
+语音接口模块 - 支持GummySTT、本地WhisperSTT（faster-whisper）和qwen3-tts-flash
 """
 import os
-import io
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any
 from abc import ABC, abstractmethod
 
 import pyaudio
-import wave
 import numpy as np
 from dotenv import load_dotenv
 
+from speech_pipeline import SpeechStream
+from audio_playback import AudioPlaybackSink
+from audio_buffer import PCMBuffer, AudioFormat, PCM16_MONO_16K
+from audio_format import decode_audio, convert, frame_converter
+from vad import create_vad, SpeechEndpointer
+from stt_stream import STTStream, BufferedSTTStream, IncrementalSTTStream, PartialCallback
+
 # 阿里云DashScope导入
 try:
     import dashscope
@@ -21,12 +28,16 @@ try:
 except ImportError:
     DASHSCOPE_AVAILABLE = False
 
+# faster-whisper导入（本地离线识别，CTranslate2 int8推理）
+try:
+    from faster_whisper import WhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
 # WebSocket导入
 try:
-    import websocket
-    import json
-    import threading
-    import io
+    from tts_pool import TTSConnectionPool, TTSRequest
     WEBSOCKET_AVAILABLE = True
 except ImportError:
     WEBSOCKET_AVAILABLE = False
@@ -35,41 +46,27 @@ except ImportError:
 class STTModel(ABC):
     """语音转文本基类"""
     
+    # 识别器需要的音频格式，调用方按此格式送入音频（或由 transcribe 内部转换）
+    input_format: AudioFormat = PCM16_MONO_16K
+    
     @abstractmethod
-    def transcribe(self, audio_data: bytes) -> str:
+    def transcribe(self, audio_data) -> str:
+        """audio_data: PCMBuffer（带格式）、WAV文件内容或 input_format 格式的裸PCM"""
         pass
+    
+    def start_stream(self, on_partial: Optional[PartialCallback] = None) -> STTStream:
+        """开始流式识别；默认实现先缓存音频，结束时一次性识别，支持流式的模型应覆盖"""
+        return BufferedSTTStream(self, on_partial, self.input_format)
 
 
-class GummySTT(STTModel):
-    """阿里云Gummy一句话识别STT"""
+class GummySTTStream(STTStream):
+    """Gummy流式识别会话：录音帧直接送入识别器，识别结果实时回调"""
     
-    def __init__(self, api_key: str = None, model: str = "gummy-chat-v1"):
-        if not DASHSCOPE_AVAILABLE:
-            raise ImportError("dashscope not installed. Run: pip install dashscope")
-        
-        # 设置API Key
-        if api_key:
-            dashscope.api_key = api_key
-        elif os.getenv("DASHSCOPE_API_KEY"):
-            dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
-        else:
-            raise ValueError("DASHSCOPE_API_KEY not found. Please set it in environment or pass api_key parameter")
+    def __init__(self, model: str, on_partial: Optional[PartialCallback] = None, sample_rate: int = 16000):
+        super().__init__(on_partial)
+        stream = self
         
-        self.model = model
-        self.recognized_text = ""
-        self.recognition_complete = False
-        logging.info(f"Gummy STT initialized with model: {model}")
-    
-    def transcribe(self, audio_data: bytes) -> str:
-        """使用Gummy进行语音识别"""
-        self.recognized_text = ""
-        self.recognition_complete = False
-        
-        # 创建回调类
         class GummyCallback(TranslationRecognizerCallback):
-            def __init__(self, parent):
-                self.parent = parent
-            
             def on_open(self) -> None:
                 logging.info("Gummy STT connection opened")
             
@@ -79,57 +76,165 @@ class GummySTT(STTModel):
             def on_event(self, request_id, transcription_result: TranscriptionResult, 
                         translation_result: TranslationResult, usage) -> None:
                 if transcription_result is not None:
-                    self.parent.recognized_text = transcription_result.text
+                    stream._update(transcription_result.text, transcription_result.is_sentence_end)
                     if transcription_result.is_sentence_end:
-                        self.parent.recognition_complete = True
-                        logging.info(f"Gummy STT recognition complete: {self.parent.recognized_text}")
+                        logging.info(f"Gummy STT recognition complete: {transcription_result.text}")
         
-        # 创建识别器
-        callback = GummyCallback(self)
-        recognizer = TranslationRecognizerChat(
-            model=self.model,
+        self.recognizer = TranslationRecognizerChat(
+            model=model,
             format="pcm",
-            sample_rate=16000,
+            sample_rate=sample_rate,
             transcription_enabled=True,
             translation_enabled=False,  # 只做识别，不做翻译
-            callback=callback,
+            callback=GummyCallback(),
         )
+        self.recognizer.start()
+        self.closed = False
+    
+    def feed(self, frame) -> None:
+        if self.closed or self.done:
+            return
+        try:
+            if not self.recognizer.send_audio_frame(bytes(frame)):  # SDK只接受bytes
+                self.closed = True
+        except Exception as e:
+            logging.error(f"Gummy STT send failed: {e}")
+            self.closed = True
+    
+    def finish(self) -> str:
+        try:
+            self.recognizer.stop()
+        except Exception as e:
+            logging.error(f"Gummy STT recognition failed: {e}")
+        return self.text.strip()
+
+
+class GummySTT(STTModel):
+    """阿里云Gummy一句话识别STT"""
+    
+    def __init__(self, api_key: str = None, model: str = "gummy-chat-v1"):
+        if not DASHSCOPE_AVAILABLE:
+            raise ImportError("dashscope not installed. Run: pip install dashscope")
+        
+        # 设置API Key
+        if api_key:
+            dashscope.api_key = api_key
+        elif os.getenv("DASHSCOPE_API_KEY"):
+            dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+        else:
+            raise ValueError("DASHSCOPE_API_KEY not found. Please set it in environment or pass api_key parameter")
         
+        self.model = model
+        logging.info(f"Gummy STT initialized with model: {model}")
+    
+    def start_stream(self, on_partial: Optional[PartialCallback] = None) -> STTStream:
+        return GummySTTStream(self.model, on_partial, self.input_format.sample_rate)
+    
+    def transcribe(self, audio_data) -> str:
+        """使用Gummy进行语音识别（整段音频）"""
         try:
-            # 启动识别
-            recognizer.start()
-            
-            # 分块发送音频数据
-            chunk_size = 3200  # 约100ms的音频数据
-            for i in range(0, len(audio_data), chunk_size):
-                chunk = audio_data[i:i + chunk_size]
-                if not recognizer.send_audio_frame(chunk):
-                    break
-                if self.recognition_complete:
-                    break
-            
-            # 停止识别
-            recognizer.stop()
-            
-            return self.recognized_text.strip()
+            # 去掉WAV头并转换为识别器要求的格式，再按实际格式分块（零拷贝切片）；
+            # 先解码再打开识别会话，解码失败时不会留下未关闭的连接
+            audio_data = convert(decode_audio(audio_data, self.input_format), self.input_format)
+            stream = self.start_stream()
+            try:
+                for chunk in audio_data.frames(100):  # 每块约100ms
+                    stream.feed(chunk)
+                    if stream.done or stream.closed:
+                        break
+            finally:
+                text = stream.finish()
+            return text
             
         except Exception as e:
             logging.error(f"Gummy STT recognition failed: {e}")
             return ""
 
 
+class WhisperSTT(STTModel):
+    """本地Whisper识别（faster-whisper），CPU上默认int8量化推理，不依赖网络"""
+    
+    _models: Dict[tuple, Any] = {}
+    _models_lock = threading.Lock()
+    
+    def __init__(
+        self,
+        model_size: str = "base",
+        device: str = "cpu",
+        compute_type: str = "int8",
+        cpu_threads: int = 0,
+        num_workers: int = 1,
+        language: Optional[str] = "zh",
+        beam_size: int = 1,
+        partial_interval: float = 1.0,
+    ):
+        if not FASTER_WHISPER_AVAILABLE:
+            raise ImportError("faster-whisper not installed. Run: pip install faster-whisper")
+        
+        self.language = language
+        self.beam_size = beam_size
+        self.partial_interval = partial_interval
+        self.model = self._load_model(model_size, device, compute_type, cpu_threads, num_workers)
+        # 部分结果在线程池里识别，不阻塞录音线程；num_workers>1 时模型可以并行处理多段音频
+        self.executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="whisper-stt")
+        logging.info(f"Whisper STT initialized: {model_size} ({device}, {compute_type})")
+    
+    @classmethod
+    def _load_model(cls, model_size: str, device: str, compute_type: str, cpu_threads: int, num_workers: int):
+        """同一配置的模型在进程内只加载一次"""
+        key = (model_size, device, compute_type, cpu_threads, num_workers)
+        with cls._models_lock:
+            if key not in cls._models:
+                cls._models[key] = WhisperModel(
+                    model_size,
+                    device=device,
+                    compute_type=compute_type,
+                    cpu_threads=cpu_threads,
+                    num_workers=num_workers,
+                )
+            return cls._models[key]
+    
+    def start_stream(self, on_partial: Optional[PartialCallback] = None) -> STTStream:
+        return IncrementalSTTStream(self, on_partial, self.input_format, self.executor, self.partial_interval)
+    
+    def transcribe(self, audio_data) -> str:
+        """识别整段音频；模型直接接收float32采样，不经过临时文件"""
+        try:
+            audio = convert(decode_audio(audio_data, self.input_format), self.input_format)
+            if not audio:
+                return ""
+            samples = np.frombuffer(audio.view(), dtype=np.int16).astype(np.float32) / 32768.0
+            segments, _ = self.model.transcribe(
+                samples,
+                language=self.language,
+                beam_size=self.beam_size,
+                condition_on_previous_text=False,
+            )
+            return "".join(segment.text for segment in segments).strip()
+        except Exception as e:
+            logging.error(f"Whisper STT recognition failed: {e}")
+            return ""
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
 class TTSModel(ABC):
     """文本转语音基类"""
     
+    # 合成音频的格式，流式回调收到的是该格式的裸PCM
+    output_format: AudioFormat = PCM16_MONO_16K
+    
     @abstractmethod
-    def synthesize(self, text: str) -> bytes:
+    def synthesize(self, text: str):
+        """返回 output_format 的 PCMBuffer，或WAV文件内容"""
         pass
 
 
 class Qwen3TTSRealtime(TTSModel):
     """Qwen3 TTS Realtime模型 - 使用WebSocket连接"""
     
-    def __init__(self, api_key: str = None, model: str = "qwen3-tts-flash-realtime"):
+    def __init__(self, api_key: str = None, model: str = "qwen3-tts-flash-realtime", pool_size: int = 2):
         if not WEBSOCKET_AVAILABLE:
             raise ImportError("websocket-client not installed. Run: pip install websocket-client")
         
@@ -143,150 +248,69 @@ class Qwen3TTSRealtime(TTSModel):
         
         self.model = model
         self.api_url = f"wss://dashscope.aliyuncs.com/api-ws/v1/realtime?model={model}"
-        self.audio_data = b""
-        self.synthesis_complete = False
+        # 预先建立长连接，合成时直接复用，不再为每句话重新握手
+        self.pool = TTSConnectionPool(
+            self.api_url,
+            headers=[f"Authorization: Bearer {self.api_key}"],
+            size=pool_size,
+        )
         logging.info(f"Qwen3 TTS Realtime initialized with model: {model}")
     
-    def synthesize_streaming(self, text: str, voice: str = "Cherry", callback=None) -> dict:
+    def _config_message(self, voice: str) -> dict:
+        # 配置消息 - 根据官方文档格式
+        return {
+            "type": "config",
+            "voice": voice,
+            "format": "wav",
+            "sample_rate": self.output_format.sample_rate,
+            "enable_timestamp": False
+        }
+    
+    def open_stream(self, voice: str = "Cherry", callback=None) -> TTSRequest:
+        """打开一个流式合成会话，之后用 request.feed(text) 逐段发送文本，request.end() 结束"""
+        request = TTSRequest(
+            "",
+            output_format=self.output_format,
+            callback=callback,
+            on_first_audio=lambda ms: print(f"⚡ 语音首token延迟: {ms:.1f}ms"),
+        )
+        return self.pool.submit(request, [self._config_message(voice)])
+    
+    def start_synthesis(self, text: str, voice: str = "Cherry", callback=None) -> TTSRequest:
+        """发起一次合成并立即返回请求对象，request.future 在完成/出错时结束
+        每个请求独占一条池中的连接，同一实例上可以并发多个合成"""
+        request = self.open_stream(voice, callback)
+        # 文本消息 + 结束消息
+        request.feed(text)
+        request.end()
+        return request
+    
+    def synthesize_streaming(self, text: str, voice: str = "Cherry", callback=None, timeout: float = 30) -> dict:
         """使用Qwen3 TTS Realtime进行流式语音合成"""
         try:
-            self.audio_data = b""
-            self.synthesis_complete = False
-            self.first_audio_time = None
-            self.synthesis_start_time = time.perf_counter()
-            
-            # 创建WebSocket连接
-            headers = [f"Authorization: Bearer {self.api_key}"]
-            
-            def on_open(ws):
-                logging.info(f"Connected to TTS server: {self.api_url}")
-                # 发送配置消息 - 根据官方文档格式
-                config_message = {
-                    "type": "config",
-                    "voice": voice,
-                    "format": "wav",
-                    "sample_rate": 16000,
-                    "enable_timestamp": False
-                }
-                ws.send(json.dumps(config_message))
-                
-                # 发送文本消息 - 支持流式输入
-                text_message = {
-                    "type": "text",
-                    "text": text
-                }
-                ws.send(json.dumps(text_message))
-                
-                # 发送结束消息
-                end_message = {
-                    "type": "end"
-                }
-                ws.send(json.dumps(end_message))
-            
-            def on_message(ws, message):
-                try:
-                    data = json.loads(message)
-                    logging.debug(f"Received message: {data}")
-                    
-                    # 根据官方文档处理不同类型的消息
-                    if data.get("type") == "audio":
-                        # 记录首音频时间
-                        if self.first_audio_time is None:
-                            self.first_audio_time = time.perf_counter()
-                            first_audio_latency = (self.first_audio_time - self.synthesis_start_time) * 1000.0
-                            print(f"⚡ 语音首token延迟: {first_audio_latency:.1f}ms")
-                        
-                        # 解码base64音频数据
-                        import base64
-                        audio_chunk = base64.b64decode(data["audio"])
-                        self.audio_data += audio_chunk
-                        
-                        # 流式播放音频
-                        if callback:
-                            callback(audio_chunk)
-                        
-                        logging.debug(f"Received audio chunk: {len(audio_chunk)} bytes")
-                    
-                    elif data.get("type") == "audio.done":
-                        # 音频生成完成
-                        logging.info("Audio generation completed")
-                    
-                    elif data.get("type") == "done":
-                        # 响应完成
-                        self.synthesis_complete = True
-                        logging.info("TTS synthesis completed")
-                        ws.close()
-                    
-                    elif data.get("type") == "error":
-                        # 错误处理
-                        error_msg = data.get("message", "Unknown error")
-                        logging.error(f"TTS error: {error_msg}")
-                        self.synthesis_complete = True
-                        
-                except Exception as e:
-                    logging.error(f"Error processing TTS message: {e}")
-            
-            def on_error(ws, error):
-                logging.error(f"TTS WebSocket error: {error}")
-                self.synthesis_complete = True
-            
-            def on_close(ws, close_status_code, close_msg):
-                logging.info("TTS WebSocket connection closed")
-                self.synthesis_complete = True
-            
-            # 创建WebSocket连接
-            ws = websocket.WebSocketApp(
-                self.api_url,
-                header=headers,
-                on_open=on_open,
-                on_message=on_message,
-                on_error=on_error,
-                on_close=on_close
-            )
-            
-            # 在新线程中运行WebSocket
-            def run_websocket():
-                ws.run_forever()
-            
-            thread = threading.Thread(target=run_websocket)
-            thread.daemon = True
-            thread.start()
-            
-            # 等待合成完成
-            timeout = 30  # 30秒超时
-            start_time = time.time()
-            while not self.synthesis_complete and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
-            
-            if not self.synthesis_complete:
-                logging.warning("TTS synthesis timeout")
-                return {"audio_data": b"", "performance": {}}
-            
-            # 计算性能统计
-            synthesis_end_time = time.perf_counter()
-            first_audio_latency = (self.first_audio_time - self.synthesis_start_time) * 1000.0 if self.first_audio_time else 0
-            total_synthesis_time = (synthesis_end_time - self.synthesis_start_time) * 1000.0
-            chinese_count = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
-            
-            performance = {
-                "first_audio_ms": first_audio_latency,
-                "total_synthesis_ms": total_synthesis_time,
-                "chinese_count": chinese_count
-            }
-            
+            request = self.start_synthesis(text, voice, callback)
+            audio_data = request.wait(timeout)
+            logging.info("TTS synthesis completed")
             return {
-                "audio_data": self.audio_data,
-                "performance": performance
+                "audio_data": audio_data,
+                "performance": request.performance
             }
-                
+        except TimeoutError as e:
+            logging.warning(f"TTS synthesis timeout: {e}")
+            return {"audio_data": b"", "performance": {}}
         except Exception as e:
             logging.error(f"Qwen3 TTS Realtime synthesis failed: {e}")
             return {"audio_data": b"", "performance": {}}
     
-    def synthesize(self, text: str, voice: str = "Cherry") -> bytes:
-        """使用Qwen3 TTS Realtime进行语音合成（兼容性方法）"""
+    def synthesize(self, text: str, voice: str = "Cherry") -> PCMBuffer:
+        """使用Qwen3 TTS Realtime进行语音合成（兼容性方法），返回 output_format 的PCM（零拷贝包装）；
+        需要WAV文件内容时调用 .to_wav()"""
         result = self.synthesize_streaming(text, voice)
-        return result["audio_data"]
+        return decode_audio(result["audio_data"], self.output_format)
+    
+    def close(self):
+        """关闭连接池"""
+        self.pool.close()
 
 
 class VoiceInterface:
@@ -305,17 +329,45 @@ class VoiceInterface:
         self.chunk = 1024
         self.format = pyaudio.paInt16
         self.channels = 1
-        self.rate = 16000
-        self.record_seconds = 5  # 默认录音5秒
+        self.rate = int(os.getenv("MIC_SAMPLE_RATE", "16000"))  # 麦克风采样率，与识别器不同时逐帧转换
+        self.record_seconds = 5  # 固定时长模式的默认录音时长
+        
+        # 流式识别：录音的同时把音频帧送入识别器
+        self.stt_streaming = os.getenv("STT_STREAMING", "true").lower() == "true"
+        
+        # VAD录音：说完后自动结束，不必等满固定时长
+        self.record_mode = os.getenv("RECORD_MODE", "vad").lower()  # vad | fixed
+        self.vad_backend = os.getenv("VAD_BACKEND", "auto")  # auto | energy | webrtc
+        self.vad_frame_ms = 30
+        self.vad_silence_ms = int(os.getenv("VAD_SILENCE_MS", "800"))  # 说话后静音多久结束
+        self.vad_max_seconds = float(os.getenv("VAD_MAX_SECONDS", "15"))  # 最长录音时长
         
         self.audio = pyaudio.PyAudio()
+        
+        # 流式播放器：整个会话复用一个输出流，首次播放时创建
+        self.playback_backend = os.getenv("AUDIO_PLAYBACK", "auto")  # auto | pyaudio | aplay
+        self.player: Optional[AudioPlaybackSink] = None
+        self.playback_format = getattr(self.tts, "output_format", PCM16_MONO_16K)
     
     def setup_logging(self):
         level = os.getenv("LOG_LEVEL", "INFO").upper()
         logging.basicConfig(level=level, format="%(asctime)s | %(levelname)s | %(message)s")
     
     def _create_stt(self) -> STTModel:
-        """创建STT模型 - 默认使用GummySTT"""
+        """创建STT模型 - 默认使用GummySTT，STT_BACKEND=whisper 时使用本地Whisper"""
+        from config import get_rag_config
+
+        voice_config = get_rag_config().get_voice_config()
+        if (os.getenv("STT_BACKEND") or voice_config["stt_backend"]).lower() == "whisper":
+            # STT_MODEL 是Gummy的模型名，Whisper模型大小单独用 WHISPER_MODEL 配置
+            return WhisperSTT(
+                model_size=os.getenv("WHISPER_MODEL") or voice_config["stt_model"],
+                device=os.getenv("STT_DEVICE", "cpu"),
+                compute_type=os.getenv("STT_COMPUTE_TYPE", "int8"),
+                cpu_threads=int(os.getenv("STT_CPU_THREADS", "0")),
+                num_workers=int(os.getenv("STT_WORKERS", "1")),
+                language=os.getenv("STT_LANGUAGE", "zh") or None,
+            )
         api_key = os.getenv("DASHSCOPE_API_KEY")
         model = os.getenv("STT_MODEL", "gummy-chat-v1")
         return GummySTT(api_key=api_key, model=model)
@@ -326,8 +378,13 @@ class VoiceInterface:
         model = os.getenv("TTS_MODEL", "qwen3-tts-flash-realtime")
         return Qwen3TTSRealtime(api_key=api_key, model=model)
     
-    def record_audio(self, duration: Optional[int] = None) -> bytes:
-        """录制音频"""
+    def record_audio(self, duration: Optional[int] = None, on_frame=None, should_stop=None) -> PCMBuffer:
+        """录制音频，返回PCM缓冲区
+        VAD模式下说完即停止（duration 被忽略，最长 vad_max_seconds 秒）；fixed模式录满 duration 秒
+        on_frame(frame): 每录到一帧立即回调（用于流式识别）；should_stop(): 返回True时提前结束"""
+        if self.record_mode == "vad":
+            return self._record_until_silence(on_frame, should_stop)
+        
         duration = duration or self.record_seconds
         
         print(f"🎤 开始录音 ({duration}秒)...")
@@ -340,26 +397,70 @@ class VoiceInterface:
             frames_per_buffer=self.chunk
         )
         
-        frames = []
+        # 按录音时长预分配，读到的数据直接追加
+        recording = PCMBuffer.for_duration(
+            duration,
+            sample_rate=self.rate,
+            sample_width=self.audio.get_sample_size(self.format),
+            channels=self.channels,
+        )
         for _ in range(0, int(self.rate / self.chunk * duration)):
-            data = stream.read(self.chunk)
-            frames.append(data)
+            frame = stream.read(self.chunk, exception_on_overflow=False)
+            recording.append(frame)
+            if on_frame:
+                on_frame(frame)
+            if should_stop and should_stop():
+                break
         
         stream.stop_stream()
         stream.close()
         
-        # 将音频数据转换为WAV格式
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wf:
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(self.audio.get_sample_size(self.format))
-            wf.setframerate(self.rate)
-            wf.writeframes(b''.join(frames))
-        
         print("✅ 录音完成")
-        return wav_buffer.getvalue()
+        return recording
+    
+    def _record_until_silence(self, on_frame=None, should_stop=None) -> PCMBuffer:
+        """VAD录音：检测到说话结束（尾部静音）后停止"""
+        print(f"🎤 开始录音 (说完自动结束，最长{self.vad_max_seconds:.0f}秒)...")
+        
+        frame_samples = self.rate * self.vad_frame_ms // 1000
+        endpointer = SpeechEndpointer(
+            create_vad(self.vad_backend, self.rate),
+            frame_ms=self.vad_frame_ms,
+            trailing_silence_ms=self.vad_silence_ms,
+            max_duration_s=self.vad_max_seconds,
+        )
+        recording = PCMBuffer.for_duration(
+            min(self.vad_max_seconds, 5),
+            sample_rate=self.rate,
+            sample_width=self.audio.get_sample_size(self.format),
+            channels=self.channels,
+        )
+        
+        stream = self.audio.open(
+            format=self.format,
+            channels=self.channels,
+            rate=self.rate,
+            input=True,
+            frames_per_buffer=frame_samples
+        )
+        try:
+            while True:
+                frame = stream.read(frame_samples, exception_on_overflow=False)
+                recording.append(frame)
+                if on_frame:
+                    on_frame(frame)
+                if endpointer.push(frame) or (should_stop and should_stop()):
+                    break
+        finally:
+            stream.stop_stream()
+            stream.close()
+        
+        if endpointer.stop_reason == "no_speech":
+            print("⚠️ 没有检测到说话")
+        print(f"✅ 录音完成 ({recording.duration:.1f}秒)")
+        return recording
     
-    def transcribe_audio(self, audio_data: bytes) -> str:
+    def transcribe_audio(self, audio_data) -> str:
         """将音频转换为文本"""
         print("🔄 正在识别语音...")
         start_time = time.perf_counter()
@@ -371,7 +472,7 @@ class VoiceInterface:
         
         return text
     
-    def synthesize_speech(self, text: str) -> bytes:
+    def synthesize_speech(self, text: str):
         """将文本转换为语音"""
         print("🔄 正在合成语音...")
         start_time = time.perf_counter()
@@ -383,32 +484,53 @@ class VoiceInterface:
         
         return audio_data
     
+    @property
+    def mic_format(self) -> AudioFormat:
+        return AudioFormat(self.rate, self.audio.get_sample_size(self.format), self.channels)
+    
+    def _get_player(self) -> AudioPlaybackSink:
+        # 播放器按TTS输出格式打开，通常无需转换
+        if self.player is None:
+            from config import get_rag_config
+
+            voice_config = get_rag_config().get_voice_config()
+            self.player = AudioPlaybackSink(
+                sample_rate=self.playback_format.sample_rate,
+                channels=self.playback_format.channels,
+                sample_width=self.playback_format.sample_width,
+                backend=self.playback_backend,
+                max_buffer_seconds=voice_config["playback_buffer_seconds"],
+                write_timeout=voice_config["playback_write_timeout"],
+            )
+        return self.player
+    
     def play_audio_streaming(self, audio_chunk: bytes):
-        """流式播放音频片段"""
+        """流式播放音频片段 - 写入播放缓冲区后立即返回，不阻塞TTS接收线程"""
         try:
-            import tempfile
-            import subprocess
-            
-            # 保存音频片段到临时文件
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_chunk)
-                temp_file_path = temp_file.name
-            
-            # 使用系统播放器播放
-            subprocess.run(["aplay", temp_file_path], check=True, capture_output=True)
-            
-            # 清理临时文件
-            os.unlink(temp_file_path)
-            
+            # TTS回调收到的已是 output_format 的裸PCM，播放器按同一格式打开，直接写入
+            self._get_player().write(audio_chunk)
         except Exception as e:
             logging.debug(f"Streaming audio playback failed: {e}")
     
+    def wait_playback(self, timeout: Optional[float] = None):
+        """等待已缓冲的音频播放完"""
+        if self.player is not None:
+            self.player.drain(timeout)
+    
     def play_audio(self, audio_data: bytes):
-        """播放音频"""
+        """播放音频（PCMBuffer、WAV文件内容或TTS输出格式的裸PCM）"""
         print("🔊 正在播放...")
         
-        # 直接使用系统播放器，避免PyAudio的采样率问题
-        self._fallback_play_audio(audio_data)
+        try:
+            # 采样率不一致时先转换为播放器格式
+            audio = convert(decode_audio(audio_data, self.playback_format), self.playback_format)
+            player = self._get_player()
+            player.write(audio.view())
+            player.drain()
+            print("✅ 播放完成")
+        except Exception as e:
+            logging.warning(f"Audio playback failed, falling back to aplay: {e}")
+            self._fallback_play_audio(audio_data)
     
     def _fallback_play_audio(self, audio_data: bytes):
         """备选音频播放方案"""
@@ -416,9 +538,9 @@ class VoiceInterface:
             import tempfile
             import subprocess
             
-            # 保存音频到临时文件
+            # 保存音频到临时文件（裸PCM先封装为WAV）
             with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_data)
+                temp_file.write(decode_audio(audio_data, self.playback_format).to_wav())
                 temp_file_path = temp_file.name
             
             # 使用系统播放器播放
@@ -434,10 +556,25 @@ class VoiceInterface:
             print(f"❌ 备选播放也失败了: {e}")
             print("💡 建议：请检查音频设备或安装aplay: sudo apt-get install alsa-utils")
     
-    def voice_to_text(self, duration: Optional[int] = None) -> str:
-        """完整的语音转文本流程"""
-        audio_data = self.record_audio(duration)
-        return self.transcribe_audio(audio_data)
+    def voice_to_text(self, duration: Optional[int] = None, on_partial: Optional[PartialCallback] = None) -> str:
+        """完整的语音转文本流程；流式模式下边录边识别，说完时结果基本已经就绪"""
+        if not self.stt_streaming:
+            audio_data = self.record_audio(duration)
+            return self.transcribe_audio(audio_data)
+        
+        stream = self.stt.start_stream(on_partial or self._print_partial)
+        # 麦克风格式与识别器要求不同时逐帧转换，格式相同时不做任何处理
+        to_stt_format = frame_converter(self.mic_format, getattr(self.stt, "input_format", PCM16_MONO_16K))
+        self.record_audio(duration, on_frame=lambda frame: stream.feed(to_stt_format(frame)), should_stop=lambda: stream.done)
+        
+        start_time = time.perf_counter()
+        text = stream.finish()
+        print(f"\n✅ 识别完成 (录音结束后 {time.perf_counter() - start_time:.1f}秒): {text}")
+        return text
+    
+    def _print_partial(self, text: str, is_final: bool):
+        """在同一行刷新显示部分识别结果"""
+        print(f"\r🗣️ {text}", end="", flush=True)
     
     def text_to_voice_streaming(self, text: str) -> dict:
         """完整的流式文本转语音流程"""
@@ -445,9 +582,14 @@ class VoiceInterface:
         
         # 使用流式合成
         result = self.tts.synthesize_streaming(text, voice=self.voice, callback=self.play_audio_streaming)
+        self.wait_playback()
         
         return result
     
+    def start_speech_stream(self) -> SpeechStream:
+        """流水线朗读：把LLM的token流送进返回的 SpeechStream，凑够一句就开始合成播放"""
+        return SpeechStream(self.tts, voice=self.voice, callback=self.play_audio_streaming, drain=self.wait_playback)
+    
     def text_to_voice(self, text: str):
         """完整的文本转语音流程"""
         audio_data = self.synthesize_speech(text)
@@ -482,6 +624,12 @@ class VoiceInterface:
     
     def cleanup(self):
         """清理资源"""
+        if hasattr(self.stt, "close"):
+            self.stt.close()
+        if hasattr(self.tts, "close"):
+            self.tts.close()
+        if self.player is not None:
+            self.player.close()
         self.audio.terminate()
 
 